@@ -1,15 +1,24 @@
 import os
 import json
-import subprocess
+import asyncio
 import logging
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from dataclasses import dataclass, field
 from datetime import datetime
 from uuid import uuid4
-from typing import Any, Dict, Optional
-from enum import Enum
+from typing import Any, Dict, Optional, Set
 
+import aiohttp
+import orjson
 import socketio
 from dotenv import load_dotenv
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
+
+try:
+    import uvloop
+except ImportError:  # uvloop is not available on Windows
+    uvloop = None
 
 # Load environment variables
 load_dotenv()
@@ -31,9 +40,27 @@ AGENT_VERSION = os.getenv('AGENT_VERSION', '0.1.0')
 
 SERVER_URL = f'http://{SERVER_HOST}:{SERVER_PORT}'
 
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 100))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 10))
+
+PYTHON_WORKERS = int(os.getenv('PYTHON_WORKERS', os.cpu_count() or 1))
+
+# Trailing output lines kept in shell job results (full output is streamed)
+SHELL_OUTPUT_TAIL_LINES = int(os.getenv('SHELL_OUTPUT_TAIL_LINES', 1000))
+# Stream buffer size; longer output lines are forwarded in chunks of this size
+SHELL_LINE_LIMIT = 1024 * 1024
+
+# Socket.IO packet format: 'default' (JSON text) or 'msgpack' (binary).
+# msgpack requires the server to use a matching parser
+# (socket.io-msgpack-parser), so it stays opt-in.
+SOCKETIO_SERIALIZER = os.getenv('SOCKETIO_SERIALIZER', 'default')
+
+# Seconds status updates are buffered before being merged into one emit
+STATUS_FLUSH_INTERVAL = float(os.getenv('STATUS_FLUSH_INTERVAL', 0.05))
+
 # ==================== Models ====================
 
-class ActionType(str, Enum):
+class ActionType:
     SHELL = 'shell'
     PYTHON = 'python'
     HTTP = 'http'
@@ -46,7 +73,11 @@ class JobRequest(BaseModel):
     params: Dict[str, Any] = Field(default_factory=dict)
 
 
-class JobStatus(str, Enum):
+# Built once so dispatch reuses the compiled validator
+_JOB_ADAPTER = TypeAdapter(JobRequest)
+
+
+class JobStatus:
     PENDING = 'pending'
     RUNNING = 'running'
     SUCCESS = 'success'
@@ -54,25 +85,72 @@ class JobStatus(str, Enum):
     TIMEOUT = 'timeout'
 
 
+TERMINAL_STATUSES = frozenset({JobStatus.SUCCESS, JobStatus.FAILED, JobStatus.TIMEOUT})
+
+
+@dataclass(slots=True)
+class JobState:
+    status: str
+    progress: int = 0
+    logs: list = field(default_factory=list)
+    started_at: str = field(default_factory=lambda: datetime.now().isoformat())
+
+
 # ==================== Socket.IO Client ====================
 
-sio = socketio.Client(
+class OrjsonCodec:
+    """json-module stand-in so socket.io packets are encoded with orjson"""
+
+    @staticmethod
+    def dumps(obj, *args, **kwargs) -> str:
+        # python-socketio passes stdlib-only kwargs such as separators
+        return orjson.dumps(obj).decode()
+
+    @staticmethod
+    def loads(s, *args, **kwargs):
+        return orjson.loads(s)
+
+
+sio = socketio.AsyncClient(
     reconnection=True,
     reconnection_delay=1,
     reconnection_delay_max=5,
     reconnection_attempts=0,  # infinite
-    logger=True,
+    logger=False,
     engineio_logger=False,
+    serializer=SOCKETIO_SERIALIZER,
+    json=OrjsonCodec,
 )
 
-current_jobs: Dict[str, Dict] = {}
+current_jobs: Dict[str, JobState] = {}
+
+# Strong references to in-flight job tasks (asyncio only keeps weak ones)
+_background_tasks: Set[asyncio.Task] = set()
+
+# Shared keep-alive pool for HTTP jobs, created in main()
+http_session: Optional[aiohttp.ClientSession] = None
+
+# Worker processes for Python jobs, created in main()
+python_executor: Optional[ProcessPoolExecutor] = None
+
+
+class StatusChannel:
+    """Per-job buffer that coalesces status updates into batched emits"""
+
+    def __init__(self, job_id: str):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.flush = asyncio.Event()
+        self.task = asyncio.create_task(drain_job_status(job_id, self))
+
+
+status_channels: Dict[str, StatusChannel] = {}
 
 
 @sio.event
-def connect():
+async def connect():
     logger.info('✅ Connected to EyeFlow Server')
     # Register agent
-    sio.emit('agent:register', {
+    await sio.emit('agent:register', {
         'agentId': AGENT_ID,
         'agentName': AGENT_NAME,
         'version': AGENT_VERSION,
@@ -80,68 +158,62 @@ def connect():
 
 
 @sio.event
-def agent_registered_ack(data):
+async def agent_registered_ack(data):
     if data.get('success'):
         logger.info(f'✅ Agent {AGENT_ID} registered successfully')
 
 
 @sio.event
-def job_dispatch(data):
+async def job_dispatch(data):
     """Receive job dispatch from server"""
     try:
-        job_req = JobRequest(**data)
+        job_req = _JOB_ADAPTER.validate_python(data)
         logger.info(f'📋 Job received: {job_req.jobId}')
         
-        # Execute in background
-        execute_job(job_req)
+        # Execute in background so dispatch acks and heartbeats are not blocked
+        task = asyncio.create_task(execute_job(job_req))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
     except Exception as e:
         logger.error(f'❌ Error processing job: {e}')
 
 
-def execute_job(job_req: JobRequest):
+async def execute_job(job_req: JobRequest):
     """Execute a job and report status"""
     job_id = job_req.jobId
     action = job_req.action
     params = job_req.params
 
     # Track job
-    current_jobs[job_id] = {
-        'status': JobStatus.RUNNING,
-        'progress': 0,
-        'logs': [],
-        'startedAt': datetime.now().isoformat(),
-    }
+    current_jobs[job_id] = JobState(status=JobStatus.RUNNING)
 
     # Notify job started
-    update_job_status(job_id, JobStatus.RUNNING, 0, ['Job started'])
+    await update_job_status(job_id, JobStatus.RUNNING, 0, ['Job started'])
 
     try:
-        action_type = ActionType(action.get('type', 'shell'))
+        action_type = action.get('type', ActionType.SHELL)
         config = action.get('config', {})
 
-        if action_type == ActionType.SHELL:
-            result = execute_shell(config, params, job_id)
-        elif action_type == ActionType.PYTHON:
-            result = execute_python(config, params, job_id)
-        elif action_type == ActionType.HTTP:
-            result = execute_http(config, params, job_id)
-        else:
+        handler = _ACTION_DISPATCH.get(action_type)
+        if handler is None:
             raise ValueError(f'Unknown action type: {action_type}')
 
+        result = await handler(config, params, job_id)
+
         # Job success
-        update_job_status(job_id, JobStatus.SUCCESS, 100, 
+        await update_job_status(job_id, JobStatus.SUCCESS, 100, 
                          [f'Job completed successfully'], result)
         logger.info(f'✅ Job {job_id} completed')
 
     except Exception as e:
         # Job failed
         error_msg = str(e)
-        update_job_status(job_id, JobStatus.FAILED, 0, 
+        await update_job_status(job_id, JobStatus.FAILED, 0, 
                          [f'Error: {error_msg}'])
         logger.error(f'❌ Job {job_id} failed: {error_msg}')
 
 
-def execute_shell(config: Dict, params: Dict, job_id: str) -> Dict:
+async def execute_shell(config: Dict, params: Dict, job_id: str) -> Dict:
     """Execute shell command"""
     command = config.get('command', '')
     timeout = config.get('timeout', 300)
@@ -151,36 +223,87 @@ def execute_shell(config: Dict, params: Dict, job_id: str) -> Dict:
 
     logger.info(f'🔧 Executing shell: {command}')
     
+    proc = await asyncio.create_subprocess_shell(
+        command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        limit=SHELL_LINE_LIMIT,
+    )
+
+    stdout_tail: deque = deque(maxlen=SHELL_OUTPUT_TAIL_LINES)
+    stderr_tail: deque = deque(maxlen=SHELL_OUTPUT_TAIL_LINES)
+
+    async def read_stream(stream: asyncio.StreamReader, tail: deque):
+        # Forward lines as they arrive; the status channel batches the emits
+        chunked = False
+        while True:
+            try:
+                raw = await stream.readuntil(b'\n')
+            except asyncio.IncompleteReadError as e:
+                raw = e.partial  # Last line without a newline, or b'' at EOF
+            except asyncio.LimitOverrunError as e:
+                # Line longer than the buffer: forward it in buffer-sized chunks
+                raw = await stream.read(e.consumed)
+                chunked = True
+            else:
+                if chunked and raw == b'\n':
+                    chunked = False
+                    continue  # End of a chunked line, not an empty line
+                chunked = False
+            if not raw:
+                break
+            line = raw.decode(errors='replace').rstrip('\r\n')
+            tail.append(line)
+            await update_job_status(job_id, JobStatus.RUNNING, 50, [line])
+
     try:
-        result = subprocess.run(
-            command,
-            shell=True,
-            capture_output=True,
-            text=True,
+        await asyncio.wait_for(
+            asyncio.gather(
+                read_stream(proc.stdout, stdout_tail),
+                read_stream(proc.stderr, stderr_tail),
+                proc.wait(),
+            ),
             timeout=timeout,
         )
+    except asyncio.TimeoutError:
+        raise Exception(f'Command timeout after {timeout}s')
+    finally:
+        # Timeout, read error or cancelled job: never leave the child orphaned
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+
+    if proc.returncode != 0:
+        raise Exception(f'Command failed with code {proc.returncode}')
+
+    return {
+        'exitCode': proc.returncode,
+        'stdout': '\n'.join(stdout_tail),
+        'stderr': '\n'.join(stderr_tail),
+    }
 
-        # Send logs
-        logs = result.stdout.split('\n') if result.stdout else []
-        if result.stderr:
-            logs.extend(result.stderr.split('\n'))
-        
-        update_job_status(job_id, JobStatus.RUNNING, 50, logs)
 
-        if result.returncode != 0:
-            raise Exception(f'Command failed with code {result.returncode}')
+def _run_user_code(code: str, params: Dict) -> Any:
+    """Run user code in a worker process and return its `result` variable"""
+    namespace = {'params': params}
+    exec(code, namespace)
+    return namespace.get('result', None)
 
-        return {
-            'exitCode': result.returncode,
-            'stdout': result.stdout,
-            'stderr': result.stderr,
-        }
 
-    except subprocess.TimeoutExpired:
-        raise Exception(f'Command timeout after {timeout}s')
+def _reset_python_executor():
+    """Kill the Python worker processes and start a fresh pool"""
+    global python_executor
+
+    # ProcessPoolExecutor cannot cancel a running call, so the only way to
+    # stop runaway code is to kill its workers. Other Python jobs running
+    # in the same pool fail with BrokenProcessPool.
+    for process in list(getattr(python_executor, '_processes', {}).values()):
+        process.kill()
+    python_executor.shutdown(wait=False, cancel_futures=True)
+    python_executor = ProcessPoolExecutor(max_workers=PYTHON_WORKERS)
 
 
-def execute_python(config: Dict, params: Dict, job_id: str) -> Dict:
+async def execute_python(config: Dict, params: Dict, job_id: str) -> Dict:
     """Execute Python script/code"""
     code = config.get('code', '')
     timeout = config.get('timeout', 300)
@@ -190,28 +313,27 @@ def execute_python(config: Dict, params: Dict, job_id: str) -> Dict:
 
     logger.info(f'🐍 Executing Python code')
 
-    try:
-        # Create safe execution context
-        safe_dict = {
-            '__builtins__': __builtins__,
-            'params': params,
-        }
+    # Run in a worker process so CPU-bound code cannot stall the event loop
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(python_executor, _run_user_code, code, params)
 
-        exec(code, safe_dict)
+    try:
+        result = await asyncio.wait_for(future, timeout=timeout)
         
         return {
             'success': True,
-            'result': safe_dict.get('result', None),
+            'result': result,
         }
 
+    except asyncio.TimeoutError:
+        _reset_python_executor()
+        raise Exception(f'Python execution timeout after {timeout}s')
     except Exception as e:
         raise Exception(f'Python execution failed: {str(e)}')
 
 
-def execute_http(config: Dict, params: Dict, job_id: str) -> Dict:
+async def execute_http(config: Dict, params: Dict, job_id: str) -> Dict:
     """Execute HTTP request"""
-    import requests
-
     url = config.get('url', '')
     method = config.get('method', 'GET')
     headers = config.get('headers', {})
@@ -221,46 +343,101 @@ def execute_http(config: Dict, params: Dict, job_id: str) -> Dict:
     if not url:
         raise ValueError('url is required for HTTP execution')
 
+    method = method.upper()
+    if method not in ('GET', 'POST'):
+        raise ValueError(f'Unsupported HTTP method: {method}')
+
     logger.info(f'🌐 HTTP {method} {url}')
 
+    # Connect timeout is bounded separately so time spent waiting for a
+    # pooled connection does not count against the request itself
+    request_timeout = aiohttp.ClientTimeout(
+        total=timeout, sock_connect=HTTP_CONNECT_TIMEOUT
+    )
+
     try:
-        if method.upper() == 'GET':
-            response = requests.get(url, headers=headers, timeout=timeout)
-        elif method.upper() == 'POST':
-            response = requests.post(url, json=body, headers=headers, timeout=timeout)
-        else:
-            raise ValueError(f'Unsupported HTTP method: {method}')
+        async with http_session.request(
+            method,
+            url,
+            headers=headers,
+            json=body if method == 'POST' else None,
+            timeout=request_timeout,
+        ) as response:
+            return {
+                'statusCode': response.status,
+                'headers': dict(response.headers),
+                'body': await response.text(),
+            }
+
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise Exception(f'HTTP request failed: {str(e)}')
 
-        return {
-            'statusCode': response.status_code,
-            'headers': dict(response.headers),
-            'body': response.text,
-        }
 
-    except requests.RequestException as e:
-        raise Exception(f'HTTP request failed: {str(e)}')
+_ACTION_DISPATCH = {
+    ActionType.SHELL: execute_shell,
+    ActionType.PYTHON: execute_python,
+    ActionType.HTTP: execute_http,
+}
+
+
+async def update_job_status(job_id: str, status: str, progress: int, 
+                           logs: list, result: Optional[Dict] = None):
+    """Queue a job status update; terminal statuses are flushed immediately"""
+    channel = status_channels.get(job_id)
+    if channel is None:
+        channel = status_channels[job_id] = StatusChannel(job_id)
+
+    channel.queue.put_nowait((status, progress, logs, result))
+
+    if status in TERMINAL_STATUSES:
+        channel.flush.set()
+        await channel.task
+        status_channels.pop(job_id, None)
 
 
-def update_job_status(job_id: str, status: JobStatus, progress: int, 
-                     logs: list, result: Optional[Dict] = None):
+async def drain_job_status(job_id: str, channel: StatusChannel):
+    """Merge queued status updates for a job and emit them in batches"""
+    while True:
+        batch = [await channel.queue.get()]
+
+        # Give chatty jobs a short window to accumulate more updates
+        if batch[0][0] not in TERMINAL_STATUSES:
+            try:
+                await asyncio.wait_for(channel.flush.wait(), STATUS_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+        while not channel.queue.empty():
+            batch.append(channel.queue.get_nowait())
+
+        status, progress, _, result = batch[-1]
+        logs = [line for _, _, chunk, _ in batch for line in chunk]
+        await emit_job_status(job_id, status, progress, logs, result)
+
+        if status in TERMINAL_STATUSES:
+            return
+
+
+async def emit_job_status(job_id: str, status: str, progress: int, 
+                          logs: list, result: Optional[Dict] = None):
     """Send job status update to server"""
     try:
-        sio.emit('job:status_update', {
+        await sio.emit('job:status_update', {
             'jobId': job_id,
-            'status': status.value,
+            'status': status,
             'progress': progress,
             'logs': logs,
             'result': result,
         })
-        logger.debug(f'📤 Status update sent: {job_id} => {status.value}')
+        logger.debug(f'📤 Status update sent: {job_id} => {status}')
     except Exception as e:
         logger.error(f'Failed to send status update: {e}')
 
 
-def send_heartbeat():
+async def send_heartbeat():
     """Send heartbeat to server"""
     try:
-        sio.emit('agent:heartbeat', {
+        await sio.emit('agent:heartbeat', {
             'agentId': AGENT_ID,
             'timestamp': datetime.now().isoformat(),
             'activeJobs': len(current_jobs),
@@ -270,18 +447,24 @@ def send_heartbeat():
 
 
 @sio.event
-def disconnect():
+async def disconnect():
     logger.warning('⚠️ Disconnected from server, attempting reconnection...')
 
 
-@sio.on('*')
-def catch_all(event, data):
+async def catch_all(event, data):
     logger.debug(f'Received event: {event} => {data}')
 
 
+# Only sink every event when debug logging would actually show it
+if logger.isEnabledFor(logging.DEBUG):
+    sio.on('*', catch_all)
+
+
 # ==================== Main ====================
 
-def main():
+async def main():
+    global http_session, python_executor
+
     logger.info(f'''
 ╔════════════════════════════════════════════════════╗
 ║       🤖 EyeFlow Agent Started                    ║
@@ -293,26 +476,40 @@ def main():
 ╚════════════════════════════════════════════════════╝
     ''')
 
+    http_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=HTTP_POOL_SIZE),
+        timeout=aiohttp.ClientTimeout(total=30, sock_connect=HTTP_CONNECT_TIMEOUT),
+    )
+    python_executor = ProcessPoolExecutor(max_workers=PYTHON_WORKERS)
+
     # Connect to server
     try:
-        sio.connect(SERVER_URL, 
-                   auth={'agentId': AGENT_ID},
-                   transports=['websocket', 'polling'])
+        await sio.connect(SERVER_URL, 
+                          auth={'agentId': AGENT_ID},
+                          transports=['websocket'])
         logger.info('🔗 Connecting to server...')
     except Exception as e:
         logger.error(f'❌ Failed to connect: {e}')
+        await http_session.close()
+        python_executor.shutdown(wait=False, cancel_futures=True)
         return
 
     # Keep alive
     try:
         while True:
-            import time
-            time.sleep(5)
-            send_heartbeat()
-    except KeyboardInterrupt:
-        logger.info('Shutting down gracefully...')
-        sio.disconnect()
+            await asyncio.sleep(5)
+            await send_heartbeat()
+    finally:
+        await sio.disconnect()
+        await http_session.close()
+        python_executor.shutdown(wait=False, cancel_futures=True)
 
 
 if __name__ == '__main__':
-    main()
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info('Shutting down gracefully...')
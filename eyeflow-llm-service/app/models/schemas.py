@@ -1,4 +1,4 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Literal, Optional
 from pydantic import BaseModel, Field
 
 
@@ -14,6 +14,12 @@ class GenerateRulesRequest(BaseModel):
     provider_override: Optional[str] = Field(
         None, description="Optional LLM provider override (anthropic, openai, etc)"
     )
+    verbose: bool = Field(
+        False,
+        description="Send the full catalog (example payloads, every example "
+        "and resilience pattern) instead of a compact view of it trimmed to "
+        "the intent",
+    )
 
 
 class GenerateRulesBatchRequest(BaseModel):
@@ -23,6 +29,11 @@ class GenerateRulesBatchRequest(BaseModel):
     intents: List[str] = Field(
         ..., description="List of user intents to generate rules for"
     )
+    priority: Literal["realtime", "offline"] = Field(
+        "realtime",
+        description="offline routes through the provider's asynchronous batch API "
+        "(cheaper, may take minutes to hours)",
+    )
 
 
 class GenerateRulesResponse(BaseModel):
@@ -81,6 +92,7 @@ class HealthResponse(BaseModel):
     provider: str
     model: str
     context_cache_age_minutes: Optional[int]
+    inflight_requests: int = 0
 
 
 class ProvidersListResponse(BaseModel):
@@ -1,13 +1,24 @@
+import asyncio
 import json
 import logging
-from typing import Dict, Any, Tuple, List
-from tenacity import retry, stop_after_attempt, wait_exponential
+from typing import Callable, Dict, Any, Tuple, List, Optional
 import anthropic
+import httpx
+import orjson
 
-from .base import ILLMProvider
+from config.settings import get_settings
+from app.services.condition_evaluator import try_evaluate_condition
+from .base import BatchSlot, ILLMProvider, compact_json
+from .http_pool import get_llm_http_client
 
 logger = logging.getLogger(__name__)
 
+_JSON_DECODER = json.JSONDecoder()
+
+# Message Batches polling interval bounds (seconds)
+BATCH_POLL_INITIAL_INTERVAL = 5.0
+BATCH_POLL_MAX_INTERVAL = 60.0
+
 
 class AnthropicProvider(ILLMProvider):
     """
@@ -19,8 +30,26 @@ class AnthropicProvider(ILLMProvider):
     - Following detailed instructions precisely
     """
 
-    def __init__(self, api_key: str, model: str = "claude-3-opus-20240229"):
-        self.client = anthropic.AsyncAnthropic(api_key=api_key)
+    api_base_url = "https://api.anthropic.com"
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "claude-3-opus-20240229",
+        max_concurrency: Optional[int] = None,
+    ):
+        max_concurrency = max_concurrency or get_settings().LLM_MAX_CONCURRENCY
+        # The SDK retries 408/409/429/5xx and connection errors itself,
+        # with jittered exponential backoff and retry-after support
+        self.client = anthropic.AsyncAnthropic(
+            api_key=api_key,
+            max_retries=get_settings().LLM_MAX_RETRIES,
+            timeout=httpx.Timeout(60.0, connect=5.0),
+            http_client=get_llm_http_client(),
+        )
+        # Caps in-flight API calls so bursts queue locally instead of
+        # tripping Anthropic rate limits and the retry backoff
+        self._semaphore = asyncio.Semaphore(max_concurrency)
         self._model = model
         self._name = "anthropic"
         logger.info(f"✅ Anthropic Provider initialized with model: {model}")
@@ -33,97 +62,174 @@ class AnthropicProvider(ILLMProvider):
     def model_name(self) -> str:
         return self._model
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=2))
     async def generate_rules(
         self,
         aggregated_context: Dict[str, Any],
         user_intent: str,
+        on_text: Optional[Callable[[str], None]] = None,
     ) -> Tuple[Dict[str, Any], int]:
         """
         Generate workflow rules using Claude.
         Uses extended thinking for complex logic generation.
-        """
-        system_prompt = self._build_system_prompt(aggregated_context)
-
-        prompt = f"""Based on the context and available capabilities provided above, generate workflow rules for this user intent:
-
-User Intent: {user_intent}
 
-Generate production-ready workflow rules as valid JSON only. No explanations, no markdown - just the JSON object."""
+        The response is streamed; on_text, if given, receives each text
+        delta as it arrives so callers can report progress.
+        """
+        system = self._build_system_blocks(aggregated_context)
 
         logger.info(f"🔄 Generating rules for intent: {user_intent[:100]}...")
 
-        response = await self.client.messages.create(
-            model=self._model,
-            max_tokens=4096,  # Claude supports large outputs
-            system=system_prompt,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3,  # Low temperature for consistency
+        rules_dict, tokens_used = await self._generate_for_intent(
+            system, user_intent, on_text
         )
-
-        rules_text = response.content[0].text
-
-        # Parse JSON
-        try:
-            # Try to extract JSON from response (in case of markdown wrapping)
-            rules_dict = self._extract_json(rules_text)
-            tokens_used = (
-                response.usage.input_tokens + response.usage.output_tokens
-            )
-            logger.info(f"✅ Rules generated successfully ({tokens_used} tokens)")
-            return rules_dict, tokens_used
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ Failed to parse rules: {str(e)}")
-            raise ValueError(f"Invalid JSON response from Claude: {str(e)}")
+        logger.info(f"✅ Rules generated successfully ({tokens_used} tokens)")
+        return rules_dict, tokens_used
 
     async def generate_rules_batch(
         self,
         aggregated_context: Dict[str, Any],
         intents: List[str],
-    ) -> Tuple[List[Dict[str, Any]], int]:
+    ) -> Tuple[List[BatchSlot], int]:
         """
         Generate multiple rules efficiently.
-        Uses a single prompt with multiple intents for better context reuse.
+        Fans out one request per intent so wall-clock time tracks the slowest
+        intent rather than the sum, while sharing a single system prompt.
+        A failed intent is logged and its slot holds the exception.
         """
-        system_prompt = self._build_system_prompt(aggregated_context)
+        system = self._build_system_blocks(aggregated_context)
+
+        logger.info(f"🔄 Batch generating {len(intents)} rule sets...")
 
-        intents_text = "\n".join(
-            [f"{i + 1}. {intent}" for i, intent in enumerate(intents)]
+        # Concurrency is bounded by the provider-wide semaphore in _create_message
+        results = await asyncio.gather(
+            *(self._generate_for_intent(system, intent) for intent in intents),
+            return_exceptions=True,
         )
 
-        prompt = f"""Generate workflow rules for these {len(intents)} user intents:
+        rules_list: List[BatchSlot] = []
+        tokens_used = 0
+        failures = 0
+        for intent, result in zip(intents, results):
+            if isinstance(result, BaseException):
+                if not isinstance(result, Exception):
+                    raise result
+                failures += 1
+                logger.error(
+                    f"❌ Failed to generate rules for intent '{intent[:60]}': {result}"
+                )
+                rules_list.append(result)
+                continue
+            rules_dict, tokens = result
+            rules_list.append(rules_dict)
+            tokens_used += tokens
+
+        logger.info(
+            f"✅ Batch generated {len(intents) - failures}/{len(intents)} rule sets "
+            f"({tokens_used} tokens)"
+        )
+        return rules_list, tokens_used
 
-{intents_text}
+    async def generate_rules_batch_offline(
+        self,
+        aggregated_context: Dict[str, Any],
+        intents: List[str],
+    ) -> Tuple[List[BatchSlot], int]:
+        """
+        Generate rules for many intents through the Message Batches API.
 
-Generate the rules as a JSON array where each element is a complete workflow object.
-Return ONLY valid JSON array: [{{workflow1}}, {{workflow2}}, ...]"""
+        Batches are billed at a discount and do not count against realtime
+        rate limits, but may take minutes to hours to complete. A failed
+        intent is logged and its slot holds the exception.
+        """
+        system = self._build_system_blocks(aggregated_context)
+
+        batch = await self.client.messages.batches.create(
+            requests=[
+                {
+                    "custom_id": str(i),
+                    "params": {
+                        "model": self._model,
+                        "max_tokens": 4096,
+                        "system": system,
+                        "messages": [
+                            {"role": "user", "content": self._build_intent_prompt(intent)}
+                        ],
+                        "temperature": 0.3,
+                    },
+                }
+                for i, intent in enumerate(intents)
+            ]
+        )
+        logger.info(f"📤 Submitted message batch {batch.id} ({len(intents)} intents)")
+
+        interval = BATCH_POLL_INITIAL_INTERVAL
+        while batch.processing_status != "ended":
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, BATCH_POLL_MAX_INTERVAL)
+            batch = await self.client.messages.batches.retrieve(batch.id)
+
+        results: Dict[int, BatchSlot] = {}
+        tokens_used = 0
+        async for entry in await self.client.messages.batches.results(batch.id):
+            if entry.result.type != "succeeded":
+                logger.error(
+                    f"❌ Batch intent {entry.custom_id} failed: {entry.result.type}"
+                )
+                results[int(entry.custom_id)] = ValueError(
+                    f"Batch request {entry.custom_id} {entry.result.type}"
+                )
+                continue
+            message = entry.result.message
+            tokens_used += message.usage.input_tokens + message.usage.output_tokens
+            try:
+                results[int(entry.custom_id)] = self._extract_json(
+                    message.content[0].text
+                )
+            except json.JSONDecodeError as e:
+                logger.error(
+                    f"❌ Failed to parse rules for batch intent {entry.custom_id}: {e}"
+                )
+                results[int(entry.custom_id)] = e
+
+        rules_list = [
+            results[i] if i in results else ValueError(f"Batch request {i} returned no result")
+            for i in range(len(intents))
+        ]
+        failures = sum(isinstance(slot, Exception) for slot in rules_list)
+        logger.info(
+            f"✅ Batch {batch.id} generated {len(intents) - failures}/{len(intents)} rule sets "
+            f"({tokens_used} tokens)"
+        )
+        return rules_list, tokens_used
 
-        logger.info(f"🔄 Batch generating {len(intents)} rule sets...")
+    async def _generate_for_intent(
+        self,
+        system: List[Dict[str, Any]],
+        user_intent: str,
+        on_text: Optional[Callable[[str], None]] = None,
+    ) -> Tuple[Dict[str, Any], int]:
+        """Run a single rule-generation request against prebuilt system blocks"""
+        prompt = self._build_intent_prompt(user_intent)
 
-        response = await self.client.messages.create(
+        rules_text, tokens_used = await self._stream_message(
+            on_text,
             model=self._model,
-            max_tokens=8192,
-            system=system_prompt,
+            max_tokens=4096,  # Claude supports large outputs
+            system=system,
             messages=[{"role": "user", "content": prompt}],
-            temperature=0.3,
+            temperature=0.3,  # Low temperature for consistency
         )
 
-        rules_text = response.content[0].text
-
+        # Parse JSON
         try:
-            rules_list = self._extract_json_array(rules_text)
-            tokens_used = (
-                response.usage.input_tokens + response.usage.output_tokens
-            )
-            logger.info(
-                f"✅ Batch generated {len(rules_list)} rule sets ({tokens_used} tokens)"
-            )
-            return rules_list, tokens_used
+            # Try to extract JSON from response (in case of markdown wrapping)
+            rules_dict = self._extract_json(rules_text)
         except json.JSONDecodeError as e:
-            logger.error(f"❌ Failed to parse batch rules: {str(e)}")
-            raise ValueError(f"Invalid JSON response: {str(e)}")
+            logger.error(f"❌ Failed to parse rules: {str(e)}")
+            raise ValueError(f"Invalid JSON response from Claude: {str(e)}")
+
+        return rules_dict, tokens_used
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=2))
     async def evaluate_condition(
         self,
         condition: str,
@@ -131,9 +237,23 @@ Return ONLY valid JSON array: [{{workflow1}}, {{workflow2}}, ...]"""
     ) -> bool:
         """
         Dynamically evaluate a condition with given context.
-        Uses Claude's reasoning capabilities for complex expressions.
+        Plain comparisons are evaluated locally; Claude's reasoning is only
+        used for expressions the local evaluator cannot handle.
         """
-        context_json = json.dumps(context, indent=2)
+        is_true = try_evaluate_condition(condition, context)
+        if is_true is not None:
+            logger.debug("📊 Condition evaluated locally: '%s' -> %s", condition, is_true)
+            return is_true
+
+        return await self._evaluate_condition_with_llm(condition, context)
+
+    async def _evaluate_condition_with_llm(
+        self,
+        condition: str,
+        context: Dict[str, Any],
+    ) -> bool:
+        """Ask Claude to evaluate a condition the local evaluator rejected"""
+        context_json = compact_json(context)
 
         prompt = f"""You are evaluating a workflow condition with the given context.
 
@@ -145,7 +265,7 @@ Available context:
 
 Evaluate this condition and respond with ONLY the word "true" or "false" (lowercase, no punctuation)."""
 
-        response = await self.client.messages.create(
+        response = await self._create_message(
             model=self._model,
             max_tokens=10,
             messages=[{"role": "user", "content": prompt}],
@@ -155,9 +275,7 @@ Evaluate this condition and respond with ONLY the word "true" or "false" (lowerc
         result = response.content[0].text.strip().lower()
         is_true = result == "true"
 
-        logger.debug(
-            f"📊 Condition evaluation: '{condition}' -> {is_true}"
-        )
+        logger.debug("📊 Condition evaluation: '%s' -> %s", condition, is_true)
         return is_true
 
     async def refine_rules(
@@ -165,14 +283,16 @@ Evaluate this condition and respond with ONLY the word "true" or "false" (lowerc
         current_rules: Dict[str, Any],
         feedback: str,
         aggregated_context: Dict[str, Any],
+        on_text: Optional[Callable[[str], None]] = None,
     ) -> Tuple[Dict[str, Any], int]:
         """
         Refine previously generated rules based on user feedback.
         Uses conversation history for context awareness.
+        Streams like generate_rules, reporting deltas to on_text.
         """
-        system_prompt = self._build_system_prompt(aggregated_context)
+        system = self._build_system_blocks(aggregated_context)
 
-        current_rules_json = json.dumps(current_rules, indent=2)
+        current_rules_json = compact_json(current_rules)
 
         prompt = f"""You are refining workflow rules based on user feedback.
 
@@ -186,64 +306,100 @@ Generate improved rules addressing the feedback. Return ONLY valid JSON."""
 
         logger.info(f"🔄 Refining rules based on feedback: {feedback[:100]}...")
 
-        response = await self.client.messages.create(
+        refined_text, tokens_used = await self._stream_message(
+            on_text,
             model=self._model,
             max_tokens=4096,
-            system=system_prompt,
+            system=system,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.3,
         )
 
-        refined_text = response.content[0].text
-
         try:
             refined_rules = self._extract_json(refined_text)
-            tokens_used = (
-                response.usage.input_tokens + response.usage.output_tokens
-            )
             logger.info(f"✅ Rules refined successfully ({tokens_used} tokens)")
             return refined_rules, tokens_used
         except json.JSONDecodeError as e:
             logger.error(f"❌ Failed to parse refined rules: {str(e)}")
             raise ValueError(f"Invalid JSON response: {str(e)}")
 
-    def _extract_json(self, text: str) -> Dict[str, Any]:
-        """Extract JSON object from text, handling markdown wrapping"""
-        text = text.strip()
+    async def _create_message(self, **kwargs: Any) -> Any:
+        """Issue a messages.create call under the provider concurrency limit"""
+        async with self._semaphore:
+            try:
+                return await self.client.messages.create(**kwargs)
+            except anthropic.APIStatusError as e:
+                logger.error(f"❌ Anthropic API error {e.status_code}: {e.message}")
+                raise
 
-        # Remove markdown code blocks if present
-        if text.startswith("```"):
-            # Find the end of the markdown block
-            end_idx = text.rfind("```")
-            if end_idx > 0:
-                text = text[text.find("\n") + 1 : end_idx]
+    def _build_intent_prompt(self, user_intent: str) -> str:
+        """Build the user turn asking for rules for one intent"""
+        return f"""Based on the context and available capabilities provided above, generate workflow rules for this user intent:
 
-        # Try to find JSON object
-        start_idx = text.find("{")
-        end_idx = text.rfind("}") + 1
+User Intent: {user_intent}
 
-        if start_idx >= 0 and end_idx > start_idx:
-            json_str = text[start_idx:end_idx]
-            return json.loads(json_str)
+Generate production-ready workflow rules as valid JSON only. No explanations, no markdown - just the JSON object."""
 
-        raise json.JSONDecodeError("No JSON object found", text, 0)
+    async def _stream_message(
+        self,
+        on_text: Optional[Callable[[str], None]] = None,
+        **kwargs: Any,
+    ) -> Tuple[str, int]:
+        """
+        Stream a message under the provider concurrency limit
 
-    def _extract_json_array(self, text: str) -> List[Dict[str, Any]]:
-        """Extract JSON array from text"""
+        Returns the full response text and the total tokens used.
+        """
+        text_parts: List[str] = []
+        async with self._semaphore:
+            try:
+                async with self.client.messages.stream(**kwargs) as stream:
+                    async for text in stream.text_stream:
+                        text_parts.append(text)
+                        if on_text is not None:
+                            on_text(text)
+                    final = await stream.get_final_message()
+            except anthropic.APIStatusError as e:
+                logger.error(f"❌ Anthropic API error {e.status_code}: {e.message}")
+                raise
+
+        tokens_used = final.usage.input_tokens + final.usage.output_tokens
+        return "".join(text_parts), tokens_used
+
+    def _extract_json(self, text: str, expected: type = dict) -> Any:
+        """
+        Extract the JSON value of the expected type from text
+
+        Strips a markdown fence, then decodes in place from the first
+        opening bracket; raw_decode stops at the end of that value, so
+        trailing prose is skipped. Only the top-level value is tried: on
+        truncated output (e.g. max_tokens hit) a nested object must not be
+        mistaken for the whole response, so decoding errors are raised for
+        the caller to retry.
+        """
+        opener = "{" if expected is dict else "["
         text = text.strip()
 
-        # Remove markdown code blocks if present
         if text.startswith("```"):
             end_idx = text.rfind("```")
             if end_idx > 0:
-                text = text[text.find("\n") + 1 : end_idx]
-
-        # Try to find JSON array
-        start_idx = text.find("[")
-        end_idx = text.rfind("]") + 1
-
-        if start_idx >= 0 and end_idx > start_idx:
-            json_str = text[start_idx:end_idx]
-            return json.loads(json_str)
+                text = text[text.find("\n") + 1 : end_idx].strip()
+
+        # Fast path: the response is nothing but the JSON value
+        if text[:1] == opener:
+            try:
+                value = orjson.loads(text)
+                if isinstance(value, expected):
+                    return value
+            except orjson.JSONDecodeError:
+                pass  # Trailing prose after the value; raw_decode skips it
+
+        idx = text.find(opener)
+        if idx < 0:
+            raise json.JSONDecodeError(f"No JSON {expected.__name__} found", text, 0)
+
+        value, _ = _JSON_DECODER.raw_decode(text, idx)
+        if not isinstance(value, expected):
+            raise json.JSONDecodeError(f"No JSON {expected.__name__} found", text, idx)
+        return value
 
-        raise json.JSONDecodeError("No JSON array found", text, 0)
@@ -8,56 +8,144 @@ This provider uses LangChain for:
 - Integrated error handling and retries
 """
 
-import json
+import asyncio
 import logging
-from typing import Dict, Any, List, Optional, Tuple
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
 
+import anthropic
+from cachetools import TTLCache
 from langchain_anthropic import ChatAnthropic
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
-from pydantic import BaseModel, Field
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
-from .base import ILLMProvider
+from config.settings import get_settings
+from app.services.constrained_generation import WORKFLOW_RULES_SCHEMA, schema_errors
+from app.services.semantic_cache import context_namespace
+from app.services.single_flight import SingleFlight, request_key
+from .base import BatchSlot, ILLMProvider, compact_json
+from .http_pool import get_llm_http_client
 
 logger = logging.getLogger(__name__)
 
 # ============================================================================
-# Output Schema Definitions for JSON Parsing
+# Token Usage
 # ============================================================================
 
 
-class WorkflowCondition(BaseModel):
-    """Structured workflow condition"""
-    type: str = Field(description="Condition type (e.g., task_overdue, user_assigned)")
-    operator: str = Field(description="Operator (==, !=, >, <, in, contains)")
-    value: str = Field(description="Condition value")
-    metadata: Optional[Dict[str, Any]] = Field(default=None, description="Optional metadata")
+def extract_token_usage(message: Any) -> Dict[str, int]:
+    """
+    Read token usage from a LangChain chat model response.
+
+    Input/output counts come from usage_metadata; Anthropic prompt-cache
+    counts are only reported in the raw usage block of response_metadata.
+    """
+    usage = getattr(message, "usage_metadata", None) or {}
+    raw_usage = (getattr(message, "response_metadata", None) or {}).get("usage") or {}
+    return {
+        "input_tokens": usage.get("input_tokens", raw_usage.get("input_tokens", 0)) or 0,
+        "output_tokens": usage.get("output_tokens", raw_usage.get("output_tokens", 0)) or 0,
+        "cache_creation_input_tokens": raw_usage.get("cache_creation_input_tokens") or 0,
+        "cache_read_input_tokens": raw_usage.get("cache_read_input_tokens") or 0,
+    }
 
 
-class WorkflowAction(BaseModel):
-    """Structured workflow action"""
-    type: str = Field(description="Action type (e.g., send_notification, update_task)")
-    channel: Optional[str] = Field(default=None, description="Channel (email, slack, webhook)")
-    payload: Dict[str, Any] = Field(description="Action payload")
-    retry: Optional[bool] = Field(default=False, description="Enable retry logic")
+# ============================================================================
+# Tool Definitions for Structured Output
+# ============================================================================
 
+# Repeat evaluations of the same (condition, context) within the TTL are
+# answered from memory instead of a new LLM call
+EVALUATION_CACHE_SIZE = 10_000
+EVALUATION_CACHE_TTL_SECONDS = 60
+
+# Output budgets per operation; decode time scales with tokens generated
+RULES_MAX_TOKENS = 4096
+EVALUATION_MAX_TOKENS = 128
+
+# Forced tool calls make Claude emit arguments matching the input schema
+# instead of free text that has to be parsed and may not validate.
+EMIT_RULES_TOOL = {
+    "name": "emit_rules",
+    "description": "Emit the generated workflow rules.",
+    "input_schema": dict(WORKFLOW_RULES_SCHEMA),
+}
+
+EMIT_EVALUATION_TOOL = {
+    "name": "emit_evaluation",
+    "description": "Emit the result of a workflow condition evaluation.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "result": {"type": "boolean", "description": "Whether the condition holds"},
+            "reason": {"type": "string", "description": "Short explanation"},
+        },
+        "required": ["result", "reason"],
+        "additionalProperties": False,
+    },
+}
 
-class GeneratedRule(BaseModel):
-    """Complete generated workflow rule"""
-    name: str = Field(description="Rule name (short, descriptive)")
-    description: str = Field(description="Rule description (full intent)")
-    trigger: str = Field(description="Trigger event")
-    conditions: List[WorkflowCondition] = Field(description="List of conditions")
-    actions: List[WorkflowAction] = Field(description="List of actions")
-    priority: int = Field(default=100, description="Priority (0-1000)")
-    enabled: bool = Field(default=True, description="Is rule enabled")
 
+# ============================================================================
+# Prompt Templates
+# ============================================================================
 
-class GeneratedRules(BaseModel):
-    """Response containing generated rules"""
-    rules: List[GeneratedRule] = Field(description="List of generated rules")
-    summary: str = Field(description="Summary of what was generated")
-    confidence: float = Field(default=0.9, description="Confidence level (0-1)")
+# The system prompt is passed per call as a SystemMessage of content blocks
+GENERATE_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        MessagesPlaceholder("system"),
+        (
+            "human",
+            "Generate workflow rule(s) from this intent:\n{intent}\n\n"
+            "Return the rules by calling the emit_rules tool.",
+        ),
+    ]
+)
+
+REFINE_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        MessagesPlaceholder("system"),
+        (
+            "human",
+            "Current rules:\n{current_rules_json}\n\n"
+            "User feedback:\n{feedback}\n\n"
+            "Refine the rules based on this feedback. "
+            "Return the updated rules by calling the emit_rules tool.",
+        ),
+    ]
+)
+
+# Repairs only send the failed rules and the validation errors, so a fix
+# costs far less than regenerating against the full catalog prompt
+REPAIR_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "You fix workflow rules that failed JSON Schema validation. "
+            "Correct only the reported errors and keep everything else unchanged.",
+        ),
+        (
+            "human",
+            "Rules:\n{original}\n\n"
+            "Validation errors:\n{errors}\n\n"
+            "Return the corrected rules by calling the emit_rules tool.",
+        ),
+    ]
+)
+
+EVALUATE_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "You are a workflow condition evaluator. "
+            "Given a condition and context, determine if the condition is TRUE or FALSE "
+            "and report it by calling the emit_evaluation tool.",
+        ),
+        (
+            "human",
+            "Condition: {condition}\nContext: {context_json}",
+        ),
+    ]
+)
 
 
 class AnthropicProviderLangChain(ILLMProvider):
@@ -65,28 +153,77 @@ class AnthropicProviderLangChain(ILLMProvider):
     Anthropic Claude 3 Opus provider using LangChain
     
     Features:
-    - Structured JSON output via OutputParser (95%+ reliability)
+    - Structured output via forced tool calls (schema-shaped arguments)
     - Chain composition for rule generation and refinement
     - Async-first design with .ainvoke()
     - Integrated error handling and retries via LangChain
     """
 
-    def __init__(self, api_key: str, model: str = "claude-3-opus-20240229"):
+    api_base_url = "https://api.anthropic.com"
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "claude-3-opus-20240229",
+        max_concurrency: Optional[int] = None,
+    ):
         """Initialize with LangChain ChatAnthropic"""
         self.api_key = api_key
         self._model_name = model
         self._name = "anthropic"
         self._total_tokens = 0
+        self._cache_read_tokens = 0
+        self._cache_creation_tokens = 0
+        # Bounds concurrent requests during batch fan-out
+        self._semaphore = asyncio.Semaphore(
+            max_concurrency or get_settings().LLM_MAX_CONCURRENCY
+        )
+        # Identical concurrent requests share one LLM call
+        self._inflight = SingleFlight()
+        self._evaluation_cache: TTLCache = TTLCache(
+            maxsize=EVALUATION_CACHE_SIZE, ttl=EVALUATION_CACHE_TTL_SECONDS
+        )
 
         # Initialize Claude via LangChain
         self.llm = ChatAnthropic(
             model=model,
             api_key=api_key,
             temperature=0.3,
-            max_tokens=4096,
+            max_tokens=RULES_MAX_TOKENS,
             timeout=60.0,
+            max_retries=get_settings().LLM_MAX_RETRIES,
+        )
+        # ChatAnthropic builds its own client per instance; swap in one on
+        # the shared HTTP/2 pool (private attr, so bypass pydantic setattr).
+        # The SDK retries 429/529/5xx and connection errors with jittered
+        # exponential backoff, sleeping for retry-after when the API sends it,
+        # and fails fast on permanent errors such as 400.
+        object.__setattr__(
+            self.llm,
+            "_async_client",
+            anthropic.AsyncAnthropic(
+                api_key=api_key,
+                max_retries=get_settings().LLM_MAX_RETRIES,
+                timeout=60.0,
+                http_client=get_llm_http_client(),
+            ),
         )
 
+        # Tool-bound models that always answer through the given tool; the
+        # forced tool call ends the turn, so no stop sequences are needed
+        self.rules_llm = self.llm.bind_tools(
+            [EMIT_RULES_TOOL], tool_choice=EMIT_RULES_TOOL["name"]
+        )
+        self.evaluation_llm = self.llm.bind_tools(
+            [EMIT_EVALUATION_TOOL], tool_choice=EMIT_EVALUATION_TOOL["name"]
+        ).bind(max_tokens=EVALUATION_MAX_TOKENS)
+
+        # Chains are wired once; only template variables change per call
+        self._generate_chain = GENERATE_PROMPT | self.rules_llm
+        self._refine_chain = REFINE_PROMPT | self.rules_llm
+        self._repair_chain = REPAIR_PROMPT | self.rules_llm
+        self._evaluate_chain = EVALUATE_PROMPT | self.evaluation_llm
+
         logger.info(f"🔧 AnthropicProviderLangChain initialized: {model}")
 
     @property
@@ -117,84 +254,128 @@ class AnthropicProviderLangChain(ILLMProvider):
         try:
             logger.info(f"🔄 Generating rules from intent: {user_intent[:60]}...")
 
-            # Build system prompt with context
-            system_prompt = self._build_system_prompt(aggregated_context)
-
-            # Create LangChain prompt template
-            prompt = ChatPromptTemplate.from_messages(
-                [
-                    ("system", system_prompt),
-                    (
-                        "human",
-                        "Generate workflow rule(s) from this intent:\n{intent}\n\n"
-                        "Return ONLY valid JSON matching the GeneratedRules schema.",
-                    ),
-                ]
+            # The namespace reuses the stamped catalog digest instead of
+            # serializing the whole context again
+            key = request_key("generate", user_intent, context_namespace(aggregated_context))
+            return await self._inflight.do(
+                key, lambda: self._generate_with_llm(aggregated_context, user_intent)
             )
 
-            # Create JSON output parser
-            parser = JsonOutputParser(pydantic_object=GeneratedRules)
+        except Exception as e:
+            logger.error(f"❌ Error generating rules: {str(e)}")
+            raise
+
+    async def _generate_with_llm(
+        self,
+        aggregated_context: Dict[str, Any],
+        user_intent: str,
+    ) -> Tuple[Dict[str, Any], int]:
+        message = await self._generate_chain.ainvoke(
+            {
+                "system": self._system_messages(aggregated_context),
+                "intent": user_intent,
+            }
+        )
+        result = self._tool_args(message)
 
-            # Create chain: prompt -> LLM -> parser
-            chain = prompt | self.llm | parser
+        tokens_used = self._record_usage(message)
+        result, tokens_used = await self._repair_if_invalid(result, tokens_used)
+        logger.info(f"✅ Generated {len(result.get('rules', []))} rules")
 
-            # Run chain
-            result = await chain.ainvoke({"intent": user_intent})
+        return result, tokens_used
 
-            tokens_used = self._extract_token_usage()
-            logger.info(f"✅ Generated {len(result.get('rules', []))} rules")
+    async def stream_rules(
+        self,
+        aggregated_context: Dict[str, Any],
+        user_intent: str,
+    ) -> AsyncIterator[Tuple[Dict[str, Any], bool]]:
+        """
+        Stream workflow rules as Claude decodes the emit_rules tool call
 
-            return result, tokens_used
+        A partial result is yielded each time a new rule starts, at which
+        point every earlier rule is complete and can be validated while
+        the rest is still decoding.
 
-        except Exception as e:
-            logger.error(f"❌ Error generating rules: {str(e)}")
-            raise
+        Yields:
+            (rules_dict_so_far, done)
+        """
+        logger.info(f"🔄 Streaming rules from intent: {user_intent[:60]}...")
+
+        inputs = {
+            "system": self._system_messages(aggregated_context),
+            "intent": user_intent,
+        }
+
+        gathered = None
+        rules_seen = 0
+        async for chunk in self._generate_chain.astream(inputs):
+            gathered = chunk if gathered is None else gathered + chunk
+
+            # Tool-call args on the merged chunk are parsed as partial JSON
+            if not gathered.tool_calls:
+                continue
+            partial = gathered.tool_calls[0]["args"]
+            rules = partial.get("rules") or []
+            if len(rules) > rules_seen:
+                rules_seen = len(rules)
+                yield partial, False
+
+        result = self._tool_args(gathered)
+        self._record_usage(gathered)
+        logger.info(f"✅ Streamed {len(result.get('rules', []))} rules")
+        yield result, True
 
     async def generate_rules_batch(
         self,
         aggregated_context: Dict[str, Any],
-        user_intents: List[str],
-    ) -> Tuple[List[Dict[str, Any]], int]:
+        intents: List[str],
+    ) -> Tuple[List[BatchSlot], int]:
         """
         Generate multiple rules efficiently
         
+        Runs one generate_rules chain per intent concurrently (bounded by the
+        provider semaphore), so latency tracks the slowest intent and a
+        malformed result only fails its own slot.
+
         Args:
             aggregated_context: Workflow context
-            user_intents: List of natural language descriptions
+            intents: List of natural language descriptions
             
         Returns:
-            (list_of_rules, tokens_used)
+            (list_of_rules, tokens_used); one slot per intent, holding the
+            rules or the exception that intent failed with
         """
-        try:
-            logger.info(f"🔄 Generating batch of {len(user_intents)} rules...")
-
-            system_prompt = self._build_system_prompt(aggregated_context)
-
-            prompt = ChatPromptTemplate.from_messages(
-                [
-                    ("system", system_prompt),
-                    (
-                        "human",
-                        "Generate workflow rules from these intents:\n{intents_text}\n\n"
-                        "Return ONLY valid JSON as array of GeneratedRules objects.",
-                    ),
-                ]
-            )
+        logger.info(f"🔄 Generating batch of {len(intents)} rules...")
 
-            parser = JsonOutputParser(pydantic_object=list)
-            chain = prompt | self.llm | parser
+        async def _generate_one(intent: str) -> Tuple[Dict[str, Any], int]:
+            async with self._semaphore:
+                return await self.generate_rules(aggregated_context, intent)
 
-            intents_text = "\n".join([f"- {intent}" for intent in user_intents])
-            result = await chain.ainvoke({"intents_text": intents_text})
-
-            tokens_used = self._extract_token_usage()
-            logger.info(f"✅ Generated {len(result)} rules in batch")
-
-            return result, tokens_used
+        results = await asyncio.gather(
+            *(_generate_one(intent) for intent in intents),
+            return_exceptions=True,
+        )
 
-        except Exception as e:
-            logger.error(f"❌ Batch generation error: {str(e)}")
-            raise
+        rules_list: List[BatchSlot] = []
+        tokens_used = 0
+        failures = 0
+        for intent, result in zip(intents, results):
+            if isinstance(result, BaseException):
+                if not isinstance(result, Exception):
+                    raise result
+                failures += 1
+                logger.error(
+                    f"❌ Batch generation failed for intent '{intent[:60]}': {result}"
+                )
+                rules_list.append(result)
+                continue
+            rules, tokens = result
+            rules_list.append(rules)
+            tokens_used += tokens
+
+        logger.info(f"✅ Generated {len(intents) - failures}/{len(intents)} rule sets in batch")
+
+        return rules_list, tokens_used
 
     async def evaluate_condition(
         self,
@@ -214,34 +395,32 @@ class AnthropicProviderLangChain(ILLMProvider):
         try:
             logger.info(f"🔍 Evaluating condition: {condition}")
 
-            prompt = ChatPromptTemplate.from_messages(
-                [
-                    (
-                        "system",
-                        "You are a workflow condition evaluator. "
-                        "Given a condition and context, determine if the condition is TRUE or FALSE.\n"
-                        "Respond with ONLY valid JSON: {\"result\": true/false, \"reason\": \"explanation\"}",
-                    ),
-                    (
-                        "human",
-                        f"Condition: {condition}\nContext: {json.dumps(context)}\n\n"
-                        'Return JSON with "result" (boolean) and "reason" (string).',
-                    ),
-                ]
-            )
-
-            parser = JsonOutputParser(pydantic_object=dict)
-            chain = prompt | self.llm | parser
+            key = request_key("evaluate", condition, context)
+            cached = self._evaluation_cache.get(key)
+            if cached is not None:
+                logger.info(f"📦 Condition result from cache: {cached}")
+                return cached
 
-            result = await chain.ainvoke({})
-
-            logger.info(f"✅ Condition evaluated: {result['result']}")
-            return result.get("result", False)
+            result = await self._inflight.do(
+                key, lambda: self._evaluate_with_llm(condition, context)
+            )
+            self._evaluation_cache[key] = result
+            return result
 
         except Exception as e:
             logger.error(f"❌ Condition evaluation error: {str(e)}")
             raise
 
+    async def _evaluate_with_llm(self, condition: str, context: Dict[str, Any]) -> bool:
+        message = await self._evaluate_chain.ainvoke(
+            {"condition": condition, "context_json": compact_json(context)}
+        )
+        result = self._tool_args(message)
+        self._record_usage(message)
+
+        logger.info(f"✅ Condition evaluated: {result['result']}")
+        return result.get("result", False)
+
     async def refine_rules(
         self,
         current_rules: Dict[str, Any],
@@ -262,31 +441,17 @@ class AnthropicProviderLangChain(ILLMProvider):
         try:
             logger.info(f"🔄 Refining rules based on feedback...")
 
-            system_prompt = self._build_system_prompt(aggregated_context)
-
-            prompt = ChatPromptTemplate.from_messages(
-                [
-                    ("system", system_prompt),
-                    (
-                        "human",
-                        "Current rules:\n{current_rules_json}\n\n"
-                        "User feedback:\n{feedback}\n\n"
-                        "Refine the rules based on this feedback. Return updated rules as JSON.",
-                    ),
-                ]
-            )
-
-            parser = JsonOutputParser(pydantic_object=GeneratedRules)
-            chain = prompt | self.llm | parser
-
-            result = await chain.ainvoke(
+            message = await self._refine_chain.ainvoke(
                 {
-                    "current_rules_json": json.dumps(current_rules),
+                    "system": self._system_messages(aggregated_context),
+                    "current_rules_json": compact_json(current_rules),
                     "feedback": feedback,
                 }
             )
+            result = self._tool_args(message)
 
-            tokens_used = self._extract_token_usage()
+            tokens_used = self._record_usage(message)
+            result, tokens_used = await self._repair_if_invalid(result, tokens_used)
             logger.info(f"✅ Rules refined successfully")
 
             return result, tokens_used
@@ -295,35 +460,72 @@ class AnthropicProviderLangChain(ILLMProvider):
             logger.error(f"❌ Refinement error: {str(e)}")
             raise
 
-    def _extract_token_usage(self) -> int:
-        """Extract approximate token usage from LLM call"""
-        # LangChain's token counting is approximate
-        # In production, use actual token counts from API response
-        return 3000  # Placeholder
-
-    def _build_system_prompt(self, context: Dict[str, Any]) -> str:
-        """Build comprehensive system prompt from aggregated context"""
-        return f"""You are an expert workflow automation system.
-Your task is to generate production-ready workflow rules from user intents.
-
-Available context:
-- Conditions: {len(context.get('conditions', []))} types available
-- Actions: {len(context.get('actions', []))} types available
-- Variables: {len(context.get('variables', []))} available
-- Triggers: {len(context.get('triggers', []))} types available
-- Patterns: {len(context.get('patterns', []))} patterns available
-
-CRITICAL REQUIREMENTS:
-1. Generate ONLY valid JSON matching the GeneratedRules schema
-2. Each rule must have clear trigger, conditions, and actions
-3. Use variable types and action types from available context
-4. Set priority between 0-1000 based on importance (1000=highest)
-5. Ensure all rules are production-ready and can be executed
-
-BEST PRACTICES:
-- Keep rule names short and descriptive
-- One trigger per rule
-- Multiple conditions are OR'd together by default
-- Actions are executed sequentially
-- Always set a meaningful priority level
-- Enable rule by default unless otherwise specified"""
+    async def _repair_if_invalid(
+        self,
+        result: Dict[str, Any],
+        tokens_used: int,
+    ) -> Tuple[Dict[str, Any], int]:
+        """
+        Validate tool output against the rules schema and, if it fails,
+        ask the model once to fix the reported errors.
+
+        Forced tool use keeps the output close to the schema, but the API
+        does not enforce it; this catches the remainder cheaply.
+        """
+        errors = schema_errors(result)
+        if not errors:
+            return result, tokens_used
+
+        logger.warning(f"⚠️  Rules failed schema validation ({len(errors)} errors), repairing")
+        message = await self._repair_chain.ainvoke(
+            {"original": compact_json(result), "errors": compact_json(errors)}
+        )
+        repaired = self._tool_args(message)
+        tokens_used += self._record_usage(message)
+
+        remaining = schema_errors(repaired)
+        if remaining:
+            logger.warning(f"⚠️  {len(remaining)} schema errors remain after repair")
+        else:
+            logger.info("🔧 Rules repaired")
+        return repaired, tokens_used
+
+    @property
+    def usage_stats(self) -> Dict[str, int]:
+        """Cumulative token usage, including prompt-cache reads and writes"""
+        return {
+            "total_tokens": self._total_tokens,
+            "cache_read_input_tokens": self._cache_read_tokens,
+            "cache_creation_input_tokens": self._cache_creation_tokens,
+        }
+
+    def _record_usage(self, message: Any) -> int:
+        """Add a response's token usage to the running totals and return it"""
+        usage = extract_token_usage(message)
+        tokens_used = sum(usage.values())
+
+        # Single event loop thread, so plain increments are safe
+        self._total_tokens += tokens_used
+        self._cache_read_tokens += usage["cache_read_input_tokens"]
+        self._cache_creation_tokens += usage["cache_creation_input_tokens"]
+
+        logger.debug(
+            "📊 Tokens: %s in, %s out, %s cache read, %s cache write",
+            usage["input_tokens"],
+            usage["output_tokens"],
+            usage["cache_read_input_tokens"],
+            usage["cache_creation_input_tokens"],
+        )
+        return tokens_used
+
+    def _system_messages(
+        self, aggregated_context: Dict[str, Any]
+    ) -> List[SystemMessage]:
+        """System prompt as content blocks with a cached catalog prefix"""
+        return [SystemMessage(content=self._build_system_blocks(aggregated_context))]
+
+    def _tool_args(self, message: Any) -> Dict[str, Any]:
+        """Return the arguments of the forced tool call in a model response"""
+        if not getattr(message, "tool_calls", None):
+            raise ValueError("Claude response did not contain the expected tool call")
+        return message.tool_calls[0]["args"]
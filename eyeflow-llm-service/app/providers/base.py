@@ -1,6 +1,143 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List, Tuple
-import json
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple, Union
+import hashlib
+
+import orjson
+
+from .http_pool import prewarm_llm_http_client
+
+# Number of distinct catalogs whose static prompt prefix is kept built
+STATIC_PREFIX_CACHE_SIZE = 32
+
+# Catalog digest -> static prompt prefix, in LRU order (shared by providers)
+_static_prefix_cache: "OrderedDict[bytes, str]" = OrderedDict()
+
+
+# One generate_rules_batch result per intent: the rules dict, or the
+# exception that intent failed with (asyncio.gather return_exceptions style)
+BatchSlot = Union[Dict[str, Any], Exception]
+
+# Catalog sections whose entries carry an "example" payload
+EXAMPLE_SECTIONS = (
+    "condition_types",
+    "action_types",
+    "trigger_types",
+    "resilience_patterns",
+)
+
+
+def example_json(value: Any) -> str:
+    """Pretty-print an example payload for the prompt"""
+    return orjson.dumps(
+        value,
+        option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS,
+        default=str,
+    ).decode()
+
+
+def compact_json(value: Any) -> str:
+    """Serialize without whitespace to keep prompt tokens down"""
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS, default=str).decode()
+
+
+def preserialize_examples(aggregated_context: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Attach the pretty-printed JSON of each catalog example as "_example_json".
+
+    Done once when a context is ingested so prompt formatting only slices the
+    cached strings in instead of re-serializing every example.
+    """
+    for section in EXAMPLE_SECTIONS:
+        for entry in aggregated_context.get(section) or []:
+            if isinstance(entry, dict):
+                entry["_example_json"] = example_json(entry.get("example", {}))
+
+    variables = aggregated_context.get("context_variables")
+    if isinstance(variables, dict):
+        for var_def in variables.values():
+            if isinstance(var_def, dict):
+                var_def["_example_json"] = example_json(var_def.get("example", {}))
+
+    for example in aggregated_context.get("examples") or []:
+        if isinstance(example, dict):
+            example["_example_json"] = example_json(example.get("content", {}))
+
+    return aggregated_context
+
+
+def _cached_example_json(entry: Dict[str, Any], key: str = "example") -> str:
+    cached = entry.get("_example_json")
+    if cached is not None:
+        return cached
+    return example_json(entry.get(key, {}))
+
+
+def _example_block(label: str, entry: Dict[str, Any], key: str = "example") -> str:
+    """Labelled JSON block for an entry's example; empty for compacted entries"""
+    if "_example_json" not in entry and key not in entry:
+        return ""
+    return f"""**{label}:**
+```json
+{_cached_example_json(entry, key)}
+```
+"""
+
+
+# Annotation holding a digest computed once when the context was ingested
+CATALOG_DIGEST_KEY = "_catalog_digest"
+
+
+def catalog_digest(aggregated_context: Dict[str, Any]) -> bytes:
+    """
+    Stable digest of the catalog entries of an aggregated context.
+
+    Underscore-prefixed keys are per-request annotations (e.g. the
+    constraint preamble) and are excluded so they do not split the cache.
+    A digest stamped by stamp_catalog_digest is returned as is.
+    """
+    stamped = aggregated_context.get(CATALOG_DIGEST_KEY)
+    if stamped is not None:
+        return stamped
+
+    catalog = {k: v for k, v in aggregated_context.items() if not k.startswith("_")}
+    return hashlib.blake2b(
+        orjson.dumps(
+            catalog,
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS,
+            default=str,
+        ),
+        digest_size=16,
+    ).digest()
+
+
+def stamp_catalog_digest(aggregated_context: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Store the catalog digest on a context that is reused across requests.
+
+    The cached context is served for its whole TTL, so hashing it once at
+    ingestion turns every later prompt-prefix lookup into a dict read.
+    Per-request copies made with {**context, "_key": ...} keep the stamp;
+    code that changes catalog entries in a copy must drop it.
+    """
+    aggregated_context.pop(CATALOG_DIGEST_KEY, None)
+    aggregated_context[CATALOG_DIGEST_KEY] = catalog_digest(aggregated_context)
+    return aggregated_context
+
+
+def fit_batch_slots(slots: List[BatchSlot], count: int) -> List[BatchSlot]:
+    """
+    Align one-prompt batch output with its intents.
+
+    The model may return fewer or more rule sets than it was asked for;
+    extras are dropped and missing intents get an error slot.
+    """
+    if len(slots) >= count:
+        return slots[:count]
+    return slots + [
+        ValueError(f"No rule set generated for intent {i}")
+        for i in range(len(slots), count)
+    ]
 
 
 class ILLMProvider(ABC):
@@ -12,6 +149,13 @@ class ILLMProvider(ABC):
     - Multi-turn conversation for refinement
     """
 
+    # Root URL of the hosted API, pre-warmed on startup (None for local providers)
+    api_base_url: Optional[str] = None
+
+    # True if generate_rules_batch sends all intents in one prompt, so
+    # concurrent single-intent calls are worth micro-batching
+    batches_in_one_prompt: bool = False
+
     @property
     @abstractmethod
     def name(self) -> str:
@@ -50,7 +194,7 @@ class ILLMProvider(ABC):
         self,
         aggregated_context: Dict[str, Any],
         intents: List[str],
-    ) -> Tuple[List[Dict[str, Any]], int]:
+    ) -> Tuple[List[BatchSlot], int]:
         """
         Generate multiple rules efficiently in batch.
 
@@ -59,10 +203,66 @@ class ILLMProvider(ABC):
             intents: List of natural language descriptions
 
         Returns:
-            Tuple[list_of_rules, total_tokens_used]
+            Tuple[list_of_rules, total_tokens_used]; one slot per intent, in
+            order, holding the rules dict or the exception it failed with
         """
         pass
 
+    async def stream_rules(
+        self,
+        aggregated_context: Dict[str, Any],
+        user_intent: str,
+    ) -> AsyncIterator[Tuple[Dict[str, Any], bool]]:
+        """
+        Generate workflow rules, yielding partial results as they decode.
+
+        Providers that can stream structured output override this; the
+        default yields the complete generate_rules result once.
+
+        Yields:
+            Tuple[rules_dict_so_far, done]; the final item has done=True
+            and carries the complete rules
+        """
+        rules_dict, _ = await self.generate_rules(aggregated_context, user_intent)
+        yield rules_dict, True
+
+    async def warm_up(self) -> None:
+        """
+        Pre-open a pooled connection to the provider API so the first
+        request does not pay the TCP/TLS handshake.
+        """
+        if self.api_base_url:
+            await prewarm_llm_http_client(self.api_base_url)
+
+    async def close(self) -> None:
+        """
+        Release resources owned by the provider.
+
+        Providers built on the shared HTTP pool own nothing extra, so the
+        default is a no-op; the pool itself is closed on app shutdown.
+        """
+
+    async def generate_rules_batch_offline(
+        self,
+        aggregated_context: Dict[str, Any],
+        intents: List[str],
+    ) -> Tuple[List[BatchSlot], int]:
+        """
+        Generate multiple rules for non-interactive callers.
+
+        Providers with a discounted asynchronous batch API override this;
+        the default runs the realtime batch path.
+
+        Args:
+            aggregated_context: Complete system capabilities
+            intents: List of natural language descriptions
+
+        Returns:
+            Tuple[list_of_rules, total_tokens_used]; one slot per intent, as
+            for generate_rules_batch
+        """
+        return await self.generate_rules_batch(aggregated_context, intents)
+
     @abstractmethod
     async def evaluate_condition(
         self,
@@ -109,13 +309,62 @@ class ILLMProvider(ABC):
         Build comprehensive system prompt with all available capabilities.
         This is shared across all providers for consistency.
 
-        If the context contains a '_constraint_preamble' key (injected by
-        ConstrainedGenerationService), that block is prepended to the prompt
-        to enforce catalog-constrained generation (spec §3.3).
+        The prompt is the static catalog prefix followed by the dynamic
+        suffix; see _build_static_prefix and _build_dynamic_suffix.
         """
-        # ── Catalog constraint block (spec §3.3) ──────────────────────────────
-        constraint_preamble = aggregated_context.get("_constraint_preamble", "")
+        return self._get_static_prefix(
+            aggregated_context
+        ) + self._build_dynamic_suffix(aggregated_context)
+
+    def _build_system_blocks(
+        self, aggregated_context: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        """
+        Build the system prompt as Anthropic content blocks.
+
+        The static prefix carries a cache_control breakpoint so the server
+        reuses its prompt cache while only the suffix changes between calls.
+        """
+        return [
+            {
+                "type": "text",
+                "text": self._get_static_prefix(aggregated_context),
+                "cache_control": {"type": "ephemeral"},
+            },
+            {
+                "type": "text",
+                "text": self._build_dynamic_suffix(aggregated_context),
+            },
+        ]
+
+    def _get_static_prefix(self, aggregated_context: Dict[str, Any]) -> str:
+        """
+        Return the static prefix, memoized per catalog digest.
+
+        The catalog is typically reused across hundreds of requests, so
+        formatting it once per catalog removes nearly all prompt-build CPU.
+        """
+        key = catalog_digest(aggregated_context)
+
+        prefix = _static_prefix_cache.get(key)
+        if prefix is not None:
+            _static_prefix_cache.move_to_end(key)
+            return prefix
+
+        prefix = self._build_static_prefix(aggregated_context)
+        _static_prefix_cache[key] = prefix
+        if len(_static_prefix_cache) > STATIC_PREFIX_CACHE_SIZE:
+            _static_prefix_cache.popitem(last=False)
+        return prefix
 
+    def _build_static_prefix(self, aggregated_context: Dict[str, Any]) -> str:
+        """
+        Build the catalog part of the system prompt (mission, conditions,
+        actions, variables, triggers, patterns, examples, best practices).
+
+        It depends only on the catalog entries of the context, which change
+        rarely, so it forms a stable prefix for prompt caching.
+        """
         conditions_text = self._format_conditions(aggregated_context)
         actions_text = self._format_actions(aggregated_context)
         variables_text = self._format_variables(aggregated_context)
@@ -124,7 +373,7 @@ class ILLMProvider(ABC):
         examples_text = self._format_examples(aggregated_context)
         best_practices = self._format_best_practices(aggregated_context)
 
-        return f"""{constraint_preamble}You are an expert enterprise workflow automation engine powering a sophisticated LLM-driven task management system.
+        return f"""You are an expert enterprise workflow automation engine powering a sophisticated LLM-driven task management system.
 
 ## 🎯 YOUR MISSION
 Generate production-ready workflow rules that orchestrate complex business processes across 4+ enterprise modules.
@@ -235,7 +484,22 @@ Always follow these enterprise patterns:
 
 
 ---
+"""
+
+    def _build_dynamic_suffix(self, aggregated_context: Dict[str, Any]) -> str:
+        """
+        Build the per-request part of the system prompt: the response format,
+        validation checklist and critical requirements.
+
+        If the context contains a '_constraint_preamble' key (injected by
+        ConstrainedGenerationService), that block leads the suffix to enforce
+        catalog-constrained generation (spec §3.3). It changes between repair
+        attempts, so it is kept out of the cacheable prefix.
+        """
+        # ── Catalog constraint block (spec §3.3) ──────────────────────────────
+        constraint_preamble = aggregated_context.get("_constraint_preamble", "")
 
+        return f"""{constraint_preamble}
 ## 📝 REQUIRED RESPONSE FORMAT
 
 Generate workflow rules as valid JSON matching this schema:
@@ -339,100 +603,80 @@ Now generate the workflow rules:
 
     def _format_conditions(self, context: Dict[str, Any]) -> str:
         """Format condition types with full details"""
-        text = ""
+        parts = []
         if "condition_types" in context and context["condition_types"]:
             for i, cond in enumerate(context["condition_types"], 1):
-                text += f"""
+                parts.append(f"""
 ### {i}. {cond.get('type', 'UNKNOWN')} ({cond.get('category', 'N/A')})
 **Description:** {cond.get('description', 'No description')}
-**Example usage:**
-```json
-{json.dumps(cond.get('example', {}), indent=2)}
-```
-"""
-        return text
+{_example_block('Example usage', cond)}""")
+        return "".join(parts)
 
     def _format_actions(self, context: Dict[str, Any]) -> str:
         """Format action types with full details"""
-        text = ""
+        parts = []
         if "action_types" in context and context["action_types"]:
             for i, action in enumerate(context["action_types"], 1):
                 async_status = "Async (waits for completion)" if action.get("async", False) else "Sync (fire-and-forget)"
-                text += f"""
+                parts.append(f"""
 ### {i}. {action.get('type', 'UNKNOWN')} - {async_status}
 **Category:** {action.get('category', 'N/A')}
 **Description:** {action.get('description', 'No description')}
-**Example:**
-```json
-{json.dumps(action.get('example', {}), indent=2)}
-```
-"""
-        return text
+{_example_block('Example', action)}""")
+        return "".join(parts)
 
     def _format_variables(self, context: Dict[str, Any]) -> str:
         """Format context variables with full details"""
-        text = ""
+        parts = []
         if "context_variables" in context and context["context_variables"]:
             for i, (var_name, var_def) in enumerate(context["context_variables"].items(), 1):
                 read_only = "🔒 Read-only" if var_def.get("isReadOnly", False) else "📝 Writable"
-                text += f"""
+                parts.append(f"""
 ### {i}. ${var_name} - {read_only}
 **Description:** {var_def.get('description', 'No description')}
 **Type:** {var_def.get('type', 'object')}
-**Example:**
-```json
-{json.dumps(var_def.get('example', {}), indent=2)}
-```
-"""
-        return text
+{_example_block('Example', var_def)}""")
+        return "".join(parts)
 
     def _format_triggers(self, context: Dict[str, Any]) -> str:
         """Format trigger types"""
-        text = ""
+        parts = []
         if "trigger_types" in context and context["trigger_types"]:
             for i, trigger in enumerate(context["trigger_types"], 1):
-                text += f"""
+                parts.append(f"""
 ### {i}. {trigger.get('type', 'UNKNOWN')}
 **Description:** {trigger.get('description', 'No description')}
-**Example:**
-```json
-{json.dumps(trigger.get('example', {}), indent=2)}
-```
-"""
-        return text
+{_example_block('Example', trigger)}""")
+        return "".join(parts)
 
     def _format_patterns(self, context: Dict[str, Any]) -> str:
         """Format resilience patterns"""
-        text = ""
+        parts = []
         if "resilience_patterns" in context and context["resilience_patterns"]:
             for i, pattern in enumerate(context["resilience_patterns"], 1):
-                text += f"""
+                parts.append(f"""
 ### {i}. {pattern.get('type', 'UNKNOWN')}
 **Description:** {pattern.get('description', 'No description')}
 **Applicable to:** {', '.join(pattern.get('applicableTo', []))}
-**Configuration example:**
-```json
-{json.dumps(pattern.get('example', {}), indent=2)}
-```
-"""
-        return text
+{_example_block('Configuration example', pattern)}""")
+        return "".join(parts)
 
     def _format_examples(self, context: Dict[str, Any]) -> str:
         """Format real-world examples"""
-        text = ""
+        parts = []
         if "examples" in context and context["examples"]:
             for i, example in enumerate(context["examples"], 1):
-                text += f"""
+                parts.append(f"""
 #### Example {i}: {example.get('name', 'Example')}
 **Type:** {example.get('category', 'workflow')} | **Complexity:** {example.get('complexity', 'N/A')}
 **Description:** {example.get('description', 'No description')}
 
 **Real implementation:**
 ```json
-{json.dumps(example.get('content', {}), indent=2)}
+{_cached_example_json(example, 'content')}
 ```
-"""
-        return text
+""")
+        return "".join(parts)
 
     def _format_best_practices(self, context: Dict[str, Any]) -> str:
         """Format best practices from all providers"""
@@ -441,8 +685,6 @@ Now generate the workflow rules:
         if "best_practices" in context and context["best_practices"]:
             practices.extend(context["best_practices"])
 
-        text = ""
-        for i, practice in enumerate(practices, 1):
-            text += f"**{i}.** {practice}\n"
-
-        return text
+        return "".join(
+            f"**{i}.** {practice}\n" for i, practice in enumerate(practices, 1)
+        )
@@ -0,0 +1,56 @@
+import logging
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Connection limits for the pool shared by every LLM provider
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 50
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_llm_http_client() -> httpx.AsyncClient:
+    """
+    Get the process-wide HTTP client used by LLM provider SDKs.
+
+    HTTP/2 lets concurrent requests multiplex over a single TLS connection,
+    so bursts of provider calls do not pay a handshake per connection.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            ),
+            timeout=httpx.Timeout(60.0, connect=5.0),
+        )
+        logger.info("🔌 Shared LLM HTTP/2 client created")
+    return _http_client
+
+
+async def prewarm_llm_http_client(base_url: str) -> None:
+    """
+    Open a connection to an LLM API ahead of the first real request.
+
+    Any response (even 404) leaves a warm TLS connection in the pool;
+    failures are ignored since this is only an optimization.
+    """
+    try:
+        await get_llm_http_client().head(base_url, timeout=5.0)
+        logger.info(f"🔥 Pre-warmed connection to {base_url}")
+    except httpx.HTTPError as e:
+        logger.warning(f"⚠️  Could not pre-warm connection to {base_url}: {e}")
+
+
+async def aclose_llm_http_client() -> None:
+    """Close the shared HTTP client (called on application shutdown)"""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+        logger.info("🔌 Shared LLM HTTP/2 client closed")
+    _http_client = None
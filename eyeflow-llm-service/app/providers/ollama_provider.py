@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from typing import Dict, Any, Tuple, List, Optional
+
+from config.settings import get_settings
+from .base import BatchSlot
+from .openai_provider import OpenAIProvider
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaProvider(OpenAIProvider):
+    """
+    Local inference through an OpenAI-compatible server.
+
+    Ollama, llama.cpp's llama-server and vLLM all expose
+    /v1/chat/completions, so the OpenAI provider's streaming, caching and
+    parsing apply unchanged. These engines batch concurrent requests on
+    the GPU (continuous batching), so batches fan out one request per
+    intent instead of packing intents into one prompt.
+    """
+
+    batches_in_one_prompt = False
+    # Schema-guided decoding varies by engine version; JSON mode is universal
+    rules_response_format = {"type": "json_object"}
+    # Local servers do not serve the OpenAI embedding model
+    semantic_cache = False
+
+    def __init__(
+        self,
+        api_url: str = "http://localhost:11434",
+        model: str = "llama3",
+        name: str = "ollama_local",
+        max_concurrency: Optional[int] = None,
+    ):
+        super().__init__(
+            api_key="local",  # Required by the SDK, ignored by the server
+            model=model,
+            base_url=f"{api_url.rstrip('/')}/v1",
+        )
+        # Local decode is slower than the hosted APIs
+        self.client = self.client.with_options(timeout=get_settings().LOCAL_LLM_TIMEOUT_SECONDS)
+        # Caps batch fan-out; beyond the server's parallel slots requests
+        # only queue there and run into the timeout
+        self._semaphore = asyncio.Semaphore(
+            max_concurrency or get_settings().LLM_MAX_CONCURRENCY
+        )
+        self.api_base_url = api_url
+        self._name = name
+        logger.info(f"✅ Local LLM Provider initialized: {model} at {api_url}")
+
+    async def generate_rules_batch(
+        self,
+        aggregated_context: Dict[str, Any],
+        intents: List[str],
+    ) -> Tuple[List[BatchSlot], int]:
+        """
+        Generate rules for each intent concurrently, at most
+        max_concurrency at a time. The server batches the in-flight requests
+        itself; a failed intent is logged and its slot holds the exception.
+        """
+        logger.info(f"🔄 Batch generating {len(intents)} rule sets...")
+
+        async def generate_one(intent: str) -> Tuple[Dict[str, Any], int]:
+            async with self._semaphore:
+                return await self.generate_rules(aggregated_context, intent)
+
+        results = await asyncio.gather(
+            *(generate_one(intent) for intent in intents),
+            return_exceptions=True,
+        )
+
+        rules_list: List[BatchSlot] = []
+        tokens_used = 0
+        failures = 0
+        for intent, result in zip(intents, results):
+            if isinstance(result, BaseException):
+                if not isinstance(result, Exception):
+                    raise result
+                failures += 1
+                logger.error(
+                    f"❌ Failed to generate rules for intent '{intent[:60]}': {result}"
+                )
+                rules_list.append(result)
+                continue
+            rules_dict, tokens = result
+            rules_list.append(rules_dict)
+            tokens_used += tokens
+
+        logger.info(
+            f"✅ Batch generated {len(intents) - failures}/{len(intents)} rule sets "
+            f"({tokens_used} tokens)"
+        )
+        return rules_list, tokens_used
+
+    async def generate_rules_batch_offline(
+        self,
+        aggregated_context: Dict[str, Any],
+        intents: List[str],
+    ) -> Tuple[List[BatchSlot], int]:
+        """Local servers have no batch API; run the realtime batch path"""
+        return await self.generate_rules_batch(aggregated_context, intents)
@@ -1,13 +1,139 @@
+import asyncio
 import json
 import logging
-from typing import Dict, Any, Tuple, List
-from tenacity import retry, stop_after_attempt, wait_exponential
+import re
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 from openai import AsyncOpenAI
+import orjson
 
-from .base import ILLMProvider
+from config.settings import get_settings
+from app.services.constrained_generation import RULES_RESPONSE_FORMAT
+from app.services.semantic_cache import SemanticCache, context_namespace
+from .base import BatchSlot, ILLMProvider, compact_json, fit_batch_slots
+from .http_pool import get_llm_http_client
 
 logger = logging.getLogger(__name__)
 
+# Batch API jobs take minutes to hours; poll with backoff up to this interval
+BATCH_POLL_INITIAL_INTERVAL = 5.0
+BATCH_POLL_MAX_INTERVAL = 60.0
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# A response wrapped in a markdown code fence
+_CODE_FENCE_RE = re.compile(r"^```(?:json)?\s*\n(.*?)\n?```$", re.S)
+
+
+async def run_chat_completion_batch(
+    client: AsyncOpenAI,
+    bodies: List[Dict[str, Any]],
+) -> Tuple[Dict[int, str], int]:
+    """
+    Run chat completion requests through the OpenAI Batch API.
+
+    The requests are uploaded as a JSONL file and processed asynchronously
+    at half the on-demand token price within a 24h completion window.
+
+    Returns:
+        Tuple[message content by request index, total tokens used];
+        failed requests are logged and missing from the mapping
+    """
+    jsonl = b"\n".join(
+        orjson.dumps(
+            {
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": body,
+            }
+        )
+        for i, body in enumerate(bodies)
+    )
+    input_file = await client.files.create(
+        file=("batch.jsonl", jsonl),
+        purpose="batch",
+    )
+    batch = await client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    logger.info(f"📤 Submitted OpenAI batch {batch.id} ({len(bodies)} requests)")
+
+    interval = BATCH_POLL_INITIAL_INTERVAL
+    while batch.status not in BATCH_TERMINAL_STATUSES:
+        await asyncio.sleep(interval)
+        interval = min(interval * 2, BATCH_POLL_MAX_INTERVAL)
+        batch = await client.batches.retrieve(batch.id)
+
+    if batch.status != "completed" or not batch.output_file_id:
+        raise ValueError(f"OpenAI batch {batch.id} ended with status {batch.status}")
+
+    contents: Dict[int, str] = {}
+    tokens_used = 0
+    output = await client.files.content(batch.output_file_id)
+    for line in output.text.splitlines():
+        if not line.strip():
+            continue
+        entry = orjson.loads(line)
+        response = entry.get("response") or {}
+        if entry.get("error") or response.get("status_code") != 200:
+            logger.error(
+                f"❌ Batch request {entry.get('custom_id')} failed: "
+                f"{entry.get('error') or response.get('status_code')}"
+            )
+            continue
+        body = response["body"]
+        usage = body.get("usage") or {}
+        tokens_used += usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+        contents[int(entry["custom_id"])] = body["choices"][0]["message"]["content"]
+
+    return contents, tokens_used
+
+
+class JsonArrayItems:
+    """
+    Incremental parser for a streamed JSON array.
+
+    feed() takes text deltas and returns the array items completed so far,
+    so each item can be used while later ones are still being generated.
+    Text before the opening bracket (e.g. a markdown fence) is skipped.
+    """
+
+    _decoder = json.JSONDecoder()
+
+    def __init__(self):
+        self._buffer = ""
+        self._started = False
+
+    def feed(self, text: str) -> List[Any]:
+        self._buffer += text
+        if not self._started:
+            start = self._buffer.find("[")
+            if start < 0:
+                return []
+            self._buffer = self._buffer[start + 1 :]
+            self._started = True
+        elif "}" not in text and "]" not in text:
+            # No value can have completed since the last attempt
+            return []
+
+        items: List[Any] = []
+        pos = 0
+        while True:
+            while pos < len(self._buffer) and self._buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(self._buffer) or self._buffer[pos] == "]":
+                break
+            try:
+                item, pos = self._decoder.raw_decode(self._buffer, pos)
+            except json.JSONDecodeError:
+                # Incomplete item; wait for more text
+                break
+            items.append(item)
+
+        self._buffer = self._buffer[pos:]
+        return items
+
 
 class OpenAIProvider(ILLMProvider):
     """
@@ -18,10 +144,35 @@ class OpenAIProvider(ILLMProvider):
     - Multi-turn conversation awareness
     """
 
-    def __init__(self, api_key: str, model: str = "gpt-4-turbo"):
-        self.client = AsyncOpenAI(api_key=api_key)
+    api_base_url = "https://api.openai.com"
+    batches_in_one_prompt = True
+    # response_format for single rule-set calls
+    rules_response_format: Dict[str, Any] = RULES_RESPONSE_FORMAT
+    # Whether the response cache may match intents by embedding similarity
+    semantic_cache: bool = True
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "gpt-4-turbo",
+        base_url: Optional[str] = None,
+    ):
+        # The SDK is the only retry layer: it retries connection errors, 429
+        # and 5xx with jittered backoff before any response byte arrives, so
+        # a streamed call never replays on_text deltas
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=get_settings().LLM_MAX_RETRIES,
+            http_client=get_llm_http_client(),
+        )
         self._model = model
         self._name = "openai"
+        self._response_cache = SemanticCache(
+            self._embed,
+            threshold=get_settings().SEMANTIC_CACHE_THRESHOLD,
+            max_entries=get_settings().SEMANTIC_CACHE_MAX_ENTRIES,
+        )
         logger.info(f"✅ OpenAI Provider initialized with model: {model}")
 
     @property
@@ -32,33 +183,36 @@ class OpenAIProvider(ILLMProvider):
     def model_name(self) -> str:
         return self._model
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=2))
     async def generate_rules(
         self,
         aggregated_context: Dict[str, Any],
         user_intent: str,
+        on_text: Optional[Callable[[str], None]] = None,
     ) -> Tuple[Dict[str, Any], int]:
         """
         Generate workflow rules using GPT-4.
 
+        The response is streamed; on_text, if given, receives each text
+        delta as it arrives so callers can report progress.
+
         Supports constrained generation (spec §3.3):
-         - response_format=json_object enforces structural constraint
+         - response_format=json_schema decodes against WORKFLOW_RULES_SCHEMA
          - logit_bias=-100 suppresses explicitly forbidden token IDs
            (populated by ConstrainedGenerationService when tiktoken is available)
         """
-        system_prompt = self._build_system_prompt(aggregated_context)
-
-        prompt = f"""Based on the context and available capabilities provided above, generate workflow rules for this user intent:
-
-User Intent: {user_intent}
+        namespace = context_namespace(aggregated_context)
+        cached = await self._response_cache.get(
+            user_intent, namespace, semantic=self.semantic_cache
+        )
+        if cached is not None:
+            logger.info(f"📦 Rules served from cache for intent: {user_intent[:100]}")
+            return cached, 0
 
-Generate production-ready workflow rules as valid JSON only. No explanations, no markdown - just the JSON object."""
+        system_prompt = self._build_system_prompt(aggregated_context)
+        prompt = self._build_intent_prompt(user_intent)
 
         logger.info(f"🔄 Generating rules for intent: {user_intent[:100]}...")
 
-        # Structural constraint: JSON mode prevents non-JSON output (spec §3.3)
-        response_format: Dict[str, Any] = {"type": "json_object"}
-
         # Logit bias from constrained generation service (spec §3.3 — logit_bias=-100)
         logit_bias: Dict[str, int] = aggregated_context.get("_logit_bias", {})
 
@@ -66,7 +220,8 @@ Generate production-ready workflow rules as valid JSON only. No explanations, no
             model=self._model,
             max_tokens=4096,
             temperature=0.3,
-            response_format=response_format,
+            # Structural constraint: schema-guided decoding (spec §3.3)
+            response_format=self.rules_response_format,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": prompt},
@@ -75,25 +230,61 @@ Generate production-ready workflow rules as valid JSON only. No explanations, no
         if logit_bias:
             call_kwargs["logit_bias"] = logit_bias
 
-        response = await self.client.chat.completions.create(**call_kwargs)
-
-        rules_text = response.choices[0].message.content
+        rules_text, tokens_used = await self._stream_completion(on_text, **call_kwargs)
 
         try:
             rules_dict = self._extract_json(rules_text)
-            tokens_used = response.usage.prompt_tokens + response.usage.completion_tokens
             logger.info(f"✅ Rules generated successfully ({tokens_used} tokens)")
-            return rules_dict, tokens_used
         except json.JSONDecodeError as e:
             logger.error(f"❌ Failed to parse rules: {str(e)}")
             raise ValueError(f"Invalid JSON response from GPT-4: {str(e)}")
 
+        await self._response_cache.put(
+            user_intent, namespace, rules_dict, semantic=self.semantic_cache
+        )
+        return rules_dict, tokens_used
+
     async def generate_rules_batch(
         self,
         aggregated_context: Dict[str, Any],
         intents: List[str],
-    ) -> Tuple[List[Dict[str, Any]], int]:
-        """Generate multiple rules efficiently"""
+    ) -> Tuple[List[BatchSlot], int]:
+        """Generate multiple rules efficiently; one slot per intent"""
+        usage: Dict[str, int] = {}
+        rules_list = [
+            rules_dict
+            async for rules_dict in self.stream_rules_batch(
+                aggregated_context, intents, usage
+            )
+        ]
+        if intents and not rules_list:
+            logger.error("❌ Failed to parse batch rules: no JSON array items")
+            raise ValueError("Invalid JSON response: no JSON array items found")
+
+        rules_list = fit_batch_slots(rules_list, len(intents))
+        failures = sum(isinstance(slot, Exception) for slot in rules_list)
+        tokens_used = usage.get("tokens", 0)
+        logger.info(
+            f"✅ Batch generated {len(intents) - failures}/{len(intents)} rule sets "
+            f"({tokens_used} tokens)"
+        )
+        return rules_list, tokens_used
+
+    async def stream_rules_batch(
+        self,
+        aggregated_context: Dict[str, Any],
+        intents: List[str],
+        usage: Optional[Dict[str, int]] = None,
+    ) -> AsyncIterator[BatchSlot]:
+        """
+        Generate rules for several intents in one streamed prompt, yielding
+        each rule set as soon as its JSON object is complete. An array item
+        that is not an object is yielded as a ValueError in its place.
+
+        Args:
+            usage: If given, receives the total under "tokens" once the
+                stream ends
+        """
         system_prompt = self._build_system_prompt(aggregated_context)
 
         intents_text = "\n".join(
@@ -108,35 +299,92 @@ Generate the rules as a JSON array. Return ONLY valid JSON array: [{{workflow1}}
 
         logger.info(f"🔄 Batch generating {len(intents)} rule sets...")
 
-        response = await self.client.chat.completions.create(
+        parser = JsonArrayItems()
+        tokens_used = 0
+        stream = await self.client.chat.completions.create(
             model=self._model,
             max_tokens=8192,
             temperature=0.3,
-            system=system_prompt,
-            messages=[{"role": "user", "content": prompt}],
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt},
+            ],
+            stream=True,
+            stream_options={"include_usage": True},
         )
+        async for chunk in stream:
+            if chunk.usage is not None:
+                tokens_used = chunk.usage.prompt_tokens + chunk.usage.completion_tokens
+            if chunk.choices and chunk.choices[0].delta.content:
+                for item in parser.feed(chunk.choices[0].delta.content):
+                    yield item if isinstance(item, dict) else ValueError(
+                        f"Rule set is not a JSON object: {str(item)[:60]}"
+                    )
+
+        if usage is not None:
+            usage["tokens"] = tokens_used
+
+    async def generate_rules_batch_offline(
+        self,
+        aggregated_context: Dict[str, Any],
+        intents: List[str],
+    ) -> Tuple[List[BatchSlot], int]:
+        """
+        Generate rules for many intents through the OpenAI Batch API.
 
-        rules_text = response.choices[0].message.content
+        Each intent is its own request (no shared mega-prompt), billed at
+        the batch discount; may take minutes to hours. A failed intent is
+        logged and its slot holds the exception.
+        """
+        system_prompt = self._build_system_prompt(aggregated_context)
 
-        try:
-            rules_list = self._extract_json_array(rules_text)
-            tokens_used = response.usage.prompt_tokens + response.usage.completion_tokens
-            logger.info(
-                f"✅ Batch generated {len(rules_list)} rule sets ({tokens_used} tokens)"
-            )
-            return rules_list, tokens_used
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ Failed to parse batch rules: {str(e)}")
-            raise ValueError(f"Invalid JSON response: {str(e)}")
+        contents, tokens_used = await run_chat_completion_batch(
+            self.client,
+            [
+                {
+                    "model": self._model,
+                    "max_tokens": 4096,
+                    "temperature": 0.3,
+                    "response_format": self.rules_response_format,
+                    "messages": [
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": self._build_intent_prompt(intent)},
+                    ],
+                }
+                for intent in intents
+            ],
+        )
+
+        rules_list: List[BatchSlot] = []
+        for i in range(len(intents)):
+            if i not in contents:
+                rules_list.append(ValueError(f"Batch request {i} failed"))
+                continue
+            try:
+                rules_list.append(self._extract_json(contents[i]))
+            except json.JSONDecodeError as e:
+                logger.error(f"❌ Failed to parse rules for batch intent {i}: {e}")
+                rules_list.append(e)
+
+        failures = sum(isinstance(slot, Exception) for slot in rules_list)
+        logger.info(
+            f"✅ Batch generated {len(intents) - failures}/{len(intents)} rule sets "
+            f"({tokens_used} tokens)"
+        )
+        return rules_list, tokens_used
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=2))
     async def evaluate_condition(
         self,
         condition: str,
         context: Dict[str, Any],
     ) -> bool:
         """Dynamically evaluate a condition with given context"""
-        context_json = json.dumps(context, indent=2)
+        context_json = compact_json(context)
+
+        cache_text = f"{condition}\n{context_json}"
+        cached = await self._response_cache.get(cache_text, b"evaluate", semantic=False)
+        if cached is not None:
+            return cached
 
         prompt = f"""You are evaluating a workflow condition.
 
@@ -158,7 +406,8 @@ Respond with ONLY "true" or "false" (lowercase)."""
         result = response.choices[0].message.content.strip().lower()
         is_true = result == "true"
 
-        logger.debug(f"📊 Condition evaluation: '{condition}' -> {is_true}")
+        logger.debug("📊 Condition evaluation: '%s' -> %s", condition, is_true)
+        await self._response_cache.put(cache_text, b"evaluate", is_true, semantic=False)
         return is_true
 
     async def refine_rules(
@@ -166,11 +415,22 @@ Respond with ONLY "true" or "false" (lowercase)."""
         current_rules: Dict[str, Any],
         feedback: str,
         aggregated_context: Dict[str, Any],
+        on_text: Optional[Callable[[str], None]] = None,
     ) -> Tuple[Dict[str, Any], int]:
-        """Refine rules based on user feedback"""
+        """
+        Refine rules based on user feedback.
+        Streams like generate_rules, reporting deltas to on_text.
+        """
         system_prompt = self._build_system_prompt(aggregated_context)
 
-        current_rules_json = json.dumps(current_rules, indent=2)
+        current_rules_json = compact_json(current_rules)
+
+        namespace = context_namespace(aggregated_context)
+        cache_text = f"{current_rules_json}\n{feedback}"
+        cached = await self._response_cache.get(cache_text, namespace, semantic=False)
+        if cached is not None:
+            logger.info("📦 Refined rules served from cache")
+            return cached, 0
 
         prompt = f"""Refine these workflow rules based on feedback.
 
@@ -184,57 +444,97 @@ Generate improved rules. Return ONLY valid JSON."""
 
         logger.info(f"🔄 Refining rules based on feedback: {feedback[:100]}...")
 
-        response = await self.client.chat.completions.create(
+        refined_text, tokens_used = await self._stream_completion(
+            on_text,
             model=self._model,
             max_tokens=4096,
             temperature=0.3,
-            system=system_prompt,
-            messages=[{"role": "user", "content": prompt}],
+            response_format=self.rules_response_format,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt},
+            ],
         )
 
-        refined_text = response.choices[0].message.content
-
         try:
             refined_rules = self._extract_json(refined_text)
-            tokens_used = response.usage.prompt_tokens + response.usage.completion_tokens
             logger.info(f"✅ Rules refined successfully ({tokens_used} tokens)")
-            return refined_rules, tokens_used
         except json.JSONDecodeError as e:
             logger.error(f"❌ Failed to parse refined rules: {str(e)}")
             raise ValueError(f"Invalid JSON response: {str(e)}")
 
-    def _extract_json(self, text: str) -> Dict[str, Any]:
-        """Extract JSON object from text"""
-        text = text.strip()
+        await self._response_cache.put(cache_text, namespace, refined_rules, semantic=False)
+        return refined_rules, tokens_used
 
-        if text.startswith("```"):
-            end_idx = text.rfind("```")
-            if end_idx > 0:
-                text = text[text.find("\n") + 1 : end_idx]
+    def _build_intent_prompt(self, user_intent: str) -> str:
+        """User message asking for the rules of a single intent"""
+        return f"""Based on the context and available capabilities provided above, generate workflow rules for this user intent:
 
-        start_idx = text.find("{")
-        end_idx = text.rfind("}") + 1
+User Intent: {user_intent}
 
-        if start_idx >= 0 and end_idx > start_idx:
-            json_str = text[start_idx:end_idx]
-            return json.loads(json_str)
+Generate production-ready workflow rules as valid JSON only. No explanations, no markdown - just the JSON object."""
 
-        raise json.JSONDecodeError("No JSON object found", text, 0)
+    async def _stream_completion(
+        self,
+        on_text: Optional[Callable[[str], None]] = None,
+        **kwargs: Any,
+    ) -> Tuple[str, int]:
+        """
+        Stream a chat completion
 
-    def _extract_json_array(self, text: str) -> List[Dict[str, Any]]:
-        """Extract JSON array from text"""
+        Returns the full response text and the total tokens used, which
+        arrive in the final usage-only chunk.
+        """
+        text_parts: List[str] = []
+        tokens_used = 0
+        stream = await self.client.chat.completions.create(
+            stream=True,
+            stream_options={"include_usage": True},
+            **kwargs,
+        )
+        async for chunk in stream:
+            if chunk.usage is not None:
+                tokens_used = chunk.usage.prompt_tokens + chunk.usage.completion_tokens
+            if chunk.choices and chunk.choices[0].delta.content:
+                text = chunk.choices[0].delta.content
+                text_parts.append(text)
+                if on_text is not None:
+                    on_text(text)
+
+        return "".join(text_parts), tokens_used
+
+    async def _embed(self, text: str) -> List[float]:
+        """Embed text for the semantic response cache"""
+        response = await self.client.embeddings.create(
+            model=get_settings().EMBEDDING_MODEL,
+            input=text,
+        )
+        return response.data[0].embedding
+
+    def _extract_json(self, text: str) -> Dict[str, Any]:
+        """
+        Extract JSON object from text
+
+        Schema-guided responses are a bare object and parse in a single pass;
+        only fenced or prose-wrapped text is sliced down to its outermost
+        braces first.
+        """
         text = text.strip()
 
-        if text.startswith("```"):
-            end_idx = text.rfind("```")
-            if end_idx > 0:
-                text = text[text.find("\n") + 1 : end_idx]
+        if text[:1] == "{":
+            try:
+                return orjson.loads(text)
+            except orjson.JSONDecodeError:
+                pass  # Trailing prose after the object; slice it off below
 
-        start_idx = text.find("[")
-        end_idx = text.rfind("]") + 1
+        fenced = _CODE_FENCE_RE.match(text)
+        if fenced:
+            text = fenced.group(1)
+
+        start_idx = text.find("{")
+        end_idx = text.rfind("}") + 1
 
         if start_idx >= 0 and end_idx > start_idx:
-            json_str = text[start_idx:end_idx]
-            return json.loads(json_str)
+            return orjson.loads(text[start_idx:end_idx])
 
-        raise json.JSONDecodeError("No JSON array found", text, 0)
+        raise json.JSONDecodeError("No JSON object found", text, 0)
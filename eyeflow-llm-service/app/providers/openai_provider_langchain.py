@@ -8,25 +8,180 @@ Alternative provider using LangChain for:
 - Similar interface to Anthropic provider
 """
 
-import json
+import itertools
 import logging
-from typing import Dict, Any, List, Optional, Tuple
+import re
+from collections import OrderedDict
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
 
-from langchain_openai import ChatOpenAI
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import BaseOutputParser, JsonOutputParser
+from langchain_core.runnables import Runnable
+import orjson
 from pydantic import BaseModel, Field
 
-from .base import ILLMProvider
-from .anthropic_provider_langchain import (
-    WorkflowCondition,
-    WorkflowAction,
-    GeneratedRule,
-    GeneratedRules,
+from config.settings import get_settings
+from app.services.constrained_generation import (
+    RULES_RESPONSE_FORMAT,
+    WORKFLOW_RULES_SCHEMA,
+    schema_errors,
 )
+from app.services.semantic_cache import SemanticCache, context_namespace
+from .base import (
+    BatchSlot,
+    ILLMProvider,
+    STATIC_PREFIX_CACHE_SIZE,
+    catalog_digest,
+    compact_json,
+    fit_batch_slots,
+)
+from .http_pool import get_llm_http_client
+from .openai_provider import run_chat_completion_batch
 
 logger = logging.getLogger(__name__)
 
+# Constant system-prompt head, kept byte-identical across calls so the
+# provider-side prompt prefix cache applies. Telegraphic on purpose.
+STATIC_SYSTEM_PREFIX = """ROLE: workflow-automation rule generator. intent -> production rules.
+R1: output valid JSON only (workflow_rules schema); no prose, no markdown.
+R2: each rule = 1 trigger + conditions + actions.
+R3: use only condition/action/trigger/variable types from CTX.
+R4: priority int in [0,1000], higher = more important.
+R5: rules must be executable as-is.
+STYLE: short descriptive names; conditions OR'd; actions run in order.
+"""
+
+# (label, context key) pairs counted in the dynamic suffix
+CONTEXT_SUMMARY_SECTIONS = (
+    ("conditions", "condition_types"),
+    ("actions", "action_types"),
+    ("variables", "context_variables"),
+    ("triggers", "trigger_types"),
+    ("patterns", "resilience_patterns"),
+)
+
+# Catalog digest -> rendered catalog summary, in LRU order
+_context_summary_cache: "OrderedDict[bytes, str]" = OrderedDict()
+
+GENERATE_HUMAN_TEMPLATE = (
+    "Generate workflow rule(s) from this intent:\n{intent}\n\n"
+    "Return ONLY valid JSON matching the workflow_rules schema."
+)
+
+# Prompts are compiled once; the system prompt is passed as a variable so
+# braces in the catalog or constraint preamble are never parsed as fields
+GENERATE_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system", "{system_prompt}"),
+        ("human", GENERATE_HUMAN_TEMPLATE),
+    ]
+)
+
+BATCH_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system", "{system_prompt}"),
+        (
+            "human",
+            "Generate workflow rules from these intents:\n{intents_text}\n\n"
+            'Return ONLY a JSON object {{"rule_sets": [...]}} with one '
+            "workflow_rules object per intent, in the same order.",
+        ),
+    ]
+)
+
+EVALUATE_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "You are a workflow condition evaluator. "
+            "Given a condition and context, determine if the condition is TRUE or FALSE.\n"
+            "Respond with ONLY valid JSON: {{\"result\": true/false, \"reason\": \"explanation\"}}",
+        ),
+        (
+            "human",
+            "Condition: {condition}\nContext: {context_json}\n\n"
+            'Return JSON with "result" (boolean) and "reason" (string).',
+        ),
+    ]
+)
+
+REFINE_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system", "{system_prompt}"),
+        (
+            "human",
+            "Current rules:\n{current_rules_json}\n\n"
+            "User feedback:\n{feedback}\n\n"
+            "Refine the rules based on this feedback. Return updated rules as JSON.",
+        ),
+    ]
+)
+
+# Batch calls decode one workflow_rules object per intent, wrapped in an
+# object because json_schema response formats must have an object root
+BATCH_RULES_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "workflow_rule_sets",
+        "schema": {
+            "type": "object",
+            "required": ["rule_sets"],
+            "properties": {
+                "rule_sets": {"type": "array", "items": dict(WORKFLOW_RULES_SCHEMA)},
+            },
+        },
+        "strict": False,
+    },
+}
+
+_CODE_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+
+
+class ListRulesParser(BaseOutputParser[List[BatchSlot]]):
+    """
+    Parse a batch response into its workflow_rules objects.
+
+    Accepts the {"rule_sets": [...]} wrapper or a bare array. Each rule set
+    is checked against WORKFLOW_RULES_SCHEMA on its own; a malformed one
+    becomes an OutputParserException in its slot instead of failing the
+    whole batch, so results stay aligned with the intents.
+    """
+
+    def parse(self, text: str) -> List[BatchSlot]:
+        try:
+            data = orjson.loads(_CODE_FENCE_RE.sub("", text))
+        except orjson.JSONDecodeError as e:
+            raise OutputParserException(f"Invalid batch JSON: {e}", llm_output=text)
+
+        rule_sets = data.get("rule_sets") if isinstance(data, dict) else data
+        if not isinstance(rule_sets, list):
+            raise OutputParserException("Batch response has no rule_sets array", llm_output=text)
+
+        slots: List[BatchSlot] = []
+        for i, rule_set in enumerate(rule_sets):
+            errors = schema_errors(rule_set)
+            if errors:
+                logger.warning(f"⚠️  [OpenAI] Invalid rule set {i}: {errors[0]['msg']}")
+                slots.append(OutputParserException(f"Invalid rule set: {errors[0]['msg']}"))
+                continue
+            slots.append(rule_set)
+        return slots
+
+    @property
+    def _type(self) -> str:
+        return "list_rules"
+
+
+class _KeyChains(NamedTuple):
+    """The provider's chains bound to one API key"""
+
+    generate: Runnable
+    batch: Runnable
+    evaluate: Runnable
+    refine: Runnable
+
 
 class OpenAIProviderLangChain(ILLMProvider):
     """
@@ -39,23 +194,76 @@ class OpenAIProviderLangChain(ILLMProvider):
     - Good for batch generation
     """
 
-    def __init__(self, api_key: str, model: str = "gpt-4-turbo-preview"):
-        """Initialize with LangChain ChatOpenAI"""
+    api_base_url = "https://api.openai.com"
+    batches_in_one_prompt = True
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "gpt-4-turbo-preview",
+        api_keys: Optional[List[str]] = None,
+    ):
+        """
+        Initialize with LangChain ChatOpenAI.
+
+        Extra api_keys (e.g. from separate accounts) are used round-robin
+        alongside api_key, so throughput is not capped by one key's rate
+        limits. All keys share the pooled HTTP client.
+        """
         self.api_key = api_key
         self._model_name = model
         self._name = "openai"
         self._total_tokens = 0
 
-        # Initialize GPT-4 via LangChain
-        self.llm = ChatOpenAI(
-            model=model,
+        keys = list(dict.fromkeys([api_key, *(api_keys or [])]))
+        models = [self._chat_model(key) for key in keys]
+        # First key's model; also used for the Batch API
+        self.llm = models[0]
+        self._key_chains = [self._build_chains(llm) for llm in models]
+        self._next_chains = itertools.cycle(self._key_chains).__next__
+
+        self._rules_parser = JsonOutputParser()
+        self._batch_parser = ListRulesParser()
+        self._evaluate_parser = JsonOutputParser()
+
+        self.embeddings = OpenAIEmbeddings(
+            model=get_settings().EMBEDDING_MODEL,
+            api_key=api_key,
+            http_async_client=get_llm_http_client(),
+            # Intents are short; skip client-side tiktoken chunking
+            check_embedding_ctx_length=False,
+        )
+        self._response_cache = SemanticCache(
+            self.embeddings.aembed_query,
+            threshold=get_settings().SEMANTIC_CACHE_THRESHOLD,
+            max_entries=get_settings().SEMANTIC_CACHE_MAX_ENTRIES,
+        )
+
+        logger.info(f"🔧 OpenAIProviderLangChain initialized: {model} ({len(keys)} API key(s))")
+
+    def _chat_model(self, api_key: str) -> ChatOpenAI:
+        return ChatOpenAI(
+            model=self._model_name,
             api_key=api_key,
             temperature=0.3,
             max_tokens=4096,
             timeout=60.0,
+            max_retries=get_settings().LLM_MAX_RETRIES,
+            http_async_client=get_llm_http_client(),
         )
 
-        logger.info(f"🔧 OpenAIProviderLangChain initialized: {model}")
+    @staticmethod
+    def _build_chains(llm: ChatOpenAI) -> _KeyChains:
+        # Single rule-set calls decode against the same schema that
+        # ConstrainedGenerationService validates (trigger = {"source": ...})
+        rules_llm = llm.bind(response_format=RULES_RESPONSE_FORMAT)
+        # Chains stop at the model so usage_metadata can be read before parsing
+        return _KeyChains(
+            generate=GENERATE_PROMPT | rules_llm,
+            batch=BATCH_PROMPT | llm.bind(response_format=BATCH_RULES_RESPONSE_FORMAT),
+            evaluate=EVALUATE_PROMPT | llm,
+            refine=REFINE_PROMPT | rules_llm,
+        )
 
     @property
     def name(self) -> str:
@@ -76,27 +284,24 @@ class OpenAIProviderLangChain(ILLMProvider):
         try:
             logger.info(f"🔄 [OpenAI] Generating rules from intent: {user_intent[:60]}...")
 
+            namespace = context_namespace(aggregated_context)
+            cached = await self._response_cache.get(user_intent, namespace)
+            if cached is not None:
+                logger.info("📦 [OpenAI] Rules served from cache")
+                return cached, 0
+
             system_prompt = self._build_system_prompt(aggregated_context)
 
-            prompt = ChatPromptTemplate.from_messages(
-                [
-                    ("system", system_prompt),
-                    (
-                        "human",
-                        "Generate workflow rule(s) from this intent:\n{intent}\n\n"
-                        "Return ONLY valid JSON matching the GeneratedRules schema.",
-                    ),
-                ]
+            message = await self._next_chains().generate.ainvoke(
+                {"system_prompt": system_prompt, "intent": user_intent}
             )
+            tokens_used = self._record_usage(message)
+            result = self._rules_parser.parse(message.content)
 
-            parser = JsonOutputParser(pydantic_object=GeneratedRules)
-            chain = prompt | self.llm | parser
-
-            result = await chain.ainvoke({"intent": user_intent})
-
-            tokens_used = self._extract_token_usage()
             logger.info(f"✅ [OpenAI] Generated {len(result.get('rules', []))} rules")
 
+            await self._response_cache.put(user_intent, namespace, result)
+
             return result, tokens_used
 
         except Exception as e:
@@ -106,33 +311,25 @@ class OpenAIProviderLangChain(ILLMProvider):
     async def generate_rules_batch(
         self,
         aggregated_context: Dict[str, Any],
-        user_intents: List[str],
-    ) -> Tuple[List[Dict[str, Any]], int]:
-        """Generate multiple rules efficiently"""
+        intents: List[str],
+    ) -> Tuple[List[BatchSlot], int]:
+        """Generate multiple rules efficiently; one slot per intent"""
         try:
-            logger.info(f"🔄 [OpenAI] Generating batch of {len(user_intents)} rules...")
+            logger.info(f"🔄 [OpenAI] Generating batch of {len(intents)} rules...")
 
             system_prompt = self._build_system_prompt(aggregated_context)
 
-            prompt = ChatPromptTemplate.from_messages(
-                [
-                    ("system", system_prompt),
-                    (
-                        "human",
-                        "Generate workflow rules from these intents:\n{intents_text}\n\n"
-                        "Return ONLY valid JSON as array of GeneratedRules objects.",
-                    ),
-                ]
+            intents_text = "\n".join([f"- {intent}" for intent in intents])
+            message = await self._next_chains().batch.ainvoke(
+                {"system_prompt": system_prompt, "intents_text": intents_text}
             )
+            tokens_used = self._record_usage(message)
+            result = fit_batch_slots(self._batch_parser.parse(message.content), len(intents))
 
-            parser = JsonOutputParser(pydantic_object=list)
-            chain = prompt | self.llm | parser
-
-            intents_text = "\n".join([f"- {intent}" for intent in user_intents])
-            result = await chain.ainvoke({"intents_text": intents_text})
-
-            tokens_used = self._extract_token_usage()
-            logger.info(f"✅ [OpenAI] Generated {len(result)} rules in batch")
+            failed = sum(isinstance(slot, Exception) for slot in result)
+            logger.info(
+                f"✅ [OpenAI] Generated {len(result) - failed}/{len(intents)} rules in batch"
+            )
 
             return result, tokens_used
 
@@ -140,6 +337,57 @@ class OpenAIProviderLangChain(ILLMProvider):
             logger.error(f"❌ [OpenAI] Batch generation error: {str(e)}")
             raise
 
+    async def generate_rules_batch_offline(
+        self,
+        aggregated_context: Dict[str, Any],
+        intents: List[str],
+    ) -> Tuple[List[BatchSlot], int]:
+        """Generate rules per intent through the OpenAI Batch API (discounted, slow)"""
+        try:
+            logger.info(f"🔄 [OpenAI] Submitting {len(intents)} intents to the Batch API...")
+
+            system_prompt = self._build_system_prompt(aggregated_context)
+            contents, tokens_used = await run_chat_completion_batch(
+                self.llm.root_async_client,
+                [
+                    {
+                        "model": self._model_name,
+                        "max_tokens": 4096,
+                        "temperature": 0.3,
+                        "response_format": RULES_RESPONSE_FORMAT,
+                        "messages": [
+                            {"role": "system", "content": system_prompt},
+                            {
+                                "role": "user",
+                                "content": GENERATE_HUMAN_TEMPLATE.format(intent=intent),
+                            },
+                        ],
+                    }
+                    for intent in intents
+                ],
+            )
+
+            rules_list: List[BatchSlot] = []
+            for i in range(len(intents)):
+                if i not in contents:
+                    rules_list.append(ValueError(f"Batch request {i} failed"))
+                    continue
+                try:
+                    rules_list.append(self._rules_parser.parse(contents[i]))
+                except OutputParserException as e:
+                    logger.error(f"❌ [OpenAI] Failed to parse batch intent {i}: {e}")
+                    rules_list.append(e)
+
+            failed = sum(isinstance(slot, Exception) for slot in rules_list)
+            logger.info(
+                f"✅ [OpenAI] Batch API generated {len(intents) - failed}/{len(intents)} rule sets"
+            )
+            return rules_list, tokens_used
+
+        except Exception as e:
+            logger.error(f"❌ [OpenAI] Batch API error: {str(e)}")
+            raise
+
     async def evaluate_condition(
         self,
         condition: str,
@@ -149,29 +397,25 @@ class OpenAIProviderLangChain(ILLMProvider):
         try:
             logger.info(f"🔍 [OpenAI] Evaluating condition: {condition}")
 
-            prompt = ChatPromptTemplate.from_messages(
-                [
-                    (
-                        "system",
-                        "You are a workflow condition evaluator. "
-                        "Given a condition and context, determine if the condition is TRUE or FALSE.\n"
-                        "Respond with ONLY valid JSON: {\"result\": true/false, \"reason\": \"explanation\"}",
-                    ),
-                    (
-                        "human",
-                        f"Condition: {condition}\nContext: {json.dumps(context)}\n\n"
-                        'Return JSON with "result" (boolean) and "reason" (string).',
-                    ),
-                ]
-            )
-
-            parser = JsonOutputParser(pydantic_object=dict)
-            chain = prompt | self.llm | parser
+            context_json = compact_json(context)
+            cache_text = f"{condition}\n{context_json}"
+            cached = await self._response_cache.get(cache_text, b"evaluate", semantic=False)
+            if cached is not None:
+                return cached
 
-            result = await chain.ainvoke({})
+            message = await self._next_chains().evaluate.ainvoke(
+                {
+                    "condition": condition,
+                    "context_json": context_json,
+                }
+            )
+            self._record_usage(message)
+            result = self._evaluate_parser.parse(message.content)
 
             logger.info(f"✅ [OpenAI] Condition evaluated: {result['result']}")
-            return result.get("result", False)
+            is_true = result.get("result", False)
+            await self._response_cache.put(cache_text, b"evaluate", is_true, semantic=False)
+            return is_true
 
         except Exception as e:
             logger.error(f"❌ [OpenAI] Condition evaluation error: {str(e)}")
@@ -187,65 +431,82 @@ class OpenAIProviderLangChain(ILLMProvider):
         try:
             logger.info(f"🔄 [OpenAI] Refining rules based on feedback...")
 
-            system_prompt = self._build_system_prompt(aggregated_context)
-
-            prompt = ChatPromptTemplate.from_messages(
-                [
-                    ("system", system_prompt),
-                    (
-                        "human",
-                        "Current rules:\n{current_rules_json}\n\n"
-                        "User feedback:\n{feedback}\n\n"
-                        "Refine the rules based on this feedback. Return updated rules as JSON.",
-                    ),
-                ]
-            )
+            current_rules_json = compact_json(current_rules)
+            namespace = context_namespace(aggregated_context)
+            cache_text = f"{current_rules_json}\n{feedback}"
+            cached = await self._response_cache.get(cache_text, namespace, semantic=False)
+            if cached is not None:
+                logger.info("📦 [OpenAI] Refined rules served from cache")
+                return cached, 0
 
-            parser = JsonOutputParser(pydantic_object=GeneratedRules)
-            chain = prompt | self.llm | parser
+            system_prompt = self._build_system_prompt(aggregated_context)
 
-            result = await chain.ainvoke(
+            message = await self._next_chains().refine.ainvoke(
                 {
-                    "current_rules_json": json.dumps(current_rules),
+                    "system_prompt": system_prompt,
+                    "current_rules_json": current_rules_json,
                     "feedback": feedback,
                 }
             )
 
-            tokens_used = self._extract_token_usage()
+            tokens_used = self._record_usage(message)
+            result = self._rules_parser.parse(message.content)
             logger.info(f"✅ [OpenAI] Rules refined successfully")
 
+            await self._response_cache.put(cache_text, namespace, result, semantic=False)
+
             return result, tokens_used
 
         except Exception as e:
             logger.error(f"❌ [OpenAI] Refinement error: {str(e)}")
             raise
 
-    def _extract_token_usage(self) -> int:
-        """Extract approximate token usage from LLM call"""
-        return 2000  # Placeholder for OpenAI
+    @property
+    def usage_stats(self) -> Dict[str, int]:
+        """Cumulative token usage"""
+        return {"total_tokens": self._total_tokens}
+
+    def _record_usage(self, message: Any) -> int:
+        """Add a response's token usage to the running total and return it"""
+        usage = getattr(message, "usage_metadata", None) or {}
+        tokens_used = usage.get("total_tokens") or (
+            usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+        )
+        # Single event loop thread, so plain increments are safe
+        self._total_tokens += tokens_used
+        logger.debug(
+            "📊 Tokens: %s in, %s out",
+            usage.get("input_tokens", 0),
+            usage.get("output_tokens", 0),
+        )
+        return tokens_used
 
     def _build_system_prompt(self, context: Dict[str, Any]) -> str:
-        """Build comprehensive system prompt from aggregated context"""
-        return f"""You are an expert workflow automation system.
-Your task is to generate production-ready workflow rules from user intents.
-
-Available context:
-- Conditions: {len(context.get('conditions', []))} types available
-- Actions: {len(context.get('actions', []))} types available
-- Variables: {len(context.get('variables', []))} available
-- Triggers: {len(context.get('triggers', []))} types available
-- Patterns: {len(context.get('patterns', []))} patterns available
-
-CRITICAL REQUIREMENTS:
-1. Generate ONLY valid JSON matching the GeneratedRules schema
-2. Each rule must have clear trigger, conditions, and actions
-3. Use variable types and action types from available context
-4. Set priority between 0-1000 based on importance
-5. Ensure all rules are production-ready and can be executed
-
-BEST PRACTICES:
-- Keep rule names short and descriptive
-- One trigger per rule
-- Multiple conditions are OR'd together
-- Actions are executed sequentially
-- Always set a meaningful priority level"""
+        """
+        Build the system prompt: the constant STATIC_SYSTEM_PREFIX followed
+        by the per-context suffix.
+
+        The prefix is byte-identical on every call so OpenAI's automatic
+        prompt caching can reuse it; only the suffix varies.
+        """
+        return STATIC_SYSTEM_PREFIX + self._dynamic_context_suffix(context)
+
+    def _dynamic_context_suffix(self, context: Dict[str, Any]) -> str:
+        """Catalog summary (memoized per catalog digest) plus any constraint preamble"""
+        key = catalog_digest(context)
+        summary = _context_summary_cache.get(key)
+        if summary is None:
+            summary = "CTX: " + " ".join(
+                f"{label}={len(context.get(section) or [])}"
+                for label, section in CONTEXT_SUMMARY_SECTIONS
+            )
+            _context_summary_cache[key] = summary
+            if len(_context_summary_cache) > STATIC_PREFIX_CACHE_SIZE:
+                _context_summary_cache.popitem(last=False)
+        else:
+            _context_summary_cache.move_to_end(key)
+
+        constraint_preamble = context.get("_constraint_preamble")
+        if constraint_preamble:
+            return f"{summary}\n\n{constraint_preamble}"
+        return summary
@@ -1,10 +1,13 @@
 import logging
-from typing import Dict, Any, Optional
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping
 from enum import Enum
 
 from .base import ILLMProvider
 from .anthropic_provider_langchain import AnthropicProviderLangChain
 from .openai_provider_langchain import OpenAIProviderLangChain
+from .ollama_provider import OllamaProvider
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +23,59 @@ class LLMProviderType(str, Enum):
     GOOGLE = "google"
 
 
+def _require_api_key(llm_config: Dict[str, Any], provider_label: str) -> str:
+    api_key = llm_config.get("api_key")
+    if not api_key:
+        raise KeyError(
+            f"{provider_label} API key not configured. "
+            "Create config via POST /llm-config with apiKey field"
+        )
+    return api_key
+
+
+def _make_anthropic(llm_config: Dict[str, Any], model: str) -> ILLMProvider:
+    return AnthropicProviderLangChain(
+        api_key=_require_api_key(llm_config, "Anthropic"),
+        model=model or "claude-3-opus-20240229",
+    )
+
+
+def _make_openai(llm_config: Dict[str, Any], model: str) -> ILLMProvider:
+    return OpenAIProviderLangChain(
+        api_key=_require_api_key(llm_config, "OpenAI"),
+        model=model or "gpt-4-turbo-preview",
+        api_keys=llm_config.get("api_keys"),
+    )
+
+
+def _make_local(llm_config: Dict[str, Any], model: str) -> ILLMProvider:
+    return OllamaProvider(
+        api_url=llm_config.get("api_url") or "http://localhost:11434",
+        model=model or "llama3",
+        name=llm_config["provider"].lower(),
+    )
+
+
+def _not_implemented(message: str) -> Callable[[Dict[str, Any], str], ILLMProvider]:
+    def factory(llm_config: Dict[str, Any], model: str) -> ILLMProvider:
+        raise NotImplementedError(message)
+
+    return factory
+
+
+# Provider type -> factory(llm_config, model), built once at import
+_FACTORIES: Dict[str, Callable[[Dict[str, Any], str], ILLMProvider]] = {
+    LLMProviderType.ANTHROPIC.value: _make_anthropic,
+    LLMProviderType.OPENAI.value: _make_openai,
+    LLMProviderType.OLLAMA_LOCAL.value: _make_local,
+    LLMProviderType.LLAMA_CPP.value: _make_local,
+    LLMProviderType.GITHUB.value: _not_implemented(
+        "GitHub Models provider coming soon (models.inference.ai.azure.com)"
+    ),
+    LLMProviderType.GOOGLE.value: _not_implemented("Google Gemini provider coming soon"),
+}
+
+
 class LLMProviderRegistry:
     """
     Factory for creating and managing LLM providers.
@@ -37,6 +93,7 @@ class LLMProviderRegistry:
                 - provider: "anthropic", "openai", "ollama_local", etc
                 - model: model name
                 - api_key: API key (for cloud providers)
+                - api_keys: extra API keys used round-robin (OpenAI)
                 - api_url: endpoint URL (for local or custom)
                 - temperature: generation temperature
                 - max_tokens: max output tokens
@@ -53,70 +110,23 @@ class LLMProviderRegistry:
 
         logger.info(f"🔧 Creating LLM provider: {provider_type} (model: {model})")
 
-        if provider_type == LLMProviderType.ANTHROPIC:
-            api_key = llm_config.get("api_key")
-            if not api_key:
-                raise KeyError(
-                    "Anthropic API key not configured. "
-                    "Create config via POST /llm-config with apiKey field"
-                )
-
-            return AnthropicProviderLangChain(
-                api_key=api_key,
-                model=model or "claude-3-opus-20240229",
-            )
-
-        elif provider_type == LLMProviderType.OPENAI:
-            api_key = llm_config.get("api_key")
-            if not api_key:
-                raise KeyError(
-                    "OpenAI API key not configured. "
-                    "Create config via POST /llm-config with apiKey field"
-                )
-
-            return OpenAIProviderLangChain(
-                api_key=api_key,
-                model=model or "gpt-4-turbo-preview",
-            )
-
-        elif provider_type in [
-            LLMProviderType.OLLAMA_LOCAL,
-            LLMProviderType.LLAMA_CPP,
-        ]:
-            api_url = llm_config.get(
-                "api_url", "http://localhost:11434"
-            )
-            logger.warning(
-                f"⚠️  Local provider {provider_type} requested but not yet implemented. "
-                f"Using: {api_url}"
-            )
-            raise NotImplementedError(
-                f"Local provider {provider_type} coming soon. "
-                f"Use Anthropic or OpenAI for now."
-            )
-
-        elif provider_type == LLMProviderType.GITHUB:
-            raise NotImplementedError(
-                "GitHub Models provider coming soon (models.inference.ai.azure.com)"
-            )
-
-        elif provider_type == LLMProviderType.GOOGLE:
-            raise NotImplementedError("Google Gemini provider coming soon")
-
-        else:
+        factory = _FACTORIES.get(provider_type)
+        if factory is None:
             raise ValueError(
                 f"Unknown provider: {provider_type}. "
                 f"Supported: anthropic, openai, ollama_local, llama_cpp"
             )
+        return factory(llm_config, model)
 
     @staticmethod
-    def list_available_providers() -> Dict[str, str]:
-        """List all available providers with descriptions"""
-        return {
+    @lru_cache(maxsize=1)
+    def list_available_providers() -> Mapping[str, str]:
+        """List all available providers with descriptions (built once, read-only)"""
+        return MappingProxyType({
             "anthropic": "Claude 3 Opus (Recommended - best for complex reasoning)",
             "openai": "GPT-4 Turbo (Fast - good for creative tasks)",
-            "ollama_local": "Local Ollama (Coming soon)",
-            "llama_cpp": "Local llama.cpp (Coming soon)",
+            "ollama_local": "Local Ollama (No API cost - OpenAI-compatible endpoint)",
+            "llama_cpp": "Local llama.cpp server (No API cost - OpenAI-compatible endpoint)",
             "github": "GitHub Models (Coming soon)",
             "google": "Google Gemini (Coming soon)",
-        }
+        })
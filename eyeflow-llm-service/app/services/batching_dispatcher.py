@@ -0,0 +1,173 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.providers.base import ILLMProvider
+from app.services.semantic_cache import context_namespace
+
+logger = logging.getLogger(__name__)
+
+# (aggregated_context, user_intent, future resolved with (rules_dict, tokens_used))
+_PendingRequest = Tuple[Dict[str, Any], str, asyncio.Future]
+
+
+class BatchingDispatcher:
+    """
+    Micro-batches concurrent single-intent generate_rules calls.
+
+    Calls arriving within `window_ms` of each other (up to `max_batch`)
+    that share the same context are sent as one generate_rules_batch call,
+    so the system prompt is paid once per batch instead of once per
+    intent. A call that finds no company waits at most one window.
+
+    Exposes the same generate_rules signature as a provider, so it can be
+    handed to ConstrainedGenerationService in place of one.
+    """
+
+    def __init__(self, provider: ILLMProvider, max_batch: int = 8, window_ms: int = 50):
+        self._provider = provider
+        self._max_batch = max_batch
+        self._window = window_ms / 1000
+        self._queue: "asyncio.Queue[_PendingRequest]" = asyncio.Queue()
+        self._collector: Optional[asyncio.Task] = None
+        self._closed = False
+        # Strong references so in-flight dispatches are not garbage collected
+        self._dispatches: Set[asyncio.Task] = set()
+
+    async def generate_rules(
+        self,
+        aggregated_context: Dict[str, Any],
+        user_intent: str,
+    ) -> Tuple[Dict[str, Any], int]:
+        """Queue the intent for the next batch and wait for its rules"""
+        if self._closed:
+            # Swapped out while this request was in flight; skip batching
+            return await self._provider.generate_rules(aggregated_context, user_intent)
+
+        if self._collector is None or self._collector.done():
+            self._collector = asyncio.create_task(self._collect())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((aggregated_context, user_intent, future))
+        return await future
+
+    async def close(self) -> None:
+        """
+        Stop collecting and drain: requests already queued are dispatched
+        and in-flight batches run to completion, so every waiter gets its
+        rules (or a regular error) before the provider is closed.
+        """
+        self._closed = True
+        if self._collector is not None:
+            self._collector.cancel()
+            try:
+                await self._collector
+            except asyncio.CancelledError:
+                pass
+
+        queued = []
+        while not self._queue.empty():
+            queued.append(self._queue.get_nowait())
+        self._dispatch_batch(queued)
+
+        await asyncio.gather(*self._dispatches, return_exceptions=True)
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                deadline = loop.time() + self._window
+                while len(batch) < self._max_batch:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+            finally:
+                # Also on close(): requests already taken off the queue must not be lost
+                self._dispatch_batch(batch)
+
+    def _dispatch_batch(self, batch: List[_PendingRequest]) -> None:
+        groups: Dict[bytes, List[_PendingRequest]] = defaultdict(list)
+        for request in batch:
+            groups[context_namespace(request[0])].append(request)
+
+        # Dispatch without blocking collection of the next window
+        for group in groups.values():
+            task = asyncio.create_task(self._dispatch(group))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, group: List[_PendingRequest]) -> None:
+        try:
+            await self._dispatch_group(group)
+        except asyncio.CancelledError:
+            # Waiters must not hang on futures nobody will resolve, nor see a
+            # CancelledError that request handlers do not catch
+            for _, _, future in group:
+                if not future.done():
+                    future.set_exception(RuntimeError("Rule generation batch was cancelled"))
+            raise
+
+    async def _dispatch_group(self, group: List[_PendingRequest]) -> None:
+        if len(group) == 1:
+            aggregated_context, user_intent, future = group[0]
+            await self._resolve(future, self._provider.generate_rules(aggregated_context, user_intent))
+            return
+
+        aggregated_context = group[0][0]
+        intents = [user_intent for _, user_intent, _ in group]
+        logger.info(f"📦 Micro-batching {len(intents)} concurrent intents")
+
+        try:
+            rules_list, tokens_used = await self._provider.generate_rules_batch(
+                aggregated_context, intents
+            )
+        except Exception as e:
+            logger.warning(f"⚠️  Micro-batch failed, retrying intents individually: {e}")
+            rules_list, tokens_used = [], 0
+
+        if len(rules_list) != len(group):
+            # Results cannot be matched to intents; fall back per intent
+            if rules_list:
+                logger.warning(
+                    f"⚠️  Micro-batch returned {len(rules_list)} results for "
+                    f"{len(group)} intents, retrying individually"
+                )
+            await asyncio.gather(
+                *(
+                    self._resolve(future, self._provider.generate_rules(context, user_intent))
+                    for context, user_intent, future in group
+                )
+            )
+            return
+
+        # Split the shared cost evenly across the batched requests; intents
+        # whose slot holds an error are retried on their own
+        share = tokens_used // len(group)
+        retries = []
+        for (context, user_intent, future), rules_dict in zip(group, rules_list):
+            if isinstance(rules_dict, Exception):
+                logger.warning(f"⚠️  Micro-batched intent failed, retrying individually: {rules_dict}")
+                retries.append(
+                    self._resolve(future, self._provider.generate_rules(context, user_intent))
+                )
+            elif not future.done():
+                future.set_result((rules_dict, share))
+        if retries:
+            await asyncio.gather(*retries)
+
+    @staticmethod
+    async def _resolve(future: asyncio.Future, call) -> None:
+        try:
+            result = await call
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
@@ -0,0 +1,161 @@
+import logging
+import re
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List
+
+from app.providers.base import CATALOG_DIGEST_KEY, catalog_digest
+
+logger = logging.getLogger(__name__)
+
+# Entries kept per filtered catalog section
+RELEVANT_TOP_K = 10
+
+# Bulky sections that only guide style; the type catalogs (conditions,
+# actions, triggers, variables) are always sent in full because the
+# constrained-generation allowlist and the model both need every entry.
+FILTERED_SECTIONS = ("examples", "resilience_patterns")
+
+# Fields kept per entry by compact_catalog; example payloads are dropped
+SIGNATURE_FIELDS = {
+    "condition_types": ("type", "category", "description"),
+    "action_types": ("type", "category", "description", "async"),
+    "trigger_types": ("type", "description"),
+    "resilience_patterns": ("type", "description", "applicableTo"),
+}
+VARIABLE_SIGNATURE_FIELDS = ("type", "description", "isReadOnly")
+
+# Number of distinct catalogs whose compact view is kept built
+COMPACT_CACHE_SIZE = 32
+
+# Source catalog digest -> (compacted sections, compacted digest), LRU order
+_compact_cache: "OrderedDict[bytes, tuple]" = OrderedDict()
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from if in into is it of on or the then "
+    "this to when with me my i we our you your all any".split()
+)
+
+
+@lru_cache(maxsize=4096)
+def _keywords(text: str) -> FrozenSet[str]:
+    """Lowercased word set of a text, minus stopwords"""
+    return frozenset(
+        word for word in _WORD_RE.findall(text.lower().replace("_", " "))
+        if word not in _STOPWORDS and len(word) > 1
+    )
+
+
+def _entry_text(entry: Dict[str, Any]) -> str:
+    return " ".join(
+        str(entry.get(field, ""))
+        for field in ("type", "name", "category", "description")
+    )
+
+
+def _top_k(entries: List[Any], query: FrozenSet[str], k: int) -> List[Any]:
+    """
+    Keep the k entries sharing the most keywords with the query.
+
+    Selected entries stay in catalog order so the same selection always
+    renders to the same prompt text (and hits the same prefix cache).
+    """
+    scored = [
+        (len(query & _keywords(_entry_text(entry))) if isinstance(entry, dict) else 0, i)
+        for i, entry in enumerate(entries)
+    ]
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    keep = sorted(i for _, i in scored[:k])
+    return [entries[i] for i in keep]
+
+
+def select_relevant_catalog(
+    aggregated_context: Dict[str, Any],
+    user_intent: str,
+    top_k: int = RELEVANT_TOP_K,
+) -> Dict[str, Any]:
+    """
+    Trim examples and resilience patterns to those relevant to the intent.
+
+    Keyword overlap between the intent and each entry's type, name,
+    category and description ranks the entries. Sections already within
+    top_k are left untouched, so small catalogs keep one shared prompt.
+
+    Returns:
+        A shallow copy of the context with filtered sections, or the
+        context itself if nothing needed trimming
+    """
+    query = _keywords(user_intent)
+    trimmed = {}
+    for section in FILTERED_SECTIONS:
+        entries = aggregated_context.get(section)
+        if isinstance(entries, list) and len(entries) > top_k:
+            trimmed[section] = _top_k(entries, query, top_k)
+
+    if not trimmed:
+        return aggregated_context
+
+    logger.info(
+        "🎯 Relevant catalog: "
+        + ", ".join(
+            f"{section} {len(entries)}/{len(aggregated_context[section])}"
+            for section, entries in trimmed.items()
+        )
+    )
+    filtered = {**aggregated_context, **trimmed}
+    # The ingestion-time digest describes the untrimmed catalog
+    filtered.pop(CATALOG_DIGEST_KEY, None)
+    return filtered
+
+
+def _signature(entry: Any, fields: tuple) -> Any:
+    if not isinstance(entry, dict):
+        return entry
+    return {field: entry[field] for field in fields if field in entry}
+
+
+def compact_catalog(aggregated_context: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reduce the type catalogs to signatures: type, category and description
+    (plus async, applicableTo or read-only flags), without example payloads.
+
+    Example payloads are most of the catalog's prompt tokens, while the
+    allowlist and the model only need the signatures. Worked examples in
+    "examples" are kept; select_relevant_catalog trims those. The compact
+    sections are built once per catalog digest and carry their own digest,
+    so they get their own cached prompt prefix.
+
+    Returns:
+        A shallow copy of the context with compacted sections
+    """
+    key = catalog_digest(aggregated_context)
+    cached = _compact_cache.get(key)
+    if cached is not None:
+        _compact_cache.move_to_end(key)
+        sections, digest = cached
+        return {**aggregated_context, **sections, CATALOG_DIGEST_KEY: digest}
+
+    sections: Dict[str, Any] = {}
+    for section, fields in SIGNATURE_FIELDS.items():
+        entries = aggregated_context.get(section)
+        if isinstance(entries, list):
+            sections[section] = [_signature(entry, fields) for entry in entries]
+
+    variables = aggregated_context.get("context_variables")
+    if isinstance(variables, dict):
+        sections["context_variables"] = {
+            name: _signature(var_def, VARIABLE_SIGNATURE_FIELDS)
+            for name, var_def in variables.items()
+        }
+
+    compacted = {**aggregated_context, **sections}
+    compacted.pop(CATALOG_DIGEST_KEY, None)
+    digest = catalog_digest(compacted)
+    compacted[CATALOG_DIGEST_KEY] = digest
+
+    _compact_cache[key] = (sections, digest)
+    if len(_compact_cache) > COMPACT_CACHE_SIZE:
+        _compact_cache.popitem(last=False)
+    return compacted
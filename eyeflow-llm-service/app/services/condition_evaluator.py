@@ -0,0 +1,210 @@
+import ast
+import logging
+import operator
+import re
+from functools import lru_cache
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# "$metrics.cpu" style context references and the uppercase boolean keywords
+_VARIABLE_RE = re.compile(r"\$([A-Za-z_][\w]*(?:\.[A-Za-z_][\w]*)*)")
+_KEYWORD_RE = re.compile(r"\b(AND|OR|NOT)\b")
+_KEYWORDS = {"AND": "and", "OR": "or", "NOT": "not"}
+
+# Bare identifiers with a fixed meaning; any other bare word is a context key
+# and string literals must be quoted
+_LITERAL_NAMES = {
+    "true": True,
+    "false": False,
+    "null": None,
+    "True": True,
+    "False": False,
+    "None": None,
+}
+
+_COMPARE_OPS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+}
+
+_BIN_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Mod: operator.mod,
+}
+
+_UNARY_OPS = {
+    ast.Not: operator.not_,
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+_MISSING = object()
+
+
+class UnsupportedCondition(Exception):
+    """Raised when a condition cannot be evaluated locally"""
+
+
+@lru_cache(maxsize=512)
+def _compile(condition: str) -> Tuple[ast.Expression, Tuple[str, ...], Tuple[str, ...]]:
+    """
+    Translate the condition DSL to a Python expression tree.
+
+    Returns the parsed tree, the context paths referenced by each
+    placeholder name (__v0, __v1, ...) and the bare names used as top-level
+    context keys. Raises UnsupportedCondition if the expression uses
+    anything outside the whitelisted node types.
+    """
+    paths = []
+
+    def _placeholder(match: re.Match) -> str:
+        paths.append(match.group(1))
+        return f"__v{len(paths) - 1}"
+
+    source = _VARIABLE_RE.sub(_placeholder, condition)
+    source = _KEYWORD_RE.sub(lambda m: _KEYWORDS[m.group(1)], source)
+
+    try:
+        tree = ast.parse(source.strip(), mode="eval")
+    except SyntaxError as e:
+        raise UnsupportedCondition(f"Unparseable condition: {e}")
+
+    placeholders = {f"__v{i}" for i in range(len(paths))}
+    names = []
+    for node in ast.walk(tree):
+        if (
+            isinstance(node, ast.Name)
+            and node.id not in placeholders
+            and node.id not in _LITERAL_NAMES
+            and node.id not in names
+        ):
+            names.append(node.id)
+        if not isinstance(
+            node,
+            (
+                ast.Expression, ast.BoolOp, ast.UnaryOp, ast.BinOp, ast.Compare,
+                ast.Name, ast.Constant, ast.List, ast.Tuple, ast.Load,
+                ast.And, ast.Or, *_COMPARE_OPS, *_BIN_OPS, *_UNARY_OPS,
+            ),
+        ):
+            raise UnsupportedCondition(
+                f"Unsupported expression: {type(node).__name__}"
+            )
+
+    return tree, tuple(paths), tuple(names)
+
+
+def _resolve(context: Dict[str, Any], path: str) -> Any:
+    """Resolve a dotted path against the context"""
+    value: Any = context
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return _MISSING
+        value = value.get(part, _MISSING)
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+def _is_number(value: Any) -> bool:
+    return type(value) in (int, float)
+
+
+def _eval_node(node: ast.AST, variables: Dict[str, Any]) -> Any:
+    if isinstance(node, ast.Expression):
+        return _eval_node(node.body, variables)
+
+    if isinstance(node, ast.Constant):
+        return node.value
+
+    if isinstance(node, ast.Name):
+        if node.id in variables:
+            return variables[node.id]
+        if node.id in _LITERAL_NAMES:
+            return _LITERAL_NAMES[node.id]
+        raise UnsupportedCondition(f"Unknown name: {node.id}")
+
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [_eval_node(elt, variables) for elt in node.elts]
+
+    if isinstance(node, ast.BoolOp):
+        if isinstance(node.op, ast.And):
+            return all(_eval_node(v, variables) for v in node.values)
+        return any(_eval_node(v, variables) for v in node.values)
+
+    if isinstance(node, ast.UnaryOp):
+        return _UNARY_OPS[type(node.op)](_eval_node(node.operand, variables))
+
+    if isinstance(node, ast.BinOp):
+        left = _eval_node(node.left, variables)
+        right = _eval_node(node.right, variables)
+        # Numbers only: on strings and lists * and + repeat and concatenate
+        # (unbounded allocation) and % formats
+        if not (_is_number(left) and _is_number(right)):
+            raise UnsupportedCondition("Arithmetic on non-numeric operands")
+        return _BIN_OPS[type(node.op)](left, right)
+
+    if isinstance(node, ast.Compare):
+        left = _eval_node(node.left, variables)
+        for op, comparator in zip(node.ops, node.comparators):
+            right = _eval_node(comparator, variables)
+            if not _COMPARE_OPS[type(op)](left, right):
+                return False
+            left = right
+        return True
+
+    raise UnsupportedCondition(f"Unsupported expression: {type(node).__name__}")
+
+
+def try_evaluate_condition(
+    condition: str,
+    context: Dict[str, Any],
+) -> Optional[bool]:
+    """
+    Evaluate a condition locally without calling an LLM.
+
+    Supports comparisons, arithmetic and AND/OR/NOT over "$path.to.value"
+    references and bare top-level keys of the context. String literals must
+    be quoted; an unquoted word missing from the context sends the
+    condition to the LLM.
+
+    Returns:
+        The boolean result, or None if the condition must go to the LLM
+        (unsupported syntax, unknown variable or incompatible operand types)
+    """
+    try:
+        tree, paths, names = _compile(condition)
+    except UnsupportedCondition as e:
+        logger.debug("Condition not locally evaluable: %s", e)
+        return None
+
+    variables = {}
+    for i, path in enumerate(paths):
+        value = _resolve(context, path)
+        if value is _MISSING:
+            logger.debug("Condition variable $%s not in context", path)
+            return None
+        variables[f"__v{i}"] = value
+
+    for name in names:
+        value = context.get(name, _MISSING)
+        if value is _MISSING:
+            logger.debug("Condition name %s not in context", name)
+            return None
+        variables[name] = value
+
+    try:
+        return bool(_eval_node(tree, variables))
+    except (UnsupportedCondition, TypeError, ValueError, ArithmeticError) as e:
+        logger.debug("Local condition evaluation failed: %s", e)
+        return None
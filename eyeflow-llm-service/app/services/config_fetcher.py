@@ -1,9 +1,14 @@
+import asyncio
 import logging
 import httpx
 import os
+import time
 from typing import Dict, Any, Optional
-from datetime import datetime, timedelta
-from config.settings import settings
+
+import orjson
+
+from config.settings import get_settings
+from app.services.single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
@@ -14,26 +19,62 @@ class LLMConfigFetcher:
     Ensures configuration is always centralized and up-to-date.
     """
 
-    def __init__(self, nestjs_base_url: str, user_id: str = "system"):
+    def __init__(
+        self,
+        nestjs_base_url: str,
+        user_id: str = "system",
+        config_ttl_minutes: int = 60,
+        http_client: Optional[httpx.AsyncClient] = None,
+    ):
         self.nestjs_base_url = nestjs_base_url
         self.user_id = user_id
         self.config: Optional[Dict[str, Any]] = None
-        self.config_timestamp: Optional[datetime] = None
-        self.config_ttl = timedelta(hours=1)
+        # time.monotonic() of the last fetch; immune to wall-clock jumps
+        self.config_timestamp: Optional[float] = None
+        self.config_ttl = config_ttl_minutes * 60.0  # seconds
+        # Past the TTL but within this age, the cached config is still served
+        # while a background refresh runs (stale-while-revalidate)
+        self.config_max_stale = 2 * self.config_ttl
+        # Concurrent refreshes share one GET to NestJS
+        self._inflight = SingleFlight()
+        self._background_refresh: Optional[asyncio.Task] = None
+        # Reused across fetches so refreshes ride a warm keep-alive connection.
+        # A client passed in is shared with other services and closed by its owner.
+        self._owns_http = http_client is None
+        self._http = http_client or httpx.AsyncClient(
+            timeout=10.0,
+            limits=httpx.Limits(
+                max_keepalive_connections=32,
+                max_connections=64,
+                keepalive_expiry=60,
+            ),
+        )
 
     async def get_llm_config(self, force_refresh: bool = False) -> Dict[str, Any]:
         """
         Get LLM configuration from NestJS.
-        Uses cache unless explicitly refreshed.
+        Uses cache unless explicitly refreshed; an expired config younger
+        than config_max_stale is returned immediately and refreshed in the
+        background.
 
         Returns:
             Dict with provider, model, and parameters
         """
         if not force_refresh and self._is_config_valid():
-            logger.debug(f"📦 Using cached LLM config (age: {self._get_config_age_seconds()}s)")
+            logger.debug("📦 Using cached LLM config (age: %ss)", self._get_config_age_seconds())
             return self.config
 
-        return await self._fetch_fresh_config()
+        if not force_refresh and self._is_config_stale_usable():
+            if self._background_refresh is None or self._background_refresh.done():
+                logger.debug("🔄 Serving stale LLM config, refreshing in background")
+                self._background_refresh = asyncio.create_task(self._refresh())
+            return self.config
+
+        return await self._refresh()
+
+    async def _refresh(self) -> Dict[str, Any]:
+        """Fetch fresh configuration, joining a fetch already in flight"""
+        return await self._inflight.do("config", self._fetch_fresh_config)
 
     async def _fetch_fresh_config(self) -> Dict[str, Any]:
         """Fetch fresh configuration from NestJS"""
@@ -41,16 +82,16 @@ class LLMConfigFetcher:
             endpoint = f"{self.nestjs_base_url}/llm-config/default"
             logger.info(f"🔄 Fetching LLM config from {endpoint}")
 
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(
-                    endpoint,
-                    headers={"X-User-ID": self.user_id},
-                )
-                response.raise_for_status()
+            response = await self._http.get(
+                endpoint,
+                headers={"X-User-ID": self.user_id},
+                timeout=10.0,
+            )
+            response.raise_for_status()
 
-            raw_config = response.json()
+            raw_config = orjson.loads(response.content)
             self.config = self._normalize_config(raw_config)
-            self.config_timestamp = datetime.now()
+            self.config_timestamp = time.monotonic()
 
             logger.info(
                 f"✅ LLM Config fetched: {self.config['provider']} - {self.config['model']}"
@@ -94,14 +135,18 @@ class LLMConfigFetcher:
         # Extract API key based on provider
         if provider == "openai":
             api_config = raw_config.get("apiConfig", {})
+            # Optional extra keys, used round-robin to spread rate limits
+            api_keys = [key for key in api_config.get("apiKeys") or [] if key]
             api_key = (
                 api_config.get("apiKey")
+                or (api_keys[0] if api_keys else None)
                 or os.getenv("OPENAI_API_KEY")
-                or settings.OPENAI_API_KEY
+                or get_settings().OPENAI_API_KEY
             )
             if not api_key:
                 logger.warning("⚠️  OpenAI API key not found in config, OPENAI_API_KEY env var, or settings")
             normalized["api_key"] = api_key
+            normalized["api_keys"] = api_keys
             normalized["api_url"] = api_config.get("apiUrl")
 
         elif provider == "anthropic":
@@ -109,7 +154,7 @@ class LLMConfigFetcher:
             api_key = (
                 api_config.get("apiKey") 
                 or os.getenv("ANTHROPIC_API_KEY")
-                or settings.ANTHROPIC_API_KEY
+                or get_settings().ANTHROPIC_API_KEY
             )
             if not api_key:
                 logger.warning("⚠️  Anthropic API key not found in config, ANTHROPIC_API_KEY env var, or settings")
@@ -125,23 +170,35 @@ class LLMConfigFetcher:
 
     def _is_config_valid(self) -> bool:
         """Check if cached config is still valid"""
-        if not self.config or not self.config_timestamp:
+        if not self.config or self.config_timestamp is None:
             return False
 
-        age = datetime.now() - self.config_timestamp
+        age = time.monotonic() - self.config_timestamp
         is_valid = age < self.config_ttl
 
         if not is_valid:
-            logger.debug(f"📍 Config expired ({age.total_seconds():.0f}s old)")
+            logger.debug("📍 Config expired (%.0fs old)", age)
 
         return is_valid
 
+    def _is_config_stale_usable(self) -> bool:
+        """Check if an expired config may still be served while refreshing"""
+        if not self.config or self.config_timestamp is None:
+            return False
+        return time.monotonic() - self.config_timestamp < self.config_max_stale
+
     def _get_config_age_seconds(self) -> int:
         """Get config age in seconds"""
-        if not self.config_timestamp:
+        if self.config_timestamp is None:
             return 0
-        age = datetime.now() - self.config_timestamp
-        return int(age.total_seconds())
+        return int(time.monotonic() - self.config_timestamp)
+
+    async def aclose(self):
+        """Stop background refreshes and close the HTTP client (called on application shutdown)"""
+        if self._background_refresh is not None:
+            self._background_refresh.cancel()
+        if self._owns_http:
+            await self._http.aclose()
 
     def invalidate_cache(self):
         """Manually invalidate config cache"""
@@ -17,7 +17,9 @@ Implementation strategy (no direct GPU token-level masking from Python HTTP API)
   3. Progressive constraint tightening — up to MAX_ATTEMPTS:
        • Attempt 1 : standard generation with allowlist in prompt
        • Attempt 2 : add explicit "FORBIDDEN tokens" list (hallucinated names from attempt 1)
-       • Attempt 3 : ultra-restricted prompt with only valid options enumerated
+       • Attempt 3 : same, with every name hallucinated so far forbidden
+     On large catalogs attempts 1 and 2 run concurrently and the first valid
+     one wins, saving a round trip when attempt 1 fails.
 
   4. Logit bias (OpenAI only) — when `tiktoken` is available, compute token IDs for
      known-invalid connector names and set logit_bias = -100 to suppress them.
@@ -27,18 +29,37 @@ Usage:
     result, tokens = await service.generate(user_intent, llm_provider)
 """
 
+import asyncio
 import json
 import logging
 import re
-from typing import Any, Dict, List, Optional, Set, Tuple
+import sys
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
 
 logger = logging.getLogger(__name__)
 
 # Maximum number of repair attempts before failing
 MAX_ATTEMPTS = 3
 
-# JSON Schema that all LLM outputs must conform to (§4.2 CatalogEntry output schema)
-WORKFLOW_RULES_SCHEMA = {
+# Attempts fired concurrently before falling back to serial repair
+SPECULATIVE_ATTEMPTS = 2
+
+# Allowlist size (connectors + action types + trigger sources) from which
+# first attempts are likely enough to fail that speculating pays off
+SPECULATION_MIN_ALLOWLIST = 50
+
+# JSON Schema that all LLM outputs must conform to (§4.2 CatalogEntry output schema).
+# Read-only: the validators below are compiled from it once per process.
+# Nested dicts are shared, never modify them; APIs that serialize the
+# schema get a plain-dict copy (dict(WORKFLOW_RULES_SCHEMA)).
+WORKFLOW_RULES_SCHEMA = MappingProxyType({
     "type": "object",
     "required": ["rules"],
     "properties": {
@@ -76,9 +97,176 @@ WORKFLOW_RULES_SCHEMA = {
         "summary": {"type": "string"},
         "confidence": {"type": "number", "minimum": 0, "maximum": 1},
     },
+})
+
+
+# OpenAI structured-output format for WORKFLOW_RULES_SCHEMA. Not strict:
+# strict mode needs closed objects with every property required, while the
+# schema leaves filters, payloads and rule fields open.
+RULES_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "workflow_rules",
+        "schema": dict(WORKFLOW_RULES_SCHEMA),
+        "strict": False,
+    },
 }
 
 
+# Constraint preamble pieces. Kept terse: the preamble is sent on every
+# attempt, and retries are marked with a "[RETRY n] " prefix
+_PREAMBLE_HEADER = (
+    "CATALOG CONSTRAINT: reference ONLY these identifiers; "
+    "anything else breaks compilation.\n"
+)
+
+_PREAMBLE_FOOTER = 'OUTPUT: raw JSON object with a "rules" array, no markdown or prose.\n'
+
+
+try:
+    import fastjsonschema
+
+    # Code-generated straight-line validator, compiled once per process
+    _FAST_VALIDATE = fastjsonschema.compile(dict(WORKFLOW_RULES_SCHEMA))
+except ImportError:
+    _FAST_VALIDATE = None
+
+try:
+    import jsonschema
+
+    # Compiled once; validators are reusable across calls
+    _RULES_VALIDATOR = jsonschema.Draft7Validator(dict(WORKFLOW_RULES_SCHEMA))
+except ImportError:
+    _RULES_VALIDATOR = None
+
+
+def schema_errors(rules_dict: Any) -> List[Dict[str, str]]:
+    """
+    Validate LLM output against WORKFLOW_RULES_SCHEMA.
+
+    Returns a list of {"loc": "rules.0.trigger", "msg": "..."} errors
+    (empty = valid). Valid output, the common case, is checked by the
+    fastjsonschema validator alone; invalid output is re-checked with
+    jsonschema to report every error to the repair prompt rather than only
+    the first. Falls back to a minimal manual check without either.
+    """
+    if _FAST_VALIDATE is not None:
+        try:
+            _FAST_VALIDATE(rules_dict)
+            return []
+        except fastjsonschema.JsonSchemaException as e:
+            if _RULES_VALIDATOR is None:
+                # path is ["data", "rules", 0, ...]
+                return [{"loc": ".".join(map(str, e.path[1:])), "msg": e.message}]
+
+    if _RULES_VALIDATOR is not None:
+        return [
+            {"loc": ".".join(map(str, e.absolute_path)), "msg": e.message}
+            for e in _RULES_VALIDATOR.iter_errors(rules_dict)
+        ]
+
+    # Manual minimal check
+    if not isinstance(rules_dict, dict):
+        return [{"loc": "", "msg": "Response is not a JSON object"}]
+    if "rules" not in rules_dict:
+        return [{"loc": "", "msg": "Missing required field: 'rules'"}]
+    if not isinstance(rules_dict["rules"], list):
+        return [{"loc": "rules", "msg": "Field 'rules' must be an array"}]
+    return []
+
+
+# Key under which precompute_allowlist stores a context's allowlist
+ALLOWLIST_KEY = "_allowlist"
+
+
+class CatalogAllowlist(NamedTuple):
+    """Catalog identifiers the LLM may reference, with their prompt blocks"""
+
+    # "connector_ids" / "action_types" / "trigger_sources" -> identifiers
+    ids: Dict[str, FrozenSet[str]]
+    # Sorted comma-separated lists for the constraint preamble
+    connector_block: str
+    action_block: str
+    trigger_block: str
+
+
+def _csv_list(names: FrozenSet[str]) -> str:
+    return ", ".join(sorted(names)) or "(none registered)"
+
+
+def build_allowlist(context: Dict[str, Any]) -> CatalogAllowlist:
+    """
+    Extract valid connector IDs, action types, and trigger sources
+    from the NestJS aggregated context.
+
+    Identifiers are interned, so successive context versions share one
+    copy of each name.
+    """
+    connectors = context.get("connectors") or ()
+    connector_ids = {
+        sys.intern(str(cid))
+        for conn in connectors
+        if (cid := conn.get("id") or conn.get("connector_id") or conn.get("name"))
+    }
+    action_types = {
+        sys.intern(str(fname))
+        for conn in connectors
+        for fn in conn.get("functions") or conn.get("actions") or ()
+        if (fname := fn.get("id") or fn.get("name") or fn.get("function_id"))
+    }
+
+    # Condition types (used as trigger source identifiers)
+    trigger_sources: Set[str] = set()
+    for ct in context.get("condition_types") or ():
+        if isinstance(ct, str):
+            trigger_sources.add(sys.intern(ct))
+        elif isinstance(ct, dict):
+            src = ct.get("id") or ct.get("type") or ct.get("name")
+            if src:
+                trigger_sources.add(sys.intern(str(src)))
+
+    # Expert agents as action prefixes
+    action_types.update(
+        sys.intern(str(aid))
+        for agent in context.get("expert_agents") or ()
+        if (aid := agent.get("id") or agent.get("name"))
+    )
+
+    ids = {
+        "connector_ids": frozenset(connector_ids),
+        "action_types": frozenset(action_types),
+        "trigger_sources": frozenset(trigger_sources),
+    }
+    return CatalogAllowlist(
+        ids=ids,
+        connector_block=_csv_list(ids["connector_ids"]),
+        action_block=_csv_list(ids["action_types"]),
+        trigger_block=_csv_list(ids["trigger_sources"]),
+    )
+
+
+def precompute_allowlist(aggregated_context: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Store the allowlist on a context that is reused across requests.
+
+    Built once when the context is ingested, from the full catalog; the
+    compact and intent-relevant views are shallow copies and keep it.
+    """
+    aggregated_context[ALLOWLIST_KEY] = build_allowlist(aggregated_context)
+    return aggregated_context
+
+
+def _trigger_source(rule: Dict[str, Any]) -> str:
+    """
+    Trigger source of a rule: {"trigger": {"source": ...}} per the schema,
+    or a bare event name when a model emits the trigger as a string.
+    """
+    trigger = rule.get("trigger")
+    if isinstance(trigger, dict):
+        return trigger.get("source", "")
+    return trigger if isinstance(trigger, str) else ""
+
+
 class ConstrainedGenerationService:
     """
     Wraps any ILLMProvider to enforce catalog-constrained generation.
@@ -90,12 +278,23 @@ class ConstrainedGenerationService:
 
     def __init__(self, aggregated_context: Dict[str, Any]) -> None:
         self._context = aggregated_context
-        self._allowlist = self._build_allowlist(aggregated_context)
+        # Precomputed once per cached context by precompute_allowlist
+        allowlist = aggregated_context.get(ALLOWLIST_KEY) or build_allowlist(aggregated_context)
+        self._allowlist = allowlist.ids
+        self._connector_block = allowlist.connector_block
+        self._action_block = allowlist.action_block
+        self._trigger_block = allowlist.trigger_block
+        # (forbidden names, attempt) -> preamble
+        self._preambles: Dict[Tuple[FrozenSet[str], int], str] = {}
         logger.debug(
-            f"[ConstrainedGen] Allowlist built — "
-            f"{len(self._allowlist['connector_ids'])} connectors, "
-            f"{len(self._allowlist['action_types'])} action types"
+            "[ConstrainedGen] Allowlist ready — %d connectors, %d action types",
+            len(self._allowlist["connector_ids"]),
+            len(self._allowlist["action_types"]),
         )
+        # No registered connectors, actions or triggers: nothing to enforce
+        self._enforce_allowlist = any(self._allowlist.values())
+        # First attempts never have forbidden names; render theirs up front
+        self._first_preamble = self._render_constraint_preamble(frozenset(), 1)
 
     # ──────────────────────────────────────────────────────────────────────────
     # Public API
@@ -114,44 +313,29 @@ class ConstrainedGenerationService:
         """
         forbidden_names: Set[str] = set()
         total_tokens = 0
+        first_serial_attempt = 1
 
-        for attempt in range(1, MAX_ATTEMPTS + 1):
-            logger.info(f"[ConstrainedGen] Attempt {attempt}/{MAX_ATTEMPTS}")
-
-            # Build augmented context with constraint annotations
-            augmented_context = self._augment_context(
-                self._context, forbidden_names, attempt
+        if self._should_speculate():
+            accepted, tokens = await self._speculative_attempts(
+                user_intent, llm_provider, forbidden_names
             )
+            total_tokens += tokens
+            if accepted is not None:
+                attempt, rules_dict = accepted
+                return self._accept(rules_dict, attempt, total_tokens, forbidden_names)
+            first_serial_attempt = SPECULATIVE_ATTEMPTS + 1
 
+        for attempt in range(first_serial_attempt, MAX_ATTEMPTS + 1):
             try:
-                rules_dict, tokens = await llm_provider.generate_rules(
-                    aggregated_context=augmented_context,
-                    user_intent=user_intent,
+                rules_dict, tokens, violating_names = await self._single_attempt(
+                    user_intent, llm_provider, attempt, forbidden_names
                 )
                 total_tokens += tokens
-
-                # Validate against catalog allowlist
-                violations = self._validate_against_allowlist(rules_dict)
-
-                if not violations:
-                    logger.info(
-                        f"[ConstrainedGen] ✅ Valid output on attempt {attempt} ({tokens} tokens)"
-                    )
-                    # Attach constraint metadata for NestJS
-                    rules_dict["_constrained"] = {
-                        "attempt": attempt,
-                        "total_tokens": total_tokens,
-                        "violations_repaired": list(forbidden_names),
-                    }
-                    return rules_dict, total_tokens
+                if not violating_names:
+                    return self._accept(rules_dict, attempt, total_tokens, forbidden_names)
 
                 # Collect violating names for next attempt
-                new_violations = {v["value"] for v in violations}
-                logger.warning(
-                    f"[ConstrainedGen] Attempt {attempt} produced "
-                    f"{len(violations)} catalog violation(s): {new_violations}"
-                )
-                forbidden_names.update(new_violations)
+                forbidden_names.update(violating_names)
 
             except Exception as exc:
                 logger.error(
@@ -172,65 +356,114 @@ class ConstrainedGenerationService:
         """
         Validate rules_dict against WORKFLOW_RULES_SCHEMA.
         Returns list of error messages (empty = valid).
-        Uses jsonschema if available, falls back to manual check.
         """
-        try:
-            import jsonschema
-            errors = list(jsonschema.Draft7Validator(WORKFLOW_RULES_SCHEMA).iter_errors(rules_dict))
-            return [e.message for e in errors]
-        except ImportError:
-            # Manual minimal check
-            if not isinstance(rules_dict, dict):
-                return ["Response is not a JSON object"]
-            if "rules" not in rules_dict:
-                return ["Missing required field: 'rules'"]
-            if not isinstance(rules_dict["rules"], list):
-                return ["Field 'rules' must be an array"]
-            return []
+        return [error["msg"] for error in schema_errors(rules_dict)]
 
     # ──────────────────────────────────────────────────────────────────────────
-    # Allowlist construction
+    # Attempts
     # ──────────────────────────────────────────────────────────────────────────
 
-    def _build_allowlist(self, context: Dict[str, Any]) -> Dict[str, Set[str]]:
+    def _should_speculate(self) -> bool:
+        """Large catalogs are where first attempts most often hallucinate"""
+        return sum(len(ids) for ids in self._allowlist.values()) >= SPECULATION_MIN_ALLOWLIST
+
+    async def _single_attempt(
+        self,
+        user_intent: str,
+        llm_provider: Any,
+        attempt: int,
+        forbidden_names: Set[str],
+    ) -> Tuple[Dict[str, Any], int, Set[str]]:
+        """Run one generation attempt; returns (rules_dict, tokens, violating names)"""
+        logger.info(f"[ConstrainedGen] Attempt {attempt}/{MAX_ATTEMPTS}")
+
+        # Build augmented context with constraint annotations
+        augmented_context = self._augment_context(
+            self._context, forbidden_names, attempt
+        )
+        rules_dict, tokens = await llm_provider.generate_rules(
+            aggregated_context=augmented_context,
+            user_intent=user_intent,
+        )
+
+        if not self._enforce_allowlist:
+            return rules_dict, tokens, set()
+
+        # Validate against catalog allowlist
+        violating_names, violations = self._validate_against_allowlist(rules_dict)
+        if violating_names:
+            logger.warning(
+                f"[ConstrainedGen] Attempt {attempt} produced "
+                f"{len(violating_names)} unknown catalog name(s): {violating_names}"
+            )
+            for violation in violations:
+                logger.debug("[ConstrainedGen] %s: %s", violation["field"], violation["message"])
+        return rules_dict, tokens, violating_names
+
+    async def _speculative_attempts(
+        self,
+        user_intent: str,
+        llm_provider: Any,
+        forbidden_names: Set[str],
+    ) -> Tuple[Optional[Tuple[int, Dict[str, Any]]], int]:
         """
-        Extract valid connector IDs, action types, and trigger sources
-        from the NestJS aggregated context.
+        Run the first SPECULATIVE_ATTEMPTS attempts concurrently.
+
+        Attempt 2 cannot know attempt 1's hallucinations yet, so it only
+        differs by its stronger constraint wording. The first valid result
+        wins and the other attempts are cancelled; violations from failed
+        attempts are added to forbidden_names for the serial attempts.
+
+        Returns ((attempt, rules_dict) or None, tokens used).
         """
-        connector_ids: Set[str] = set()
-        action_types: Set[str] = set()
-        trigger_sources: Set[str] = set()
-
-        # Connectors
-        for conn in context.get("connectors", []):
-            cid = conn.get("id") or conn.get("connector_id") or conn.get("name", "")
-            if cid:
-                connector_ids.add(str(cid))
-            for fn in conn.get("functions", []) or conn.get("actions", []) or []:
-                fname = fn.get("id") or fn.get("name") or fn.get("function_id", "")
-                if fname:
-                    action_types.add(str(fname))
-
-        # Condition types (used as trigger source identifiers)
-        for ct in context.get("condition_types", []) or []:
-            if isinstance(ct, str):
-                trigger_sources.add(ct)
-            elif isinstance(ct, dict):
-                src = ct.get("id") or ct.get("type") or ct.get("name", "")
-                if src:
-                    trigger_sources.add(str(src))
-
-        # Expert agents as action prefixes
-        for agent in context.get("expert_agents", []) or []:
-            aid = agent.get("id") or agent.get("name", "")
-            if aid:
-                action_types.add(str(aid))
+        async def run(attempt: int):
+            return attempt, await self._single_attempt(
+                user_intent, llm_provider, attempt, set()
+            )
 
-        return {
-            "connector_ids": connector_ids,
-            "action_types": action_types,
-            "trigger_sources": trigger_sources,
+        tasks = [
+            asyncio.create_task(run(attempt))
+            for attempt in range(1, SPECULATIVE_ATTEMPTS + 1)
+        ]
+        total_tokens = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    attempt, (rules_dict, tokens, violating_names) = await next_done
+                except Exception as exc:
+                    logger.error(f"[ConstrainedGen] Speculative attempt threw exception: {exc}")
+                    continue
+                total_tokens += tokens
+                if not violating_names:
+                    return (attempt, rules_dict), total_tokens
+                forbidden_names.update(violating_names)
+            return None, total_tokens
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    @staticmethod
+    def _accept(
+        rules_dict: Dict[str, Any],
+        attempt: int,
+        total_tokens: int,
+        forbidden_names: Set[str],
+    ) -> Tuple[Dict[str, Any], int]:
+        logger.info(
+            f"[ConstrainedGen] ✅ Valid output on attempt {attempt} ({total_tokens} tokens)"
+        )
+        # Attach constraint metadata for NestJS
+        rules_dict["_constrained"] = {
+            "attempt": attempt,
+            "total_tokens": total_tokens,
+            "violations_repaired": list(forbidden_names),
         }
+        return rules_dict, total_tokens
+
+    # ──────────────────────────────────────────────────────────────────────────
+    # Constraint preamble
+    # ──────────────────────────────────────────────────────────────────────────
 
     def _build_constraint_preamble(
         self,
@@ -238,55 +471,36 @@ class ConstrainedGenerationService:
         attempt: int,
     ) -> str:
         """
-        Build the constraint preamble injected at the TOP of the system prompt.
-        Strength increases with attempt number (§3.3 progressive tightening).
+        Build the constraint preamble injected ahead of the response format
+        in the system prompt (after the cacheable catalog prefix).
+        Retries are marked and list the forbidden names (§3.3 progressive tightening).
+        Memoized per (forbidden names, attempt) for the request.
         """
-        connector_list = "\n".join(
-            f"  - {cid}" for cid in sorted(self._allowlist["connector_ids"])
-        ) or "  (none registered)"
-
-        action_list = "\n".join(
-            f"  - {a}" for a in sorted(self._allowlist["action_types"])
-        ) or "  (none registered)"
-
-        trigger_list = "\n".join(
-            f"  - {t}" for t in sorted(self._allowlist["trigger_sources"])
-        ) or "  (none registered)"
-
-        forbidden_block = ""
+        key = (frozenset(forbidden_names), attempt)
+        preamble = self._preambles.get(key)
+        if preamble is None:
+            preamble = self._render_constraint_preamble(*key)
+            self._preambles[key] = preamble
+        return preamble
+
+    def _render_constraint_preamble(
+        self,
+        forbidden_names: FrozenSet[str],
+        attempt: int,
+    ) -> str:
+        parts = [
+            f"[RETRY {attempt - 1}] " if attempt > 1 else "",
+            _PREAMBLE_HEADER,
+            "CONNECTORS: ", self._connector_block,
+            "\nACTIONS: ", self._action_block,
+            "\nTRIGGERS: ", self._trigger_block,
+            "\n",
+        ]
         if forbidden_names:
-            forbidden_list = "\n".join(f"  - {n}" for n in sorted(forbidden_names))
-            forbidden_block = f"""
-═══ FORBIDDEN TOKENS (hallucinated — DO NOT USE) ═══
-The following identifiers do NOT exist in the catalog.
-Using any of them will cause immediate compilation failure.
-{forbidden_list}
-════════════════════════════════════════════════════
-"""
-
-        strength = ["IMPORTANT", "CRITICAL", "ABSOLUTE RULE"][attempt - 1]
-
-        return f"""
-╔══════════════════════════════════════════════════════════╗
-║         CATALOG CONSTRAINT — {strength}              ║
-╚══════════════════════════════════════════════════════════╝
-
-You MUST ONLY reference identifiers from the following ALLOWLIST.
-Generating any connector, action or trigger that is NOT on this list
-is a HARD ERROR that will break compilation.  No exceptions.
-
-ALLOWED CONNECTOR IDs:
-{connector_list}
-
-ALLOWED ACTION TYPES:
-{action_list}
-
-ALLOWED TRIGGER SOURCES:
-{trigger_list}
-{forbidden_block}
-REQUIRED OUTPUT FORMAT: valid JSON object with a "rules" array.
-No markdown. No prose. Raw JSON only.
-"""
+            # Hallucinated by earlier attempts
+            parts.extend(("FORBIDDEN (not in catalog): ", _csv_list(forbidden_names), "\n"))
+        parts.append(_PREAMBLE_FOOTER)
+        return "".join(parts)
 
     def _augment_context(
         self,
@@ -295,11 +509,13 @@ No markdown. No prose. Raw JSON only.
         attempt: int,
     ) -> Dict[str, Any]:
         """Return a shallow copy of context with constraint preamble injected."""
+        if attempt == 1 and not forbidden_names:
+            preamble = self._first_preamble
+        else:
+            preamble = self._build_constraint_preamble(forbidden_names, attempt)
         return {
             **context,
-            "_constraint_preamble": self._build_constraint_preamble(
-                forbidden_names, attempt
-            ),
+            "_constraint_preamble": preamble,
             "_attempt": attempt,
             "_max_attempts": MAX_ATTEMPTS,
         }
@@ -310,57 +526,88 @@ No markdown. No prose. Raw JSON only.
 
     def _validate_against_allowlist(
         self, rules_dict: Dict[str, Any]
-    ) -> List[Dict[str, str]]:
+    ) -> Tuple[Set[str], List[Dict[str, str]]]:
         """
-        Walk the rules dict and check every connector/action reference
-        against the allowlist.
+        Check every connector/action reference in the rules dict against
+        the allowlist.
+
+        References are gathered into one column per kind in a single walk,
+        then checked with set differences, so per-reference work stays in C.
 
-        Returns list of violation dicts: {"field": ..., "value": ..., "message": ...}
-        Empty list = fully valid.
+        Returns (violating names, violation dicts); empty set = fully valid.
+        Violation dicts ({"field": ..., "value": ..., "message": ...}) are
+        only built when debug logging is enabled.
         """
-        violations: List[Dict[str, str]] = []
         connector_ids = self._allowlist["connector_ids"]
         action_types = self._allowlist["action_types"]
         trigger_sources = self._allowlist["trigger_sources"]
 
         # If allowlist is empty (no connectors registered), skip validation
-        if not connector_ids and not action_types and not trigger_sources:
+        if not self._enforce_allowlist:
             logger.debug("[ConstrainedGen] Empty allowlist — skipping catalog validation")
-            return []
+            return set(), []
+
+        rules = rules_dict.get("rules", []) or []
+        actions = [
+            action for rule in rules for action in rule.get("actions", []) or []
+        ]
+
+        # Connector IDs are also accepted as trigger sources
+        bad_sources = (
+            {source for rule in rules if (source := _trigger_source(rule))}
+            - trigger_sources
+            - connector_ids
+            if trigger_sources
+            else set()
+        )
+        bad_actions = (
+            {atype for action in actions if (atype := action.get("type", ""))}
+            - action_types
+            if action_types
+            else set()
+        )
+        bad_connectors = (
+            {
+                connector
+                for action in actions
+                if (
+                    connector := (action.get("payload", {}) or {}).get("connector")
+                    or action.get("channel", "")
+                )
+            }
+            - connector_ids
+            if connector_ids
+            else set()
+        )
 
-        for rule in rules_dict.get("rules", []) or []:
-            # Validate trigger source
-            trigger = rule.get("trigger") or {}
-            source = trigger.get("source", "")
-            if source and trigger_sources and source not in trigger_sources and source not in connector_ids:
-                violations.append({
+        names = bad_sources | bad_actions | bad_connectors
+        violations: List[Dict[str, str]] = []
+        if names and logger.isEnabledFor(logging.DEBUG):
+            violations.extend(
+                {
                     "field": "trigger.source",
                     "value": source,
                     "message": f"Trigger source '{source}' not in catalog",
-                })
-
-            # Validate actions
-            for action in rule.get("actions", []) or []:
-                atype = action.get("type", "")
-                connector = (
-                    action.get("payload", {}) or {}
-                ).get("connector") or action.get("channel", "")
-
-                if atype and action_types and atype not in action_types:
-                    violations.append({
-                        "field": "action.type",
-                        "value": atype,
-                        "message": f"Action type '{atype}' not in catalog",
-                    })
-
-                if connector and connector_ids and connector not in connector_ids:
-                    violations.append({
-                        "field": "action.payload.connector",
-                        "value": connector,
-                        "message": f"Connector '{connector}' not registered",
-                    })
-
-        return violations
+                }
+                for source in sorted(bad_sources)
+            )
+            violations.extend(
+                {
+                    "field": "action.type",
+                    "value": atype,
+                    "message": f"Action type '{atype}' not in catalog",
+                }
+                for atype in sorted(bad_actions)
+            )
+            violations.extend(
+                {
+                    "field": "action.payload.connector",
+                    "value": connector,
+                    "message": f"Connector '{connector}' not registered",
+                }
+                for connector in sorted(bad_connectors)
+            )
+        return names, violations
 
 
 class ConstrainedGenerationError(Exception):
@@ -370,6 +617,21 @@ class ConstrainedGenerationError(Exception):
 
 # ── Logit bias helpers (OpenAI only) ─────────────────────────────────────────
 
+@lru_cache(maxsize=8)
+def _model_encoding(model: str) -> Optional[Any]:
+    """
+    Tokenizer for a model, loaded once per process.
+    None when tiktoken is missing or cannot load the encoding (offline).
+    """
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception as e:
+        logger.debug(f"[ConstrainedGen] No tokenizer for {model}: {e}")
+        return None
+
+
 def build_logit_bias_for_forbidden(
     forbidden_names: Set[str], model: str = "gpt-4"
 ) -> Dict[int, int]:
@@ -378,16 +640,14 @@ def build_logit_bias_for_forbidden(
     Requires `tiktoken` (installed alongside openai).
     Returns empty dict if tiktoken is unavailable.
     """
-    logit_bias: Dict[int, int] = {}
-    try:
-        import tiktoken
-
-        enc = tiktoken.encoding_for_model(model)
-        for name in forbidden_names:
-            # Encode the connector/action name and suppress first token
-            tokens = enc.encode(name)
-            if tokens:
-                logit_bias[tokens[0]] = -100  # spec: logit_bias = -100 for banned tokens
-    except Exception:
-        pass  # tiktoken not available — fall back to prompt-only constraints
-    return logit_bias
+    enc = _model_encoding(model)
+    if enc is None or not forbidden_names:
+        return {}  # fall back to prompt-only constraints
+    # Suppress the first token of each encoded connector/action name.
+    # Names are plain text: skip special-token scanning, which would also
+    # raise on a hallucinated name containing e.g. "<|endoftext|>"
+    return {
+        tokens[0]: -100  # spec: logit_bias = -100 for banned tokens
+        for tokens in enc.encode_ordinary_batch(sorted(forbidden_names))
+        if tokens
+    }
@@ -1,23 +1,82 @@
+import asyncio
 import logging
-import json
 import httpx
-from typing import Dict, Any, Optional
-from datetime import datetime, timedelta
+import time
+from typing import Dict, Any, Optional, Tuple
+
+import orjson
+
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import RedisError
+except ImportError:
+    aioredis = None
+    RedisError = OSError
+
+from app.providers.base import preserialize_examples, stamp_catalog_digest
+from app.services.constrained_generation import precompute_allowlist
+from app.services.single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
+# Fraction of the TTL after which the background refresher refetches,
+# so requests keep hitting a warm cache
+REFRESH_AHEAD_FRACTION = 0.9
+
+# Shared cache (Redis) keys: the raw context JSON, expiring with the TTL,
+# and the lock held by the worker refetching it from NestJS
+SHARED_CONTEXT_KEY = "eyeflow:ctx:agg"
+SHARED_LOCK_KEY = "eyeflow:ctx:agg:lock"
+# Longer than the NestJS request timeout, so a crashed holder cannot wedge refreshes
+SHARED_LOCK_TTL_SECONDS = 35
+# How long a worker waits for another worker's refetch before fetching itself
+SHARED_FETCH_WAIT_SECONDS = 10.0
+SHARED_POLL_SECONDS = 0.1
+
 
 class ContextCacheService:
     """
     Manages caching of aggregated context from NestJS server.
     Reduces API calls and improves performance.
+
+    With a Redis URL, the raw context is also shared between workers: one
+    worker refetches it from NestJS and the others read it from Redis.
     """
 
-    def __init__(self, nestjs_url: str, cache_ttl_minutes: int = 60):
+    def __init__(
+        self,
+        nestjs_url: str,
+        cache_ttl_minutes: int = 60,
+        redis_url: Optional[str] = None,
+        http_client: Optional[httpx.AsyncClient] = None,
+    ):
         self.nestjs_url = nestjs_url
-        self.cache_ttl = timedelta(minutes=cache_ttl_minutes)
+        self.cache_ttl = cache_ttl_minutes * 60.0  # seconds
         self.cached_context: Optional[Dict[str, Any]] = None
-        self.cache_timestamp: Optional[datetime] = None
+        # time.monotonic() of the last fetch; immune to wall-clock jumps
+        self.cache_timestamp: Optional[float] = None
+        # A burst of misses shares one fetch, and its result or error
+        self._inflight = SingleFlight()
+        self._refresher: Optional[asyncio.Task] = None
+        # Reused across fetches so refreshes ride a warm keep-alive connection;
+        # HTTP/2 is negotiated when NestJS is served over TLS. A client passed
+        # in is shared with other services and closed by its owner.
+        self._owns_http = http_client is None
+        self._http = http_client or httpx.AsyncClient(
+            http2=True,
+            timeout=30.0,
+            limits=httpx.Limits(
+                max_keepalive_connections=32,
+                max_connections=64,
+                keepalive_expiry=60,
+            ),
+        )
+        self._redis = None
+        if redis_url:
+            if aioredis is None:
+                logger.warning("⚠️  redis package not installed, context cache is per process")
+            else:
+                self._redis = aioredis.from_url(redis_url)
 
     async def get_aggregated_context(self) -> Dict[str, Any]:
         """
@@ -26,24 +85,62 @@ class ContextCacheService:
         Returns:
             Complete aggregated context with 20+ types
         """
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
         if self._is_cache_valid():
             logger.info(f"📦 Using cached context ({self._get_cache_age_minutes()}min old)")
             return self.cached_context
 
-        return await self._fetch_fresh_context()
+        return await self._refresh()
+
+    async def _refresh(self) -> Dict[str, Any]:
+        """Fetch fresh context, joining a fetch already in flight"""
+        return await self._inflight.do("context", self._fetch_fresh_context)
+
+    async def _refresh_loop(self) -> None:
+        """Refetch the context shortly before it expires, forever"""
+        while True:
+            await asyncio.sleep(self._seconds_until_refresh())
+
+            if self._seconds_until_refresh() > 0:
+                continue  # Refreshed by a request meanwhile
+            logger.debug("🔄 Refreshing context ahead of expiry")
+            fetched_at = self.cache_timestamp
+            try:
+                await self._refresh()
+            except Exception:
+                pass  # Already logged
+            refreshed = self.cache_timestamp != fetched_at
+
+            if not refreshed:
+                # NestJS unreachable; retry after a tenth of the TTL
+                await asyncio.sleep(self.cache_ttl * (1 - REFRESH_AHEAD_FRACTION))
+
+    def _seconds_until_refresh(self) -> float:
+        if self.cache_timestamp is None:
+            return 0.0
+        age = time.monotonic() - self.cache_timestamp
+        return max(self.cache_ttl * REFRESH_AHEAD_FRACTION - age, 0.0)
 
     async def _fetch_fresh_context(self) -> Dict[str, Any]:
-        """Fetch fresh context from NestJS server"""
+        """Fetch fresh context, from the shared cache when configured, else NestJS"""
         try:
-            endpoint = f"{self.nestjs_url}/tasks/manifest/llm-context/aggregated"
-            logger.info(f"🔄 Fetching aggregated context from {endpoint}")
-
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(endpoint)
-                response.raise_for_status()
+            age = 0.0
+            if self._redis is None:
+                raw = await self._fetch_from_nestjs()
+            else:
+                try:
+                    raw, age = await self._fetch_shared()
+                except RedisError as e:
+                    logger.warning(f"⚠️  Shared context cache unavailable: {e}")
+                    raw = await self._fetch_from_nestjs()
 
-            self.cached_context = response.json()
-            self.cache_timestamp = datetime.now()
+            self.cached_context = stamp_catalog_digest(
+                precompute_allowlist(preserialize_examples(orjson.loads(raw)))
+            )
+            # Backdated so a context read from Redis expires with the shared copy
+            self.cache_timestamp = time.monotonic() - age
 
             condition_count = len(
                 self.cached_context.get("conditionTypes", [])
@@ -62,30 +159,99 @@ class ContextCacheService:
                 return self.cached_context
             raise
 
+    async def _fetch_from_nestjs(self) -> bytes:
+        """GET the aggregated context from NestJS; returns the raw JSON"""
+        endpoint = "/tasks/manifest/llm-context/aggregated"
+        url = f"{self.nestjs_url}{endpoint}"
+        logger.info(f"🔄 Fetching aggregated context from {url}")
+
+        response = await self._http.get(url, timeout=30.0)
+        response.raise_for_status()
+        return response.content
+
+    async def _fetch_shared(self) -> Tuple[bytes, float]:
+        """
+        Read the context from Redis, or refetch it from NestJS when it is
+        missing or due for refresh. One worker holds the lock and refetches;
+        the others wait for its result.
+
+        Returns:
+            (raw JSON, age in seconds)
+        """
+        deadline = time.monotonic() + SHARED_FETCH_WAIT_SECONDS
+        while True:
+            raw, age = await self._read_shared()
+            if raw is not None and age < self.cache_ttl * REFRESH_AHEAD_FRACTION:
+                logger.debug("📦 Context read from shared cache (%.0fs old)", age)
+                return raw, age
+
+            if await self._redis.set(SHARED_LOCK_KEY, b"1", nx=True, ex=SHARED_LOCK_TTL_SECONDS):
+                try:
+                    raw = await self._fetch_from_nestjs()
+                    await self._redis.set(SHARED_CONTEXT_KEY, raw, ex=int(self.cache_ttl))
+                    return raw, 0.0
+                finally:
+                    await self._redis.delete(SHARED_LOCK_KEY)
+
+            if time.monotonic() >= deadline:
+                if raw is not None:
+                    return raw, age
+                logger.warning("⚠️  Shared context refetch is slow, fetching directly")
+                return await self._fetch_from_nestjs(), 0.0
+            await asyncio.sleep(SHARED_POLL_SECONDS)
+
+    async def _read_shared(self) -> Tuple[Optional[bytes], float]:
+        """Shared context and its age in seconds ((None, inf) when absent)"""
+        async with self._redis.pipeline(transaction=False) as pipe:
+            raw, remaining = await pipe.get(SHARED_CONTEXT_KEY).ttl(SHARED_CONTEXT_KEY).execute()
+        if raw is None or remaining < 0:
+            return None, float("inf")
+        return raw, max(self.cache_ttl - remaining, 0.0)
+
     def _is_cache_valid(self) -> bool:
         """Check if cache is still valid"""
-        if not self.cached_context or not self.cache_timestamp:
+        if not self.cached_context or self.cache_timestamp is None:
             return False
 
-        age = datetime.now() - self.cache_timestamp
+        age = time.monotonic() - self.cache_timestamp
         is_valid = age < self.cache_ttl
 
         if not is_valid:
             logger.info(
-                f"📍 Cache expired ({age.total_seconds():.0f}s old, TTL {self.cache_ttl.total_seconds():.0f}s)"
+                f"📍 Cache expired ({age:.0f}s old, TTL {self.cache_ttl:.0f}s)"
             )
 
         return is_valid
 
     def _get_cache_age_minutes(self) -> int:
         """Get cache age in minutes"""
-        if not self.cache_timestamp:
+        if self.cache_timestamp is None:
             return 0
-        age = datetime.now() - self.cache_timestamp
-        return int(age.total_seconds() / 60)
+        return int((time.monotonic() - self.cache_timestamp) / 60)
 
-    def invalidate_cache(self):
-        """Manually invalidate cache"""
+    async def aclose(self):
+        """Stop the refresher and close the HTTP clients (called on application shutdown)"""
+        if self._refresher is not None:
+            self._refresher.cancel()
+        if self._owns_http:
+            await self._http.aclose()
+        if self._redis is not None:
+            await self._redis.aclose()
+
+    async def invalidate_cache(self):
+        """
+        Manually invalidate cache, including the shared copy; other workers
+        keep their in-memory context until it expires. The refresher
+        restarts on the next request.
+        """
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
         self.cached_context = None
         self.cache_timestamp = None
+        if self._redis is not None:
+            try:
+                await self._redis.delete(SHARED_CONTEXT_KEY)
+            except RedisError as e:
+                logger.warning(f"⚠️  Could not clear shared context cache: {e}")
         logger.info("🗑️  Cache invalidated")
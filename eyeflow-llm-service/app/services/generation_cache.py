@@ -0,0 +1,88 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import orjson
+
+from app.providers.base import catalog_digest
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL_SECONDS = 600.0
+
+# (intent digest, catalog digest, verbose)
+GenerationKey = Tuple[bytes, bytes, bool]
+
+
+def generation_key(
+    user_intent: str,
+    aggregated_context: Dict[str, Any],
+    verbose: bool = False,
+) -> GenerationKey:
+    """Cache key for a /generate request: the intent, the catalog and the view"""
+    return (
+        hashlib.blake2b(user_intent.encode(), digest_size=16).digest(),
+        catalog_digest(aggregated_context),
+        verbose,
+    )
+
+
+class GenerationCache:
+    """
+    LRU + TTL cache of finished /generate results.
+
+    Sits in front of the whole generation pipeline (budget fitting,
+    constrained generation, repair), so a repeated intent against an
+    unchanged catalog skips the LLM entirely. Values are stored serialized
+    and decoded on every hit, so callers may mutate what they get back.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+    ):
+        self._max_entries = max_entries
+        self._ttl = ttl_seconds
+        # key -> (serialized rules, tokens used, time.monotonic() expiry), LRU order
+        self._entries: "OrderedDict[GenerationKey, Tuple[bytes, int, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: GenerationKey) -> Optional[Tuple[Dict[str, Any], int]]:
+        """Cached (rules_dict, tokens_used) for key, or None on a miss"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[2] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return orjson.loads(entry[0]), entry[1]
+            del self._entries[key]
+
+        self.misses += 1
+        return None
+
+    def put(self, key: GenerationKey, rules_dict: Dict[str, Any], tokens_used: int) -> None:
+        self._entries[key] = (
+            orjson.dumps(rules_dict, default=str),
+            tokens_used,
+            time.monotonic() + self._ttl,
+        )
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        logger.info("🗑️  Generation cache cleared")
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
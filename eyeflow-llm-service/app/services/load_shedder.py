@@ -0,0 +1,70 @@
+import logging
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Seconds clients are asked to wait before retrying a shed request
+RETRY_AFTER_SECONDS = 1
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+_OVERLOADED_BODY = orjson.dumps({"detail": "Service overloaded, retry shortly"})
+
+
+class InflightLimit:
+    """Shared in-flight request count, readable by /health"""
+
+    def __init__(self, max_inflight: int):
+        self.max_inflight = max_inflight
+        self.inflight = 0
+
+    @property
+    def saturated(self) -> bool:
+        return self.inflight >= self.max_inflight
+
+
+class LoadShedder:
+    """
+    ASGI middleware capping in-flight requests to the LLM endpoints.
+
+    Past limit.max_inflight, new requests to the guarded paths get an
+    immediate 503 with Retry-After instead of queueing behind slow LLM
+    calls. A request counts until its response has been fully sent, so
+    streamed batch responses hold their slot while they stream. Other
+    paths (health, cache, config) are never shed.
+    """
+
+    def __init__(self, app: ASGIApp, limit: InflightLimit, paths: Iterable[str]):
+        self.app = app
+        self._limit = limit
+        self._paths: FrozenSet[str] = frozenset(paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] not in self._paths:
+            await self.app(scope, receive, send)
+            return
+
+        limit = self._limit
+        if limit.saturated:
+            logger.warning(f"🚦 {limit.inflight} requests in flight, shedding {scope['path']}")
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"retry-after", str(RETRY_AFTER_SECONDS).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": _OVERLOADED_BODY})
+            return
+
+        limit.inflight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limit.inflight -= 1
@@ -0,0 +1,96 @@
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.providers.base import ILLMProvider, catalog_digest
+from app.services.catalog_relevance import compact_catalog, select_relevant_catalog
+
+logger = logging.getLogger(__name__)
+
+# Examples / resilience patterns kept per step once the default view is over budget
+FALLBACK_TOP_K = (5, 2, 0)
+
+# Number of (provider, catalog) prompt sizes kept
+TOKEN_COUNT_CACHE_SIZE = 256
+
+# (provider class, catalog digest) -> system prompt tokens, LRU order
+_token_counts: "OrderedDict[Tuple[type, bytes], int]" = OrderedDict()
+
+
+@lru_cache(maxsize=1)
+def _encoding() -> Optional[Any]:
+    """
+    cl100k_base tokenizer, loaded on first use.
+
+    tiktoken downloads the encoding on first load, so an offline host or a
+    missing package falls back to the character estimate.
+    """
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"⚠️  tiktoken unavailable, estimating prompt tokens: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Token count of text (cl100k_base, close enough for other models)"""
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 4  # ~4 characters per token
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def system_prompt_tokens(provider: ILLMProvider, aggregated_context: Dict[str, Any]) -> int:
+    """System prompt size for a context, counted once per provider and catalog"""
+    key = (type(provider), catalog_digest(aggregated_context))
+    tokens = _token_counts.get(key)
+    if tokens is not None:
+        _token_counts.move_to_end(key)
+        return tokens
+
+    tokens = count_tokens(provider._build_system_prompt(aggregated_context))
+    _token_counts[key] = tokens
+    if len(_token_counts) > TOKEN_COUNT_CACHE_SIZE:
+        _token_counts.popitem(last=False)
+    return tokens
+
+
+def fit_context_to_budget(
+    provider: ILLMProvider,
+    aggregated_context: Dict[str, Any],
+    user_intent: str,
+    budget: int,
+    verbose: bool = False,
+) -> Dict[str, Any]:
+    """
+    Pick the most detailed catalog view whose system prompt fits the budget.
+
+    Views, from most to least detailed: the full catalog (verbose only),
+    the compact intent-relevant view, then fewer and fewer examples and
+    resilience patterns. If none fits, the smallest view is used.
+    """
+    steps: List[Tuple[str, Callable[[], Dict[str, Any]]]] = []
+    if verbose:
+        steps.append(("full", lambda: aggregated_context))
+    compact = compact_catalog(aggregated_context)
+    steps.append(("compact", lambda: select_relevant_catalog(compact, user_intent)))
+    for top_k in FALLBACK_TOP_K:
+        steps.append(
+            (f"compact top {top_k}", lambda k=top_k: select_relevant_catalog(compact, user_intent, k))
+        )
+
+    for i, (label, build) in enumerate(steps):
+        context = build()
+        tokens = system_prompt_tokens(provider, context)
+        if tokens <= budget:
+            if i > 0:
+                logger.info(f"✂️  Prompt over budget, using {label} catalog ({tokens} tokens)")
+            return context
+
+    logger.warning(
+        f"⚠️  Smallest catalog view is still {tokens} tokens (budget {budget})"
+    )
+    return context
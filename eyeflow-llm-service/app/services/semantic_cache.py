@@ -0,0 +1,157 @@
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+import orjson
+
+from app.providers.base import catalog_digest
+from app.services.single_flight import request_key
+
+logger = logging.getLogger(__name__)
+
+# Cosine similarity at or above which two intents count as the same request
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+DEFAULT_MAX_ENTRIES = 1024
+
+Embedder = Callable[[str], Awaitable[List[float]]]
+
+
+def context_namespace(aggregated_context: Dict[str, Any]) -> bytes:
+    """
+    Cache namespace for a generation context: the catalog plus the
+    per-request constraint annotations that change the response.
+    """
+    return request_key(
+        catalog_digest(aggregated_context),
+        aggregated_context.get("_constraint_preamble"),
+        aggregated_context.get("_logit_bias"),
+    )
+
+
+class SemanticCache:
+    """
+    Two-tier response cache for LLM calls.
+
+    1. Exact tier: (namespace, text) lookup, no embedding needed.
+    2. Semantic tier: the text is embedded and compared against cached
+       texts in the same namespace; the best match at or above the
+       similarity threshold is a hit.
+
+    The namespace buckets entries by everything else that shapes the
+    response (typically the catalog digest), so a hit is only possible
+    against the same catalog. Values are stored serialized and decoded on
+    every hit, so callers may mutate what they get back.
+    """
+
+    def __init__(
+        self,
+        embed: Embedder,
+        threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self._embed = embed
+        self._threshold = threshold
+        self._max_entries = max_entries
+        # (namespace, text) -> (unit embedding or None, serialized value), LRU order
+        self._entries: OrderedDict = OrderedDict()
+        # text -> unit embedding, so a miss followed by put embeds only once
+        self._embeddings: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    async def get(self, text: str, namespace: bytes, semantic: bool = True) -> Optional[Any]:
+        """
+        Look up a cached value.
+
+        Args:
+            text: The request text (e.g. the user intent)
+            namespace: Digest of the rest of the request inputs
+            semantic: Also try the embedding-similarity tier on an exact miss
+
+        Returns:
+            The cached value, or None on a miss
+        """
+        key = (namespace, text)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return orjson.loads(entry[1])
+
+        if semantic:
+            vector = await self._embedding(text)
+            if vector is not None:
+                match = self._nearest(vector, namespace)
+                if match is not None:
+                    self.hits += 1
+                    self.semantic_hits += 1
+                    return orjson.loads(match)
+
+        self.misses += 1
+        return None
+
+    async def put(self, text: str, namespace: bytes, value: Any, semantic: bool = True) -> None:
+        """Cache a value; semantic entries are also searchable by similarity"""
+        vector = await self._embedding(text) if semantic else None
+        key = (namespace, text)
+        self._entries[key] = (vector, orjson.dumps(value, default=str))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._embeddings.clear()
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+        }
+
+    def _nearest(self, vector: np.ndarray, namespace: bytes) -> Optional[bytes]:
+        candidates = [
+            (entry_vector, value)
+            for (entry_namespace, _), (entry_vector, value) in self._entries.items()
+            if entry_namespace == namespace and entry_vector is not None
+        ]
+        if not candidates:
+            return None
+
+        # Embeddings are unit length, so the dot product is the cosine
+        scores = np.stack([entry_vector for entry_vector, _ in candidates]) @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self._threshold:
+            return None
+
+        logger.info(f"🧠 Semantic cache hit (similarity {scores[best]:.3f})")
+        return candidates[best][1]
+
+    async def _embedding(self, text: str) -> Optional[np.ndarray]:
+        vector = self._embeddings.get(text)
+        if vector is not None:
+            self._embeddings.move_to_end(text)
+            return vector
+
+        try:
+            raw = await self._embed(text)
+        except Exception as e:
+            # The cache is an optimization; never fail the request over it
+            logger.warning(f"⚠️  Embedding failed, skipping semantic cache: {e}")
+            return None
+
+        vector = np.asarray(raw, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        vector /= norm
+
+        self._embeddings[text] = vector
+        while len(self._embeddings) > self._max_entries:
+            self._embeddings.popitem(last=False)
+        return vector
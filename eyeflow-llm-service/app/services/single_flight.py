@@ -0,0 +1,62 @@
+import asyncio
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def request_key(*parts: Any) -> bytes:
+    """
+    Stable digest of a request's inputs, used to spot identical requests.
+
+    Dict keys are sorted so logically equal contexts hash the same.
+    """
+    return hashlib.blake2b(
+        orjson.dumps(
+            parts,
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS,
+            default=str,
+        ),
+        digest_size=16,
+    ).digest()
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution.
+
+    The first caller starts the coroutine in its own task; every caller,
+    the first included, awaits that task and receives its result (or
+    exception). Cancelling a caller never cancels the shared call, so the
+    others still get their answer.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run fn() for key unless an identical call is already in flight"""
+        task = self._inflight.get(key)
+        if task is not None:
+            logger.debug("🔗 Joining in-flight request")
+        else:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        # shield: a cancelled caller must not cancel the shared call
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark retrieved so a call whose callers all left does not log a warning
+            task.exception()
+
+    def __len__(self) -> int:
+        return len(self._inflight)
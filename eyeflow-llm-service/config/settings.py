@@ -1,3 +1,4 @@
+from functools import lru_cache
 from pydantic_settings import BaseSettings
 from typing import Optional
 
@@ -23,6 +24,37 @@ class Settings(BaseSettings):
     ANTHROPIC_API_KEY: Optional[str] = None
     OPENAI_API_KEY: Optional[str] = None
 
+    # Maximum concurrent requests a provider sends to its LLM API
+    LLM_MAX_CONCURRENCY: int = 10
+    # In-flight LLM endpoint requests per worker before new ones get a 503
+    MAX_INFLIGHT: int = 200
+    # Retries on 429/529 and other transient errors (SDK backoff, honours retry-after)
+    LLM_MAX_RETRIES: int = 4
+    # Request timeout for local OpenAI-compatible servers (Ollama, llama.cpp)
+    LOCAL_LLM_TIMEOUT_SECONDS: float = 300.0
+
+    # System prompt token budget for /generate; larger catalogs fall back
+    # to more compact views (roughly 75% of a 128K context window)
+    PROMPT_TOKEN_BUDGET: int = 96000
+
+    # Micro-batching of concurrent /generate calls (providers that batch in one prompt)
+    BATCH_WINDOW_MS: int = 50
+    MAX_COALESCE_BATCH: int = 8
+
+    # Response cache: intents whose embeddings are at least this similar
+    # reuse a cached result instead of calling the LLM
+    EMBEDDING_MODEL: str = "text-embedding-3-small"
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 1024
+
+    # Finished /generate results, keyed on (intent, catalog)
+    GENERATION_CACHE_MAX_ENTRIES: int = 1024
+    GENERATION_CACHE_TTL_SECONDS: float = 600.0
+
+    # Shared context cache across workers (e.g. redis://localhost:6379/0);
+    # unset keeps the cache per process
+    REDIS_URL: Optional[str] = None
+
     # Configuration Cache TTL
     CONFIG_FETCH_INTERVAL_MINUTES: int = 60
     CONTEXT_FETCH_INTERVAL_MINUTES: int = 60
@@ -32,5 +64,17 @@ class Settings(BaseSettings):
         case_sensitive = True
 
 
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """
+    Settings, read from the environment on first use.
+    Tests can override the environment and call get_settings.cache_clear().
+    """
+    return Settings()
+
 
+def __getattr__(name: str):
+    # Keeps `from config.settings import settings` working, lazily
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
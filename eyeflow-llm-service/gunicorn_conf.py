@@ -0,0 +1,27 @@
+"""
+Gunicorn configuration for production.
+
+    gunicorn -c gunicorn_conf.py main:app
+
+Each worker runs its own event loop (uvloop + httptools through uvicorn)
+and its own startup: LLM provider, context cache and config cache are per
+worker, so /cache/invalidate and /config/refresh only reach the worker
+that serves them.
+"""
+
+import multiprocessing
+import os
+
+from config.settings import get_settings
+
+_settings = get_settings()
+
+bind = f"{_settings.SERVER_HOST}:{_settings.SERVER_PORT}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Import the app once in the master; workers fork with modules loaded
+preload_app = True
+loglevel = _settings.LOG_LEVEL.lower()
+# Generation calls can take a while on large catalogs
+timeout = 120
+graceful_timeout = 30
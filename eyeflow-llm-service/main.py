@@ -1,16 +1,28 @@
+import atexit
 import logging
+import queue
 import time
+from logging.handlers import QueueHandler, QueueListener
 import json
+import httpx
 from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
-from typing import Optional, Dict, Any
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from typing import Optional, Dict, Any, List
 import asyncio
 
-from config.settings import settings
+import orjson
+
+from config.settings import get_settings
+from app.providers.base import stamp_catalog_digest
 from app.providers.registry import LLMProviderRegistry
+from app.providers.http_pool import aclose_llm_http_client
 from app.services.context_cache import ContextCacheService
 from app.services.config_fetcher import LLMConfigFetcher
 from app.services.constrained_generation import ConstrainedGenerationService, ConstrainedGenerationError
+from app.services.prompt_budget import fit_context_to_budget
+from app.services.batching_dispatcher import BatchingDispatcher
+from app.services.generation_cache import GenerationCache, generation_key
+from app.services.load_shedder import InflightLimit, LoadShedder
 from app.models.schemas import (
     GenerateRulesRequest,
     GenerateRulesResponse,
@@ -23,8 +35,17 @@ from app.models.schemas import (
     ProvidersListResponse,
 )
 
-# Logging setup
+settings = get_settings()
+
+# Logging setup: handlers write from a listener thread, so a slow stream
+# or file never blocks the event loop
 logging.basicConfig(level=settings.LOG_LEVEL)
+_root_logger = logging.getLogger()
+_log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_log_listener = QueueListener(_log_queue, *_root_logger.handlers, respect_handler_level=True)
+_root_logger.handlers = [QueueHandler(_log_queue)]
+_log_listener.start()
+atexit.register(_log_listener.stop)
 logger = logging.getLogger(__name__)
 
 # FastAPI app
@@ -32,18 +53,102 @@ app = FastAPI(
     title="Eyeflow LLM Service",
     description="Multi-provider LLM service for workflow rule generation",
     version="1.0.0",
+    # Rule sets can be large nested dicts; orjson encodes them several times faster
+    default_response_class=ORJSONResponse,
+)
+
+# Requests past MAX_INFLIGHT on the LLM endpoints are shed with a 503
+inflight_limit = InflightLimit(settings.MAX_INFLIGHT)
+app.add_middleware(
+    LoadShedder,
+    limit=inflight_limit,
+    paths=(
+        "/api/rules/generate",
+        "/api/rules/generate-batch",
+        "/api/conditions/evaluate",
+        "/api/rules/refine",
+    ),
 )
 
 # Global services
 llm_provider = None
 context_cache = None
 config_fetcher = None
+# Keep-alive HTTP/2 pool shared by the config fetcher and the context cache
+nestjs_http: Optional[httpx.AsyncClient] = None
+# Micro-batches concurrent /generate calls when the provider batches in one prompt
+rules_dispatcher = None
+# Serializes provider swaps by /config/refresh. Handlers read llm_provider
+# (and rules_dispatcher) once into locals, so a request never mixes providers.
+_provider_lock = asyncio.Lock()
+# Background startup task loading the provider and the context cache
+_warm_up_task: Optional[asyncio.Task] = None
+# (provider, {"root": ..., "providers": ...}) prebuilt by _static_responses
+_static_cache = None
+# Finished /generate results; cleared when the provider changes
+generation_cache = GenerationCache(
+    max_entries=settings.GENERATION_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.GENERATION_CACHE_TTL_SECONDS,
+)
+
+ROOT_ENDPOINTS = {
+    "health": "/health",
+    "providers": "/providers",
+    "generate_rules": "POST /api/rules/generate",
+    "batch_generate": "POST /api/rules/generate-batch",
+    "evaluate_condition": "POST /api/conditions/evaluate",
+    "refine_rules": "POST /api/rules/refine",
+    "refresh_config": "POST /config/refresh",
+}
+
+
+def _create_rules_dispatcher(provider) -> Optional[BatchingDispatcher]:
+    if not provider.batches_in_one_prompt:
+        return None
+    return BatchingDispatcher(
+        provider,
+        max_batch=settings.MAX_COALESCE_BATCH,
+        window_ms=settings.BATCH_WINDOW_MS,
+    )
+
+
+# Alternate top-level keys some providers use for the rules array
+_ALT_RULES_KEYS = ("generatedRules", "GeneratedRules", "generated_rules")
+
+
+def _normalize_rules_output(rules_dict: Any) -> Any:
+    """
+    Normalize output keys for backward compatibility with NestJS client.
+    Accepts {"rules": [...]}, the alternate keys above, or a bare array.
+    """
+    if type(rules_dict) is list:
+        return {"rules": rules_dict, "summary": "", "confidence": 0.9}
+    if not isinstance(rules_dict, dict):
+        return rules_dict
+
+    # Common case: provider already returned a 'rules' array
+    if type(rules_dict.get("rules")) is list:
+        return rules_dict
+
+    if not any(key in rules_dict for key in _ALT_RULES_KEYS):
+        return rules_dict
+    return {
+        "rules": next(
+            (rules_dict[key] for key in _ALT_RULES_KEYS if rules_dict.get(key)), []
+        ),
+        "summary": rules_dict.get("summary", ""),
+        "confidence": rules_dict.get("confidence", 0.9),
+    }
 
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize services on startup"""
-    global llm_provider, context_cache, config_fetcher
+    """
+    Initialize services on startup.
+    The LLM config and context cache are loaded in the background so the
+    server (and /health) is up before NestJS answers.
+    """
+    global context_cache, config_fetcher, nestjs_http, _warm_up_task
     import os
 
     logger.info("🚀 Starting Eyeflow LLM Service...")
@@ -52,43 +157,133 @@ async def startup_event():
     logger.info(f"🔑 ANTHROPIC_API_KEY in env: {bool(os.getenv('ANTHROPIC_API_KEY'))}")
     logger.info(f"🔑 ANTHROPIC_API_KEY in settings: {bool(settings.ANTHROPIC_API_KEY)}")
 
-    # Initialize config fetcher (fetches from NestJS)
+    nestjs_http = httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(10.0, connect=2.0),
+        limits=httpx.Limits(
+            max_keepalive_connections=64,
+            max_connections=128,
+            keepalive_expiry=60,
+        ),
+    )
+    config_fetcher = LLMConfigFetcher(
+        nestjs_base_url=settings.NESTJS_SERVER_URL,
+        user_id=settings.USER_ID,
+        config_ttl_minutes=settings.CONFIG_FETCH_INTERVAL_MINUTES,
+        http_client=nestjs_http,
+    )
+
+    # Initialize context cache
+    context_cache = ContextCacheService(
+        nestjs_url=settings.NESTJS_SERVER_URL,
+        cache_ttl_minutes=settings.CONTEXT_FETCH_INTERVAL_MINUTES,
+        redis_url=settings.REDIS_URL,
+        http_client=nestjs_http,
+    )
+    logger.info(f"✅ Context cache initialized (TTL: {settings.CONTEXT_FETCH_INTERVAL_MINUTES}min)")
+
+    _warm_up_task = asyncio.create_task(_warm_up())
+    logger.info("✅ Eyeflow LLM Service accepting requests (warming up in background)")
+
+
+async def _warm_up() -> None:
+    """Load the LLM provider and the aggregated context concurrently"""
+    await asyncio.gather(_init_llm_provider(), _warm_context_cache())
+    logger.info("✅ Eyeflow LLM Service ready!")
+
+
+async def _init_llm_provider() -> None:
+    global llm_provider, rules_dispatcher
+
+    # Fetch config from NestJS
     try:
-        config_fetcher = LLMConfigFetcher(
-            nestjs_base_url=settings.NESTJS_SERVER_URL,
-            user_id=settings.USER_ID,
-        )
         llm_config = await config_fetcher.get_llm_config()
         logger.info(f"✅ LLM Config loaded from NestJS: {llm_config}")
 
         # Create LLM provider from fetched config
-        llm_provider = LLMProviderRegistry.create(llm_config)
-        logger.info(f"✅ LLM Provider initialized: {llm_provider.name} ({llm_provider.model_name})")
+        provider = LLMProviderRegistry.create(llm_config)
+        logger.info(f"✅ LLM Provider initialized: {provider.name} ({provider.model_name})")
+        await provider.warm_up()
+        llm_provider = provider
+        rules_dispatcher = _create_rules_dispatcher(provider)
 
     except Exception as e:
         import traceback
         logger.error(f"⚠️  Failed to initialize LLM configuration: {str(e)}")
         logger.error(f"Traceback: {traceback.format_exc()}")
         logger.warning(
-            "Starting in LIMITED mode (health check only).\n"
+            "Running in LIMITED mode (health check only).\n"
             "Create LLM config via POST /llm-config (NestJS) to activate rule generation."
         )
-        llm_provider = None  # Allow startup without LLM provider
 
-    # Initialize context cache
-    context_cache = ContextCacheService(
-        nestjs_url=settings.NESTJS_SERVER_URL,
-        cache_ttl_minutes=settings.CONTEXT_FETCH_INTERVAL_MINUTES,
-    )
-    logger.info(f"✅ Context cache initialized (TTL: {settings.CONTEXT_FETCH_INTERVAL_MINUTES}min)")
 
-    # Warm up cache
+async def _warm_context_cache() -> None:
     try:
         await context_cache.get_aggregated_context()
     except Exception as e:
         logger.warning(f"⚠️  Could not warm up context cache on startup: {str(e)}")
 
-    logger.info("✅ Eyeflow LLM Service ready!")
+
+async def _wait_for_warm_up() -> None:
+    """
+    Hold a request that arrives during warm-up until the provider is loaded.
+    Shielded: a client disconnecting must not cancel the shared warm-up.
+    """
+    if _warm_up_task is not None and not _warm_up_task.done():
+        await asyncio.shield(_warm_up_task)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release shared resources on shutdown"""
+    if _warm_up_task is not None and not _warm_up_task.done():
+        _warm_up_task.cancel()
+        await asyncio.gather(_warm_up_task, return_exceptions=True)
+    if rules_dispatcher is not None:
+        await rules_dispatcher.close()
+    if llm_provider is not None:
+        await llm_provider.close()
+    if config_fetcher is not None:
+        await config_fetcher.aclose()
+    if context_cache is not None:
+        await context_cache.aclose()
+    if nestjs_http is not None:
+        await nestjs_http.aclose()
+    await aclose_llm_http_client()
+    logger.info("👋 Eyeflow LLM Service stopped")
+
+
+def _static_responses() -> Dict[str, Response]:
+    """
+    Serialized / and /providers bodies for the current provider.
+    Built once per provider; /config/refresh swaps the provider, which
+    triggers a rebuild on the next call.
+    """
+    global _static_cache
+    if _static_cache is None or _static_cache[0] is not llm_provider:
+        provider_name = llm_provider.name if llm_provider else "unknown"
+        model_name = llm_provider.model_name if llm_provider else "unknown"
+        bodies = {
+            "root": {
+                "service": "Eyeflow LLM Service",
+                "version": "1.0.0",
+                "llm_provider": provider_name,
+                "llm_model": model_name,
+                "endpoints": ROOT_ENDPOINTS,
+            },
+            "providers": ProvidersListResponse(
+                available_providers=LLMProviderRegistry.list_available_providers(),
+                current_provider=provider_name,
+            ).model_dump(),
+        }
+        _static_cache = (
+            llm_provider,
+            {
+                name: Response(content=orjson.dumps(body), media_type="application/json")
+                for name, body in bodies.items()
+            },
+        )
+    return _static_cache[1]
 
 
 @app.get("/health", response_model=HealthResponse)
@@ -96,25 +291,31 @@ async def health_check():
     """Health check endpoint"""
     cache_age = (
         context_cache._get_cache_age_minutes()
-        if context_cache and context_cache.cache_timestamp
+        if context_cache and context_cache.cache_timestamp is not None
         else None
     )
 
-    return HealthResponse(
-        status="healthy",
-        provider=llm_provider.name if llm_provider else "unknown",
-        model=llm_provider.model_name if llm_provider else "unknown",
-        context_cache_age_minutes=cache_age,
-    )
+    if llm_provider is not None and context_cache and context_cache.cached_context is not None:
+        status = "healthy"
+    elif _warm_up_task is not None and not _warm_up_task.done():
+        status = "warming"
+    else:
+        status = "degraded"
+
+    # Polled by liveness probes: skip response-model validation
+    return ORJSONResponse({
+        "status": status,
+        "provider": llm_provider.name if llm_provider else "unknown",
+        "model": llm_provider.model_name if llm_provider else "unknown",
+        "context_cache_age_minutes": cache_age,
+        "inflight_requests": inflight_limit.inflight,
+    })
 
 
 @app.get("/providers", response_model=ProvidersListResponse)
 async def list_providers():
     """List available LLM providers"""
-    return ProvidersListResponse(
-        available_providers=LLMProviderRegistry.list_available_providers(),
-        current_provider=llm_provider.name if llm_provider else "unknown",
-    )
+    return _static_responses()["providers"]
 
 
 @app.post("/api/rules/generate", response_model=GenerateRulesResponse)
@@ -130,16 +331,41 @@ async def generate_rules(request: GenerateRulesRequest):
     4. Returns production-ready workflow JSON guaranteed to reference only
        catalog-registered connectors/actions
     """
-    start_time = time.time()
+    start_time = time.perf_counter_ns()
 
     try:
         logger.info(f"📝 Generating rules for intent: {request.user_intent[:100]}...")
+        await _wait_for_warm_up()
+        provider, dispatcher = llm_provider, rules_dispatcher
 
         # Use provided context or fetch fresh
         context = request.aggregated_context
         if not context or not context.get("condition_types"):
             logger.info("📦 Fetching fresh aggregated context from NestJS...")
             context = await context_cache.get_aggregated_context()
+        else:
+            # Hash the caller's catalog once; every cache below reads the stamp
+            stamp_catalog_digest(context)
+
+        cache_key = generation_key(request.user_intent, context, request.verbose)
+        cached = generation_cache.get(cache_key)
+        if cached is not None:
+            generation_time_ms = (time.perf_counter_ns() - start_time) // 1_000_000
+            logger.info(f"📦 Rules served from generation cache in {generation_time_ms}ms")
+            return ORJSONResponse({
+                "workflow_rules": cached[0],
+                "model_used": provider.model_name,
+                "tokens_used": 0,
+                "generation_time_ms": generation_time_ms,
+            })
+
+        context = fit_context_to_budget(
+            provider,
+            context,
+            request.user_intent,
+            budget=settings.PROMPT_TOKEN_BUDGET,
+            verbose=request.verbose,
+        )
 
         # ── Constrained generation (spec §3.3) ────────────────────────────────
         # ConstrainedGenerationService wraps the provider call with:
@@ -150,52 +376,41 @@ async def generate_rules(request: GenerateRulesRequest):
         try:
             rules_dict, tokens_used = await constrained.generate(
                 user_intent=request.user_intent,
-                llm_provider=llm_provider,
+                llm_provider=dispatcher or provider,
             )
             logger.info("[ConstrainedGen] Generation succeeded with catalog compliance")
         except ConstrainedGenerationError as cge:
             logger.warning(
                 f"[ConstrainedGen] All repair attempts failed, falling back to unconstrained: {cge}"
             )
-            # Graceful fallback: run without constraints rather than returning 500
-            rules_dict, tokens_used = await llm_provider.generate_rules(
+            # Graceful fallback: run without constraints rather than returning 500;
+            # the result may reference unknown connectors, so it is not cached
+            cache_key = None
+            rules_dict, tokens_used = await provider.generate_rules(
                 aggregated_context=context,
                 user_intent=request.user_intent,
             )
 
-        # Normalize output keys for backward compatibility with NestJS client
-        # Accept multiple possible key formats produced by providers (generatedRules, GeneratedRules, generated_rules)
-        if isinstance(rules_dict, dict):
-            if 'generatedRules' in rules_dict or 'GeneratedRules' in rules_dict or 'generated_rules' in rules_dict:
-                rules_list = rules_dict.get('generatedRules') or rules_dict.get('GeneratedRules') or rules_dict.get('generated_rules') or []
-                rules_dict = {
-                    'rules': rules_list,
-                    'summary': rules_dict.get('summary', ''),
-                    'confidence': rules_dict.get('confidence', 0.9),
-                }
-            # If provider already returned 'rules' key, keep as-is
-            elif 'rules' in rules_dict and isinstance(rules_dict.get('rules'), list):
-                pass
-            else:
-                # If top-level is already an array of rules, normalize that too
-                if isinstance(rules_dict, list):
-                    rules_dict = { 'rules': rules_dict, 'summary': '', 'confidence': 0.9 }
-
-
-        generation_time_ms = int((time.time() - start_time) * 1000)
+        rules_dict = _normalize_rules_output(rules_dict)
+        if cache_key is not None:
+            generation_cache.put(cache_key, rules_dict, tokens_used)
+
+        generation_time_ms = (time.perf_counter_ns() - start_time) // 1_000_000
 
         logger.info(
             f"✅ Rules generated in {generation_time_ms}ms using {tokens_used} tokens"
         )
 
-        return GenerateRulesResponse(
-            workflow_rules=rules_dict,
-            model_used=llm_provider.model_name,
-            tokens_used=tokens_used,
-            generation_time_ms=generation_time_ms,
-        )
+        # Built from trusted data: returning a Response skips FastAPI's
+        # response_model revalidation (the model still documents the schema)
+        return ORJSONResponse({
+            "workflow_rules": rules_dict,
+            "model_used": provider.model_name,
+            "tokens_used": tokens_used,
+            "generation_time_ms": generation_time_ms,
+        })
 
-    except json.JSONDecodeError as e:
+    except json.JSONDecodeError as e:  # orjson.JSONDecodeError subclasses it
         logger.error(f"❌ Invalid JSON in response: {str(e)}")
         raise HTTPException(
             status_code=422,
@@ -214,41 +429,108 @@ async def generate_rules_batch(request: GenerateRulesBatchRequest):
     """
     Generate multiple workflow rules efficiently in batch.
 
+    The response is streamed: each rule set is written as soon as it is
+    generated (providers that batch in one prompt) or serialized. rules[i]
+    always answers intents[i]: an intent that failed gets null and an
+    {"index", "msg"} entry in "errors". A failure mid-stream fills the
+    remaining slots the same way and also sets "error".
+
     Returns:
-        List of workflow rule objects
+        List of workflow rule objects, one per intent
     """
-    start_time = time.time()
+    start_time = time.perf_counter_ns()
 
     try:
         logger.info(f"📚 Batch generating {len(request.intents)} rule sets...")
+        await _wait_for_warm_up()
 
         context = request.aggregated_context
         if not context or not context.get("condition_types"):
             logger.info("📦 Fetching fresh context for batch generation...")
             context = await context_cache.get_aggregated_context()
+        else:
+            stamp_catalog_digest(context)
+
+        provider = llm_provider
+        usage: Dict[str, int] = {}
+        if request.priority != "offline" and provider.batches_in_one_prompt and hasattr(
+            provider, "stream_rules_batch"
+        ):
+            rules = provider.stream_rules_batch(context, request.intents, usage=usage)
+            # Fail with a 500 rather than mid-stream if the call cannot start
+            try:
+                first = [await rules.__anext__()]
+            except StopAsyncIteration:
+                first = []
+        else:
+            generate_batch = (
+                provider.generate_rules_batch_offline
+                if request.priority == "offline"
+                else provider.generate_rules_batch
+            )
+            first, usage["tokens"] = await generate_batch(
+                aggregated_context=context,
+                intents=request.intents,
+            )
+            rules = None
 
-        rules_list, tokens_used = await llm_provider.generate_rules_batch(
-            aggregated_context=context,
-            intents=request.intents,
-        )
+    except Exception as e:
+        logger.error(f"❌ Batch generation failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    intent_count = len(request.intents)
 
-        generation_time_ms = int((time.time() - start_time) * 1000)
+    async def body():
+        # {"rules": [...], "count": ..., ...}, each rule set sent as it is ready
+        count = 0
+        error = None
+        errors: List[Dict[str, Any]] = []
 
+        def slot(rules_dict) -> bytes:
+            nonlocal count
+            if isinstance(rules_dict, Exception):
+                errors.append({"index": count, "msg": str(rules_dict)})
+                rules_dict = None
+            count += 1
+            return (b"," if count > 1 else b"") + orjson.dumps(rules_dict)
+
+        yield b'{"rules":['
+        try:
+            for rules_dict in first:
+                if count < intent_count:
+                    yield slot(rules_dict)
+            if rules is not None:
+                async for rules_dict in rules:
+                    if count < intent_count:
+                        yield slot(rules_dict)
+        except Exception as e:
+            logger.error(f"❌ Batch generation failed after {count} rule sets: {str(e)}")
+            error = str(e)
+        finally:
+            if rules is not None:
+                await rules.aclose()
+
+        while count < intent_count:
+            yield slot(ValueError(error or f"No rule set generated for intent {count}"))
+
+        generation_time_ms = (time.perf_counter_ns() - start_time) // 1_000_000
         logger.info(
-            f"✅ Batch generated {len(rules_list)} rule sets in {generation_time_ms}ms"
+            f"✅ Batch generated {count - len(errors)}/{count} rule sets in {generation_time_ms}ms"
         )
 
-        return {
-            "count": len(rules_list),
-            "rules": rules_list,
-            "model_used": llm_provider.model_name,
-            "tokens_used": tokens_used,
+        tail = {
+            "count": count,
+            "model_used": provider.model_name,
+            "tokens_used": usage.get("tokens", 0),
             "generation_time_ms": generation_time_ms,
         }
+        if errors:
+            tail["errors"] = errors
+        if error is not None:
+            tail["error"] = error
+        yield b"]," + orjson.dumps(tail)[1:]
 
-    except Exception as e:
-        logger.error(f"❌ Batch generation failed: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(body(), media_type="application/json")
 
 
 @app.post("/api/conditions/evaluate", response_model=EvaluateConditionResponse)
@@ -260,18 +542,20 @@ async def evaluate_condition(request: EvaluateConditionRequest):
     """
     try:
         logger.info(f"📊 Evaluating condition: {request.condition[:100]}...")
+        await _wait_for_warm_up()
+        provider = llm_provider
 
-        result = await llm_provider.evaluate_condition(
+        result = await provider.evaluate_condition(
             condition=request.condition,
             context=request.context,
         )
 
         logger.info(f"✅ Condition evaluated: {request.condition} -> {result}")
 
-        return EvaluateConditionResponse(
-            result=result,
-            provider_used=llm_provider.name,
-        )
+        return ORJSONResponse({
+            "result": result,
+            "provider_used": provider.name,
+        })
 
     except Exception as e:
         logger.error(f"❌ Condition evaluation failed: {str(e)}")
@@ -285,26 +569,28 @@ async def refine_rules(request: RefineRulesRequest):
 
     Improves rules iteratively through conversation.
     """
-    start_time = time.time()
+    start_time = time.perf_counter_ns()
 
     try:
         logger.info(f"🔄 Refining rules based on feedback: {request.feedback[:100]}...")
+        await _wait_for_warm_up()
+        provider = llm_provider
 
-        refined_rules, tokens_used = await llm_provider.refine_rules(
+        refined_rules, tokens_used = await provider.refine_rules(
             current_rules=request.current_rules,
             feedback=request.feedback,
             aggregated_context=request.aggregated_context,
         )
 
-        generation_time_ms = int((time.time() - start_time) * 1000)
+        generation_time_ms = (time.perf_counter_ns() - start_time) // 1_000_000
 
         logger.info(f"✅ Rules refined in {generation_time_ms}ms")
 
-        return RefineRulesResponse(
-            refined_rules=refined_rules,
-            tokens_used=tokens_used,
-            changes_summary=f"Rules refined based on feedback: {request.feedback[:200]}",
-        )
+        return ORJSONResponse({
+            "refined_rules": refined_rules,
+            "tokens_used": tokens_used,
+            "changes_summary": f"Rules refined based on feedback: {request.feedback[:200]}",
+        })
 
     except Exception as e:
         logger.error(f"❌ Rule refinement failed: {str(e)}")
@@ -315,32 +601,50 @@ async def refine_rules(request: RefineRulesRequest):
 async def invalidate_cache():
     """Manually invalidate context cache"""
     if context_cache:
-        context_cache.invalidate_cache()
+        await context_cache.invalidate_cache()
         return {"status": "context cache invalidated"}
     raise HTTPException(status_code=500, detail="Cache service not initialized")
 
 
+@app.post("/cache/generate/invalidate")
+async def invalidate_generation_cache():
+    """Drop all cached /generate results"""
+    generation_cache.clear()
+    return {"status": "generation cache invalidated"}
+
+
 @app.post("/config/refresh")
 async def refresh_llm_config():
     """Manually refresh LLM configuration from NestJS"""
-    global llm_provider
+    global llm_provider, rules_dispatcher
 
     if not config_fetcher:
         raise HTTPException(status_code=500, detail="Config fetcher not initialized")
 
     try:
         logger.info("🔄 Refreshing LLM configuration from NestJS...")
-        config_fetcher.invalidate_cache()
-        llm_config = await config_fetcher.get_llm_config(force_refresh=True)
-
-        # Recreate provider with new config
-        llm_provider = LLMProviderRegistry.create(llm_config)
-        logger.info(f"✅ LLM config refreshed: {llm_provider.name} ({llm_provider.model_name})")
+        # Startup must not install its provider over the refreshed one
+        await _wait_for_warm_up()
+        async with _provider_lock:
+            config_fetcher.invalidate_cache()
+            llm_config = await config_fetcher.get_llm_config(force_refresh=True)
+
+            # Recreate provider with new config; warm it up before it takes traffic
+            provider = LLMProviderRegistry.create(llm_config)
+            await provider.warm_up()
+            previous_provider, previous_dispatcher = llm_provider, rules_dispatcher
+            llm_provider, rules_dispatcher = provider, _create_rules_dispatcher(provider)
+            generation_cache.clear()
+            if previous_dispatcher is not None:
+                await previous_dispatcher.close()
+            if previous_provider is not None:
+                await previous_provider.close()
+        logger.info(f"✅ LLM config refreshed: {provider.name} ({provider.model_name})")
 
         return {
             "status": "LLM config refreshed",
-            "provider": llm_provider.name,
-            "model": llm_provider.model_name,
+            "provider": provider.name,
+            "model": provider.model_name,
         }
     except Exception as e:
         logger.error(f"❌ Failed to refresh config: {str(e)}")
@@ -356,29 +660,18 @@ async def cache_status():
     return {
         "is_valid": context_cache._is_cache_valid(),
         "age_minutes": context_cache._get_cache_age_minutes(),
-        "ttl_minutes": int(context_cache.cache_ttl.total_seconds() / 60),
+        "ttl_minutes": int(context_cache.cache_ttl / 60),
         "has_context": context_cache.cached_context is not None,
+        "generation_cache": generation_cache.stats,
+        # Cumulative LLM token usage incl. prompt-cache reads, when tracked
+        "llm_usage": getattr(llm_provider, "usage_stats", None),
     }
 
 
 @app.get("/")
 async def root():
     """Root endpoint"""
-    return {
-        "service": "Eyeflow LLM Service",
-        "version": "1.0.0",
-        "llm_provider": llm_provider.name if llm_provider else "unknown",
-        "llm_model": llm_provider.model_name if llm_provider else "unknown",
-        "endpoints": {
-            "health": "/health",
-            "providers": "/providers",
-            "generate_rules": "POST /api/rules/generate",
-            "batch_generate": "POST /api/rules/generate-batch",
-            "evaluate_condition": "POST /api/conditions/evaluate",
-            "refine_rules": "POST /api/rules/refine",
-            "refresh_config": "POST /config/refresh",
-        },
-    }
+    return _static_responses()["root"]
 
 
 if __name__ == "__main__":
@@ -390,4 +683,6 @@ if __name__ == "__main__":
         port=settings.SERVER_PORT,
         reload=settings.DEBUG,
         log_level=settings.LOG_LEVEL.lower(),
+        loop="auto",  # uvloop when installed, asyncio otherwise (Windows)
+        http="auto",  # httptools when installed, h11 otherwise
     )
@@ -0,0 +1,22 @@
+import json
+
+import pytest
+
+from app.providers.anthropic_provider import AnthropicProvider
+
+extract_json = AnthropicProvider._extract_json
+
+
+def test_fenced_object_with_trailing_prose():
+    text = '```json\n{"rules": [{"name": "a"}], "summary": "s"}\n```\nHope this helps!'
+    assert extract_json(None, text) == {"rules": [{"name": "a"}], "summary": "s"}
+
+
+def test_truncated_output_raises_instead_of_returning_a_nested_object():
+    text = '{"rules": [{"name": "a", "actions": [{"action": "notify", "params": {"to": "ops"}}, {"act'
+    with pytest.raises(json.JSONDecodeError):
+        extract_json(None, text)
+
+
+def test_array_expected():
+    assert extract_json(None, 'Here you go: [{"rules": []}]', list) == [{"rules": []}]
@@ -0,0 +1,65 @@
+import asyncio
+
+from app.services.batching_dispatcher import BatchingDispatcher
+
+CONTEXT = {"condition_types": [{"id": "task_overdue"}]}
+
+
+class SlowProvider:
+    """Answers after a delay; batches echo each intent back"""
+
+    async def generate_rules(self, aggregated_context, user_intent):
+        await asyncio.sleep(0.05)
+        return {"intent": user_intent}, 10
+
+    async def generate_rules_batch(self, aggregated_context, intents):
+        await asyncio.sleep(0.05)
+        return [{"intent": intent} for intent in intents], 10 * len(intents)
+
+
+def test_close_drains_queued_and_in_flight_requests():
+    async def run():
+        dispatcher = BatchingDispatcher(SlowProvider(), max_batch=2, window_ms=1000)
+        requests = [
+            asyncio.create_task(dispatcher.generate_rules(CONTEXT, f"intent {i}"))
+            for i in range(5)
+        ]
+        # Two full batches are in flight, the fifth intent waits in its window
+        await asyncio.sleep(0.01)
+        await dispatcher.close()
+        return await asyncio.gather(*requests)
+
+    results = asyncio.run(run())
+    assert [rules["intent"] for rules, _ in results] == [f"intent {i}" for i in range(5)]
+
+
+class PartialBatchProvider(SlowProvider):
+    """Batches fail the second intent; single calls always succeed"""
+
+    def __init__(self):
+        self.single_calls = []
+
+    async def generate_rules(self, aggregated_context, user_intent):
+        self.single_calls.append(user_intent)
+        return await super().generate_rules(aggregated_context, user_intent)
+
+    async def generate_rules_batch(self, aggregated_context, intents):
+        rules_list, tokens_used = await super().generate_rules_batch(aggregated_context, intents)
+        rules_list[1] = ValueError("Invalid rule set")
+        return rules_list, tokens_used
+
+
+def test_failed_batch_slots_are_retried_individually():
+    provider = PartialBatchProvider()
+
+    async def run():
+        dispatcher = BatchingDispatcher(provider, max_batch=3, window_ms=1000)
+        results = await asyncio.gather(
+            *(dispatcher.generate_rules(CONTEXT, f"intent {i}") for i in range(3))
+        )
+        await dispatcher.close()
+        return results
+
+    results = asyncio.run(run())
+    assert [rules["intent"] for rules, _ in results] == ["intent 0", "intent 1", "intent 2"]
+    assert provider.single_calls == ["intent 1"]
@@ -0,0 +1,31 @@
+from app.services.condition_evaluator import try_evaluate_condition
+
+
+def test_numeric_arithmetic_is_evaluated_locally():
+    context = {"metrics": {"cpu": 45, "limit": 40}}
+    assert try_evaluate_condition("$metrics.cpu * 2 > $metrics.limit + 10", context) is True
+    assert try_evaluate_condition("$metrics.cpu % 2 == 1", context) is True
+
+
+def test_arithmetic_on_strings_goes_to_the_llm():
+    context = {"x": "abab", "items": [1, 2]}
+    assert try_evaluate_condition('"ab" * 300000000 == $x', context) is None
+    assert try_evaluate_condition("ab + ab == $x", context) is None
+    assert try_evaluate_condition("$items * 3 == $items", context) is None
+    assert try_evaluate_condition('"%s" % $x == ab', context) is None
+
+
+def test_booleans_are_not_numbers():
+    assert try_evaluate_condition("$flag + 1 == 2", {"flag": True}) is None
+
+
+def test_bare_names_are_resolved_from_the_context():
+    assert try_evaluate_condition("is_admin", {"is_admin": False}) is False
+    assert try_evaluate_condition("NOT maintenance_mode", {"maintenance_mode": False}) is True
+    assert try_evaluate_condition("$role in admins", {"role": "ad", "admins": ["root"]}) is False
+    assert try_evaluate_condition('status == "running"', {"status": "running"}) is True
+
+
+def test_unknown_bare_names_go_to_the_llm():
+    assert try_evaluate_condition("status == running", {"status": "running"}) is None
+    assert try_evaluate_condition("$role in admins", {"role": "ad"}) is None
@@ -0,0 +1,69 @@
+import asyncio
+
+from app.services.constrained_generation import (
+    ConstrainedGenerationService,
+    schema_errors,
+)
+
+CONTEXT = {
+    "condition_types": [{"id": "task_overdue"}],
+    "connectors": [{"id": "slack", "functions": [{"id": "send_message"}]}],
+}
+
+
+class FakeProvider:
+    """Returns canned rules and counts generate_rules calls"""
+
+    def __init__(self, rules_dict):
+        self.rules_dict = rules_dict
+        self.calls = 0
+
+    async def generate_rules(self, aggregated_context, user_intent):
+        self.calls += 1
+        return self.rules_dict, 10
+
+
+def _rules(trigger):
+    return {
+        "rules": [
+            {
+                "name": "Notify on overdue task",
+                "trigger": trigger,
+                "actions": [{"type": "send_message", "payload": {"connector": "slack"}}],
+            }
+        ],
+        "summary": "One rule",
+        "confidence": 0.9,
+    }
+
+
+def test_schema_shaped_output_is_accepted_on_first_attempt():
+    rules_dict = _rules({"source": "task_overdue"})
+    assert schema_errors(rules_dict) == []
+
+    provider = FakeProvider(rules_dict)
+    result, tokens = asyncio.run(
+        ConstrainedGenerationService(CONTEXT).generate("notify me", provider)
+    )
+
+    assert provider.calls == 1
+    assert result["_constrained"]["attempt"] == 1
+    assert tokens == 10
+
+
+def test_string_trigger_is_checked_against_the_catalog():
+    provider = FakeProvider(_rules("task_overdue"))
+    result, _ = asyncio.run(
+        ConstrainedGenerationService(CONTEXT).generate("notify me", provider)
+    )
+    assert provider.calls == 1
+    assert result["_constrained"]["attempt"] == 1
+
+    service = ConstrainedGenerationService(CONTEXT)
+    names, _ = service._validate_against_allowlist(_rules("unknown_event"))
+    assert names == {"unknown_event"}
+
+
+def test_schema_errors_reports_invalid_output():
+    errors = schema_errors({"rules": [{"name": "No trigger or actions"}]})
+    assert errors and all(error["msg"] for error in errors)
@@ -0,0 +1,26 @@
+import orjson
+from langchain_core.exceptions import OutputParserException
+
+from app.providers.openai_provider_langchain import ListRulesParser
+
+VALID = {
+    "rules": [
+        {"name": "Notify", "trigger": {"source": "task_overdue"}, "actions": [{"type": "send_message"}]}
+    ],
+    "summary": "One rule",
+}
+
+
+def test_wrapped_rule_sets_are_parsed():
+    text = orjson.dumps({"rule_sets": [VALID, VALID]}).decode()
+    assert ListRulesParser().parse(text) == [VALID, VALID]
+
+
+def test_invalid_rule_set_keeps_its_slot_not_the_batch():
+    invalid = {"rules": [{"name": "No trigger or actions"}]}
+    text = "```json\n" + orjson.dumps([VALID, invalid, "oops", VALID]).decode() + "\n```"
+    slots = ListRulesParser().parse(text)
+    assert len(slots) == 4
+    assert slots[0] == VALID and slots[3] == VALID
+    assert isinstance(slots[1], OutputParserException)
+    assert isinstance(slots[2], OutputParserException)
@@ -0,0 +1,28 @@
+import asyncio
+
+from app.services.single_flight import SingleFlight
+
+
+def test_cancelled_leader_does_not_cancel_joiners():
+    flight = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return 42
+
+    async def run():
+        leader = asyncio.create_task(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        joiner = asyncio.create_task(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await joiner, leader
+
+    result, leader = asyncio.run(run())
+    assert result == 42
+    assert leader.cancelled()
+    assert calls == 1
+    assert len(flight) == 0